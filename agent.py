@@ -6,9 +6,28 @@ import numpy as np
 import easyocr
 import re
 import os
+import copy
+from event_log import log_event
+import plate_index
+import journal
+import preprocess
+import reservations
+import assignment
+import throttle
+from qr_decoder import QRDecoder
+from records import Action, Grant
+from plate_index import LETTER_MAP, NUMBER_MAP
 
 # Define the Database Name
 DB_NAME = "parking.db"
+# Seconds a writer waits for the SQLite write lock before giving up
+DB_LOCK_TIMEOUT = 10
+# Slot sizes a vehicle of each size may use, best fit first
+SEARCH_ORDER = {'small': ('small', 'medium', 'large'), 'medium': ('medium', 'large'), 'large': ('large',)}
+
+def _full_message(size):
+    fits = '/'.join(s.capitalize() for s in SEARCH_ORDER.get(size, SEARCH_ORDER['small']))
+    return f'Parking Full (No {fits} slots available)'
 
 class ParkingAgent:
     """
@@ -21,8 +40,9 @@ class ParkingAgent:
     4. Actions: Effect changes on the Environment (Open Gate, Update DB, Alert).
     """
     
-    def __init__(self, use_gpu=False):
+    def __init__(self, use_gpu=False, load_ocr=True, db_name=DB_NAME):
         self.name = "SmartParkingAgent_V1"
+        self.db_name = db_name
         self.state = {
             "slots": [],
             "current_vehicle": None,
@@ -30,16 +50,34 @@ class ParkingAgent:
         }
         
         # Initialize Internal Models (The "Brain")
-        print(f"[{self.name}] Initializing Perception Module...")
-        self.ocr_reader = easyocr.Reader(['en'], gpu=use_gpu)
-        print(f"[{self.name}] Perception Module Loaded.")
+        # load_ocr=False skips the model (decide/act only, e.g. load testing)
+        self.ocr_reader = None
+        if load_ocr:
+            print(f"[{self.name}] Initializing Perception Module...")
+            self.ocr_reader = easyocr.Reader(['en'], gpu=use_gpu)
+            print(f"[{self.name}] Perception Module Loaded.")
+        # OCR preprocessing chain (PREPROCESS_PROFILE / PREPROCESS_PIPELINE)
+        self.preprocess = preprocess.build_pipeline()
+        # Reused across frames (one cv2 detector per thread)
+        self.qr_decoder = QRDecoder()
         
+    def for_database(self, db_name, lot_id):
+        """
+        Returns an agent for another lot's database that shares this agent's
+        (expensive) perception models.
+        """
+        agent = copy.copy(self)
+        agent.db_name = db_name
+        agent.name = f"{self.name}[{lot_id}]"
+        agent.state = {"slots": [], "current_vehicle": None, "alerts": []}
+        return agent
+
     def perceive(self, percept_type, data):
         """
         The Sensory Input mechanism.
         
         Args:
-            percept_type (str): 'image', 'nfc', 'sensor_update'
+            percept_type (str): 'image', 'qr' (QR only, no OCR), 'nfc', 'sensor_update'
             data: The raw data input.
             
         Returns:
@@ -50,6 +88,8 @@ class ParkingAgent:
         
         if percept_type == 'image':
             return self._process_visual_input(data)
+        elif percept_type == 'qr':
+            return self._process_qr_input(data)
         elif percept_type == 'nfc':
             return self._process_nfc_input(data)
         elif percept_type == 'sensor_update':
@@ -78,9 +118,12 @@ class ParkingAgent:
             
         return results
 
-    def decide(self, current_percepts):
+    def decide(self, current_percepts, cursor=None):
         """
         The Reasoning mechanism. Decides what to do based on percepts.
+
+        Args:
+            cursor: Read through an open transaction (batches) instead of a new connection.
         """
         actions = []
         if not current_percepts:
@@ -88,13 +131,13 @@ class ParkingAgent:
 
         # Rule 0: Admin Reset
         if current_percepts.get('command') == 'RESET':
-            return [{'type': 'RESET_ALL'}]
+            return [Action('RESET_ALL')]
         
         # Rule 1: Visual Entry Request
         if 'reg_num' in current_percepts:
             reg_num = current_percepts['reg_num']
             # Decision Logic: Check if authorized or new entry
-            action = self._decide_entry_logic(reg_num)
+            action = self._decide_entry_logic(reg_num, cursor, current_percepts.get('vehicle_size'))
             actions.append(action)
             
         # Rule 2: NFC Entry Request
@@ -105,24 +148,31 @@ class ParkingAgent:
             
         return actions
 
-    def act(self, action):
+    def act(self, action, cursor=None, timestamp=None):
         """
         The Actuator mechanism. Executes the chosen action.
+
+        Args:
+            cursor: Write inside the caller's open transaction. The caller then
+                commits and logs the events (see batch.py).
+            timestamp: ISO time of the event, if not now (replayed gate events).
         """
         if not action:
             return None
+        if isinstance(action, dict):
+            action = Action.from_dict(action)
             
-        action_type = action.get('type')
+        action_type = action.type
         print(f"[{self.name}] Executing Action: {action_type}")
         
         if action_type == 'GRANT_ACCESS':
-            return self._act_grant_access(action['data'])
+            return self._act_grant_access(action.data, cursor, timestamp)
         elif action_type == 'DENY_ACCESS':
-            return {'status': 'error', 'message': action['reason']}
+            return {'status': 'error', 'message': action.reason}
         elif action_type == 'RESERVE_SLOT':
-             return self._act_reserve_slot(action['data'])
+             return self._act_reserve_slot(action.data)
         elif action_type == 'RELEASE_SLOT':
-             return self._act_release_slot(action['data'])
+             return self._act_release_slot(action.data, cursor, timestamp)
         elif action_type == 'RESET_ALL':
             return self._act_reset_all()
              
@@ -135,22 +185,13 @@ class ParkingAgent:
         Uses Computer Vision (OCR & QR) to extract meaning from the image.
         """
         # 1. Try QR Code Detection First (Readability & Speed Priority)
-        try:
-            detector = cv2.QRCodeDetector()
-            data, bbox, _ = detector.detectAndDecode(image)
-            
-            if data:
-                print(f"[{self.name}] QR Code Detected: {data}")
-                # Map mechanism: Treat QR data as 'reg_num' so the Frontend (which expects reg_num) displays it.
-                return {'qr_data': data, 'reg_num': data, 'confidence': 'high', 'type': 'qr'}
-        except Exception as e:
-            print(f"QR Detection Failure: {e}")
+        qr_result = self._process_qr_input(image)
+        if 'error' not in qr_result:
+            return qr_result
 
         # 2. Fallback to OCR if no QR or QR failed
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        # Advanced Filtering
-        bfilter = cv2.bilateralFilter(gray, 11, 17, 17) 
-        thresh = cv2.adaptiveThreshold(bfilter, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+        # Grayscale -> filter -> threshold, per the configured pipeline (timed per stage)
+        thresh = self.preprocess.run(image)
         
         # OCR Reading
         result = self.ocr_reader.readtext(thresh, allowlist='ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789')
@@ -172,13 +213,30 @@ class ParkingAgent:
             
         return {'error': 'No text detected'}
 
+    def _process_qr_input(self, image):
+        """
+        QR-only perception: grayscale, downscaled, every code in view.
+        """
+        try:
+            codes = self.qr_decoder.decode(image)
+        except Exception as e:
+            print(f"QR Detection Failure: {e}")
+            return {'error': f'QR detection failed: {e}'}
+
+        if not codes:
+            return {'error': 'No QR code detected'}
+        data = codes[0]
+        print(f"[{self.name}] QR Code Detected: {data}")
+        # Map mechanism: Treat QR data as 'reg_num' so the Frontend (which expects reg_num) displays it.
+        return {'qr_data': data, 'reg_num': data, 'qr_codes': codes, 'confidence': 'high', 'type': 'qr'}
+
     def _correct_ocr_errors(self, text):
         # ... (Include the heuristic logic from the original script) ...
         if text.startswith("IND") and len(text) > 10: text = text[3:]
         
         chars = list(text)
-        letter_map = {'0': 'O', '1': 'I', '2': 'Z', '5': 'S', '8': 'B', '4': 'A', '6': 'G'}
-        number_map = {'O': '0', 'Q': '0', 'I': '1', 'Z': '2', 'S': '5', 'B': '8', 'A': '4', 'G': '6', 'T': '1'}
+        letter_map = LETTER_MAP
+        number_map = NUMBER_MAP
         
         if len(chars) == 10:
             if chars[0] in letter_map: chars[0] = letter_map[chars[0]]
@@ -191,59 +249,198 @@ class ParkingAgent:
                 if chars[i] in number_map: chars[i] = number_map[chars[i]]
         return "".join(chars)
 
-    def _decide_entry_logic(self, reg_num):
+    def _decide_entry_logic(self, reg_num, cursor=None, vehicle_size=None):
         """
         Decides whether to let a car in based on current DB state.
+
+        Args:
+            vehicle_size: reported by the lane or client; camera reads without
+                one are treated as medium.
         """
-        with sqlite3.connect(DB_NAME) as conn:
-            c = conn.cursor()
-            c.execute("SELECT slot_id, status FROM slots WHERE reg_num = ?", (reg_num,))
-            existing = c.fetchone()
-            
-            if existing:
-                if existing[1] == 'reserved':
-                    return {'type': 'GRANT_ACCESS', 'data': {'reg_num': reg_num, 'slot_id': existing[0], 'is_reservation': True}}
-                else:
-                    return {'type': 'DENY_ACCESS', 'reason': f'Vehicle {reg_num} is already parked in {existing[0]}'}
-            
-            # Find new slot logic
-            slot_id = self._find_best_slot_logic('medium') # Default to medium for camera
-            if slot_id:
-                return {'type': 'GRANT_ACCESS', 'data': {'reg_num': reg_num, 'slot_id': slot_id, 'is_reservation': False}}
+        if cursor is None:
+            with sqlite3.connect(self.db_name) as conn:
+                return self._decide_entry_logic(reg_num, conn.cursor(), vehicle_size)
+
+        # A re-read of a vehicle already inside (e.g. 0 vs O) is the same vehicle
+        match = plate_index.get_index(self.db_name).resolve_entry(cursor, reg_num)
+        if match:
+            reg_num = match
+
+        cursor.execute("SELECT slot_id, status, size_type FROM slots WHERE reg_num = ?", (reg_num,))
+        existing = cursor.fetchone()
+
+        if existing:
+            if existing[1] == 'reserved':
+                return Action('GRANT_ACCESS', Grant(reg_num, existing[0], is_reservation=True, size=existing[2]))
             else:
-                 return {'type': 'DENY_ACCESS', 'reason': 'Parking Full (No Medium/Large slots available)'}
+                return Action('DENY_ACCESS', reason=f'Vehicle {reg_num} is already parked in {existing[0]}')
 
-    def _find_best_slot_logic(self, size):
-        with sqlite3.connect(DB_NAME) as conn:
-            c = conn.cursor()
-            search_order = ['medium', 'large'] if size == 'medium' else ['small', 'medium', 'large']
-            for check_size in search_order:
-                c.execute("SELECT slot_id FROM slots WHERE size_type = ? AND status = 'free' ORDER BY slot_id ASC LIMIT 1", (check_size,))
-                result = c.fetchone()
-                if result: return result[0]
-        return None
+        # A pre-booked vehicle claims its held capacity
+        booking = reservations.get_engine(self.db_name).match(reg_num)
+        if booking:
+            slot_id = self._find_best_slot_logic(booking['size_type'], cursor, honour_holds=False, departure=booking['end'])
+            if slot_id:
+                return Action('GRANT_ACCESS', Grant(reg_num, slot_id, is_reservation=False, size=booking['size_type'],
+                                                    booking_id=booking['booking_id']))
 
-    def _act_grant_access(self, data):
-        reg_num = data['reg_num']
-        slot_id = data['slot_id']
-        
-        with sqlite3.connect(DB_NAME) as conn:
+        # Find new slot logic
+        size = vehicle_size if vehicle_size in SEARCH_ORDER else 'medium'
+        slot_id = self._find_best_slot_logic(size, cursor)
+        if slot_id:
+            return Action('GRANT_ACCESS', Grant(reg_num, slot_id, is_reservation=False, size=size))
+        else:
+             return Action('DENY_ACCESS', reason=_full_message(size))
+
+    def _find_best_slot_logic(self, size, cursor=None, honour_holds=True, departure=None):
+        """
+        Cheapest free slot a vehicle of this size fits, under the lot's
+        assignment policy (see assignment.py).
+
+        With honour_holds, a size is skipped when its free slots are all
+        needed by pre-booked vehicles due at the gate now.
+        """
+        if cursor is None:
+            with sqlite3.connect(self.db_name) as conn:
+                return self._find_best_slot_logic(size, conn.cursor(), honour_holds, departure)
+
+        engine = reservations.get_engine(self.db_name) if honour_holds else None
+        sizes = []
+        for check_size in SEARCH_ORDER.get(size, SEARCH_ORDER['small']):
+            held = engine.pending_holds(check_size) if engine else 0
+            if held:
+                cursor.execute("SELECT COUNT(*) FROM slots WHERE size_type = ? AND status = 'free'", (check_size,))
+                if cursor.fetchone()[0] <= held:
+                    continue
+            sizes.append(check_size)
+        if not sizes:
+            return None
+        return assignment.get_assigner(self.db_name).choose(cursor, size, sizes, departure)
+
+    def _act_grant_access(self, grant, cursor=None, timestamp=None):
+        """
+        Allocates the slot atomically.
+
+        The decision was made on a snapshot, so under a write lock
+        (BEGIN IMMEDIATE) we re-check the vehicle and compare-and-set the
+        slot from 'free'. If another gate took it first we fall back to the
+        next free slot inside the same transaction.
+        """
+        now = timestamp or datetime.datetime.now().isoformat()
+        if cursor is not None:
+            return self._grant_slot(cursor, grant, now)
+
+        conn = sqlite3.connect(self.db_name, timeout=DB_LOCK_TIMEOUT, isolation_level=None)
+        try:
             c = conn.cursor()
+            throttle.write_lock_waits.begin(c)
+            result = self._grant_slot(c, grant, now)
+            c.execute("COMMIT" if result['status'] == 'success' else "ROLLBACK")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        if result['status'] == 'success':
+            if grant.booking_id is not None:
+                reservations.get_engine(self.db_name).claimed()
+            self._log_action(grant.reg_num, result['assigned_slot'], "ENTRY", now)
+        return result
+
+    def _grant_slot(self, c, grant, now):
+        """
+        Body of _act_grant_access on a cursor that holds the write lock.
+        On error the caller rolls back.
+        """
+        reg_num = grant.reg_num
+        slot_id = grant.slot_id
+
+        c.execute("SELECT slot_id, status FROM slots WHERE reg_num = ?", (reg_num,))
+        existing = c.fetchone()
+
+        if grant.is_reservation:
+            # Check-in of an existing reservation: it must still be ours
+            c.execute("UPDATE slots SET entry_time = ?, is_verified = 0 WHERE slot_id = ? AND reg_num = ? AND status = 'reserved'",
+                      (now, slot_id, reg_num))
+            if c.rowcount == 0:
+                return {'status': 'error', 'message': f'Reservation for {reg_num} is no longer valid'}
+        else:
+            if existing and existing[1] != 'free':
+                # A concurrent request for the same vehicle won the race
+                return {'status': 'error', 'message': f'Vehicle {reg_num} is already parked in {existing[0]}'}
+
             # INTEGRITY FIX: Clear any previous slot for this vehicle to prevent duplicates
             c.execute("UPDATE slots SET status = 'free', reg_num = NULL, entry_time = NULL, is_verified = 0 WHERE reg_num = ?", (reg_num,))
-            
-            c.execute("UPDATE slots SET status = 'reserved', reg_num = ?, entry_time = ?, is_verified = 0 WHERE slot_id = ?", 
-                      (reg_num, datetime.datetime.now().isoformat(), slot_id))
+
+            # Compare-and-set: only succeeds if the slot is still free
+            c.execute("UPDATE slots SET status = 'reserved', reg_num = ?, entry_time = ?, is_verified = 0 WHERE slot_id = ? AND status = 'free'",
+                      (reg_num, now, slot_id))
+            if c.rowcount == 0:
+                slot_id = self._find_best_slot_logic(grant.size, c, honour_holds=grant.booking_id is None)
+                if not slot_id:
+                    return {'status': 'error', 'message': _full_message(grant.size)}
+                c.execute("UPDATE slots SET status = 'reserved', reg_num = ?, entry_time = ?, is_verified = 0 WHERE slot_id = ? AND status = 'free'",
+                          (reg_num, now, slot_id))
+
+            if grant.booking_id is not None:
+                if not reservations.get_engine(self.db_name).check_in(c, grant.booking_id, slot_id):
+                    # Lost to an expiry or cancel since decide(): enter as a walk-in,
+                    # which may not take capacity held for other bookings
+                    grant.booking_id = None
+                    c.execute("UPDATE slots SET status = 'free', reg_num = NULL, entry_time = NULL, is_verified = 0 WHERE slot_id = ?",
+                              (slot_id,))
+                    slot_id = self._find_best_slot_logic(grant.size, c)
+                    if not slot_id:
+                        return {'status': 'error', 'message': _full_message(grant.size)}
+                    c.execute("UPDATE slots SET status = 'reserved', reg_num = ?, entry_time = ?, is_verified = 0 WHERE slot_id = ? AND status = 'free'",
+                              (reg_num, now, slot_id))
+
+        result = {'status': 'success', 'assigned_slot': slot_id}
+        if grant.booking_id is not None:
+            result['booking_id'] = grant.booking_id
+        return result
+
+    def _act_release_slot(self, reg_num, cursor=None, timestamp=None):
+        """
+        Frees the slot held by reg_num (vehicle exit).
+        """
+        now = timestamp or datetime.datetime.now().isoformat()
+        if cursor is not None:
+            return self._release_slot(cursor, reg_num, now)
+
+        with sqlite3.connect(self.db_name, timeout=DB_LOCK_TIMEOUT) as conn:
+            result = self._release_slot(conn.cursor(), reg_num, now)
             conn.commit()
-            
-        self._log_action(reg_num, slot_id, "ENTRY")
-        return {'status': 'success', 'assigned_slot': slot_id}
+
+        if result['status'] == 'success':
+            self._log_action(reg_num, result['freed_slot'], "EXIT", now)
+        return result
+
+    def _release_slot(self, c, reg_num, now):
+        c.execute("SELECT slot_id, entry_time FROM slots WHERE reg_num = ?", (reg_num,))
+        row = c.fetchone()
+        if not row:
+            return {'status': 'not_found', 'message': 'Vehicle not found'}
+        slot_id, entry_time = row
+
+        duration_sec = 0
+        if entry_time:
+            try:
+                entry_dt = datetime.datetime.fromisoformat(entry_time)
+                duration_sec = (datetime.datetime.fromisoformat(now) - entry_dt).total_seconds()
+            except:
+                pass
+
+        c.execute("UPDATE slots SET status = 'free', reg_num = NULL, entry_time = NULL, is_verified = 0 WHERE slot_id = ?", (slot_id,))
+        return {'status': 'success', 'freed_slot': slot_id, 'duration_seconds': int(duration_sec)}
     
     def _act_reset_all(self):
         try:
-            with sqlite3.connect(DB_NAME) as conn:
+            with sqlite3.connect(self.db_name) as conn:
                 c = conn.cursor()
                 c.execute("UPDATE slots SET status = 'free', reg_num = NULL, entry_time = NULL, is_verified = 0")
+                journal.mark(c, 'reset')
                 conn.commit()
             self._log_action("ADMIN", "ALL", "RESET")
             print(f"[{self.name}] All slots reset successfully.")
@@ -251,11 +448,7 @@ class ParkingAgent:
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
 
-    def _log_action(self, reg_num, slot_id, action):
-        with sqlite3.connect(DB_NAME) as conn:
-            c = conn.cursor()
-            timestamp = datetime.datetime.now().isoformat()
-            c.execute("INSERT INTO logs (reg_num, slot_id, action, timestamp) VALUES (?, ?, ?, ?)", 
-                      (reg_num, slot_id, action, timestamp))
-            conn.commit()
+    def _log_action(self, reg_num, slot_id, action, timestamp=None):
+        # Queued to the batched writer - off the request's critical path
+        log_event(reg_num, slot_id, action, timestamp, db_name=self.db_name)
 
@@ -0,0 +1,190 @@
+import sqlite3
+import datetime
+import threading
+import time
+import numpy as np
+
+# How logged actions move occupancy is defined once, with the rollups
+from log_retention import ENTRY_ACTIONS, EXIT_ACTIONS
+
+DB_NAME = "parking.db"
+
+# History series are recomputed at most this often
+HISTORY_CACHE_TTL = 60
+# Dwell-time histogram edges in minutes (last bin is open-ended)
+DWELL_BINS_MIN = [0, 15, 30, 60, 120, 240, 480]
+
+
+def init_counter_tables(conn):
+    """
+    Running occupancy counters per (size_type, status), kept current by
+    triggers on `slots` so every UPDATE - wherever it happens - is counted
+    without rescanning the table.
+    """
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS slot_counters (
+                    size_type TEXT,
+                    status TEXT,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (size_type, status)
+                )''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_slot_counters_insert AFTER INSERT ON slots
+                 BEGIN
+                    INSERT INTO slot_counters (size_type, status, count) VALUES (NEW.size_type, NEW.status, 1)
+                        ON CONFLICT (size_type, status) DO UPDATE SET count = count + 1;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_slot_counters_delete AFTER DELETE ON slots
+                 BEGIN
+                    UPDATE slot_counters SET count = count - 1 WHERE size_type = OLD.size_type AND status = OLD.status;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_slot_counters_update AFTER UPDATE OF status, size_type ON slots
+                 WHEN OLD.status IS NOT NEW.status OR OLD.size_type IS NOT NEW.size_type
+                 BEGIN
+                    UPDATE slot_counters SET count = count - 1 WHERE size_type = OLD.size_type AND status = OLD.status;
+                    INSERT INTO slot_counters (size_type, status, count) VALUES (NEW.size_type, NEW.status, 1)
+                        ON CONFLICT (size_type, status) DO UPDATE SET count = count + 1;
+                 END''')
+
+    # Resync once at startup in case slots were edited with triggers absent
+    c.execute("DELETE FROM slot_counters")
+    c.execute('''INSERT INTO slot_counters (size_type, status, count)
+                 SELECT size_type, status, COUNT(*) FROM slots GROUP BY size_type, status''')
+
+
+def get_occupancy(db_name=DB_NAME):
+    """
+    Current counts per size class and status, read from the counter table.
+    """
+    with sqlite3.connect(db_name) as conn:
+        c = conn.cursor()
+        c.execute("SELECT size_type, status, count FROM slot_counters WHERE count > 0")
+        rows = c.fetchall()
+
+    by_size = {}
+    totals = {}
+    for size_type, status, count in rows:
+        by_size.setdefault(size_type, {"total": 0})
+        by_size[size_type][status] = count
+        by_size[size_type]["total"] += count
+        totals[status] = totals.get(status, 0) + count
+
+    total = sum(totals.values())
+    occupied = totals.get("occupied", 0)
+    return {
+        "total": total,
+        "by_status": totals,
+        "by_size": by_size,
+        "utilization": round((occupied / total) * 100, 1) if total > 0 else 0,
+    }
+
+
+def _parse_ts(values):
+    """ISO timestamp strings -> float64 epoch seconds (NaN when unparseable)."""
+    out = np.full(len(values), np.nan)
+    for i, v in enumerate(values):
+        try:
+            out[i] = datetime.datetime.fromisoformat(v).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+def compute_history(db_name=DB_NAME, days=7, now=None):
+    """
+    Time-bucketed series over the raw log history:
+    peak hours, dwell-time distribution and daily turnover.
+    """
+    now = now or datetime.datetime.now()
+    since = (now - datetime.timedelta(days=days)).isoformat()
+    with sqlite3.connect(db_name) as conn:
+        c = conn.cursor()
+        c.execute("SELECT reg_num, action, timestamp FROM logs WHERE timestamp >= ? ORDER BY id", (since,))
+        rows = c.fetchall()
+        c.execute("SELECT COUNT(*) FROM slots")
+        slot_count = c.fetchone()[0]
+
+    reg = np.array([r[0] or "" for r in rows], dtype=object)
+    action = np.array([r[1] or "" for r in rows], dtype=object)
+    ts = _parse_ts([r[2] for r in rows])
+
+    is_entry = np.isin(action, ENTRY_ACTIONS) & ~np.isnan(ts)
+    is_exit = np.isin(action, EXIT_ACTIONS) & ~np.isnan(ts)
+
+    # Timestamps are local ISO strings, so hour and day can be sliced straight out
+    entry_idx = np.flatnonzero(is_entry)
+    hours = np.array([int(rows[i][2][11:13]) for i in entry_idx], dtype=np.int64)
+    entry_days = np.array([rows[i][2][:10] for i in entry_idx], dtype="U10")
+
+    # Peak hours: entries per hour of day
+    hourly_entries = np.bincount(hours, minlength=24)
+
+    # Dwell: pair each exit with the most recent unmatched entry of the same plate
+    # (a MISUSE_ACCEPT move is neither, so the stay runs on from the entry)
+    open_entries = {}
+    dwell = []
+    for i in np.flatnonzero(is_entry | is_exit):
+        if is_entry[i]:
+            open_entries[reg[i]] = ts[i]
+        elif reg[i] in open_entries:
+            dwell.append(ts[i] - open_entries.pop(reg[i]))
+    dwell_min = np.asarray(dwell, dtype=np.float64) / 60.0
+    dwell_min = dwell_min[dwell_min >= 0]
+    edges = np.array(DWELL_BINS_MIN + [np.inf])
+    dwell_hist, _ = np.histogram(dwell_min, bins=edges)
+
+    # Turnover: entries per slot per day
+    days_seen, per_day = np.unique(entry_days, return_counts=True)
+    daily = [
+        {"day": str(d),
+         "entries": int(n),
+         "turnover": round(n / slot_count, 2) if slot_count else 0}
+        for d, n in zip(days_seen, per_day)
+    ]
+
+    return {
+        "window_days": days,
+        "events": len(rows),
+        "peak_hours": {
+            "entries_by_hour": hourly_entries.tolist(),
+            "peak_hour": int(hourly_entries.argmax()) if hourly_entries.any() else None,
+        },
+        "dwell_minutes": {
+            "bins": [f"{lo}-{hi}" for lo, hi in zip(DWELL_BINS_MIN, DWELL_BINS_MIN[1:])] + [f"{DWELL_BINS_MIN[-1]}+"],
+            "counts": dwell_hist.tolist(),
+            "samples": int(dwell_min.size),
+            "mean": round(float(dwell_min.mean()), 1) if dwell_min.size else None,
+            "median": round(float(np.median(dwell_min)), 1) if dwell_min.size else None,
+            "p90": round(float(np.percentile(dwell_min, 90)), 1) if dwell_min.size else None,
+        },
+        "turnover": {
+            "daily": daily,
+            "average": round(float(per_day.mean()) / slot_count, 2) if per_day.size and slot_count else 0,
+        },
+    }
+
+
+class HistoryCache:
+    """Caches compute_history() results per (database, window) for HISTORY_CACHE_TTL seconds."""
+
+    def __init__(self, db_name=DB_NAME, ttl=HISTORY_CACHE_TTL):
+        self.db_name = db_name
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, days=7, db_name=None):
+        db_name = db_name or self.db_name
+        key = (db_name, days)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and now - cached[0] < self.ttl:
+                return cached[1]
+        result = compute_history(db_name, days)
+        result["computed_at"] = datetime.datetime.now().isoformat()
+        with self._lock:
+            self._entries[key] = (now, result)
+        return result
+
+
+history_cache = HistoryCache()
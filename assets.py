@@ -0,0 +1,96 @@
+"""
+Fingerprinted, precompressed static assets.
+
+asset_url('css/status.css') returns /static/css/status.css?v=<content hash>.
+A request carrying the current hash is cacheable for a year (the URL changes
+whenever the file does); anything else revalidates via ETag. Each file is
+read, hashed and compressed (gzip, plus brotli if installed) once, and again
+only when its mtime changes.
+"""
+import os
+import hashlib
+import mimetypes
+import threading
+
+from flask import Response, abort, request
+
+import compression
+
+STATIC_URL = "/static"
+# Fingerprinted URLs never change content, so clients may keep them this long
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Below this, compression framing costs more than it saves
+MIN_COMPRESS_BYTES = 512
+
+
+class Asset:
+    __slots__ = ("mtime", "digest", "body", "encoded", "mimetype")
+
+    def __init__(self, mtime, body, mimetype):
+        self.mtime = mtime
+        self.digest = hashlib.md5(body).hexdigest()[:12]
+        self.body = body
+        # encoding -> compressed body, only where it is actually smaller
+        self.encoded = {}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            for encoding in compression.ENCODINGS:
+                data = compression.compress(body, encoding)
+                if len(data) < len(body):
+                    self.encoded[encoding] = data
+        self.mimetype = mimetype
+
+
+class AssetManifest:
+    def __init__(self, folder):
+        self.folder = os.path.abspath(folder)
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """The Asset for a path under the static folder, or None."""
+        full = os.path.abspath(os.path.join(self.folder, path))
+        if not full.startswith(self.folder + os.sep):
+            return None
+        try:
+            mtime = os.stat(full).st_mtime
+        except OSError:
+            return None
+        asset = self._assets.get(path)
+        if asset is None or asset.mtime != mtime:
+            with open(full, "rb") as f:
+                body = f.read()
+            mimetype = mimetypes.guess_type(full)[0] or "application/octet-stream"
+            if mimetype.startswith("text/") or mimetype == "application/javascript":
+                mimetype += "; charset=utf-8"
+            asset = Asset(mtime, body, mimetype)
+            with self._lock:
+                self._assets[path] = asset
+        return asset
+
+    def url(self, path):
+        asset = self.get(path)
+        return f"{STATIC_URL}/{path}?v={asset.digest}" if asset else f"{STATIC_URL}/{path}"
+
+    def response(self, path):
+        asset = self.get(path)
+        if asset is None:
+            abort(404)
+
+        body = asset.body
+        headers = {"Vary": "Accept-Encoding"}
+        encoding = compression.choose_encoding(request.headers.get("Accept-Encoding"), tuple(asset.encoded))
+        if encoding:
+            body = asset.encoded[encoding]
+            headers["Content-Encoding"] = encoding
+        if request.args.get("v") == asset.digest:
+            headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            headers["Cache-Control"] = "no-cache"
+
+        response = Response(body, mimetype=asset.mimetype, headers=headers)
+        response.set_etag(asset.digest + (f"-{encoding}" if encoding else ""))
+        return response.make_conditional(request)
+
+    def stats(self):
+        return {path: {"digest": a.digest, "bytes": len(a.body), **{f"{e}_bytes": len(d) for e, d in a.encoded.items()}}
+                for path, a in self._assets.items()}
@@ -0,0 +1,484 @@
+"""
+Cost-based slot assignment.
+
+Every free slot of an allowed size is scored by a policy and the cheapest is
+taken. Scores are computed over the lot_state arrays plus per-slot features,
+in one NumPy pass per decision:
+
+- entrance / exit: distance to the gate and to the pedestrian exit (0..1)
+- waste: how many size classes larger than the vehicle the slot is
+- load: occupied share of the slot's zone, to spread cars across aisles
+- departure: gap between the vehicle's expected departure and that of the
+  cars already in the zone, so cohorts leaving together share an aisle
+
+Features come from the `slot_features` table; slots without a row get a
+default derived from their number (a single row of zones of ZONE_SLOTS,
+Slot1 nearest the gate). Policies are plain functions and can be added with
+register_policy(); ASSIGNMENT_POLICY picks the active one.
+
+The arrays trail the database by up to the lot_state freshness interval, so
+a ranked slot is confirmed free through the caller's cursor before use.
+
+Run:
+    python assignment.py [--slots 1000] [--hours 12] [--seed 1]
+"""
+import os
+import re
+import sys
+import time
+import heapq
+import sqlite3
+import datetime
+import threading
+import numpy as np
+
+import lot_state
+
+DB_NAME = "parking.db"
+
+ASSIGNMENT_POLICY = os.environ.get("ASSIGNMENT_POLICY", "balanced")
+# Default geometry for slots without a slot_features row
+ZONE_SLOTS = 10
+SLOT_PITCH_M = 3.0
+# Assumed stay when analytics has no history yet, and how often to re-read it
+DEFAULT_DWELL_MINUTES = float(os.environ.get("ASSIGNMENT_DWELL_MINUTES", "120"))
+DWELL_REFRESH_SECONDS = 600
+# A departure gap this large (or more) costs as much as the far end of the lot
+DEPARTURE_SCALE_SECONDS = 4 * 3600
+# Ranked slots confirmed per query, and re-reads of slot_features at most this often
+CONFIRM_CHUNK = 16
+# Departures within one bucket rank alike, so their rankings are shared
+DEPARTURE_BUCKET_SECONDS = 300
+# Ranked positions kept per cached ranking (a partial sort beyond this)
+RANK_CACHE_DEPTH = 256
+FEATURE_RELOAD_SECONDS = 60
+
+_FREE = lot_state.STATUS_CODES["free"]
+
+
+def init_feature_table(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS slot_features (
+                        slot_id TEXT PRIMARY KEY,
+                        zone TEXT,
+                        entrance_distance REAL,
+                        exit_distance REAL
+                    )''')
+
+
+def _slot_number(slot_id):
+    digits = re.sub(r"\D", "", slot_id or "")
+    return int(digits) if digits else 0
+
+
+class Features:
+    """Per-slot features aligned with a LotState's arrays."""
+
+    __slots__ = ("slot_ids", "ordinal", "entrance", "exit", "zone", "n_zones", "zone_names",
+                 "zone_load", "zone_departure")
+
+    def __init__(self, slot_ids, rows):
+        """rows: slot_id -> (zone, entrance_distance, exit_distance) from slot_features."""
+        n = len(slot_ids)
+        numbers = np.fromiter((_slot_number(s) for s in slot_ids), np.int64, n)
+        ordinal = np.empty(n, np.int64)
+        ordinal[np.lexsort((slot_ids.astype(str), numbers))] = np.arange(n)
+
+        zones, entrance, exit_ = [], np.empty(n), np.empty(n)
+        for i, slot_id in enumerate(slot_ids):
+            zone, d_in, d_out = rows.get(slot_id, (None, None, None))
+            default_distance = (ordinal[i] + 1) * SLOT_PITCH_M
+            zones.append(zone or f"Z{ordinal[i] // ZONE_SLOTS + 1}")
+            entrance[i] = default_distance if d_in is None else d_in
+            exit_[i] = default_distance if d_out is None else d_out
+        self.zone_names, self.zone = np.unique(np.array(zones, dtype=str), return_inverse=True) if n else (np.empty(0, str), np.empty(0, np.intp))
+        self.n_zones = len(self.zone_names)
+
+        self.slot_ids = slot_ids
+        self.ordinal = ordinal
+        self.entrance = entrance / entrance.max() if n and entrance.max() > 0 else entrance
+        self.exit = exit_ / exit_.max() if n and exit_.max() > 0 else exit_
+        self.zone_load = np.zeros(self.n_zones)
+        self.zone_departure = np.full(self.n_zones, np.nan)
+
+    def update_load(self, status, entry_ts, dwell_seconds):
+        """Zone occupancy share and mean predicted departure of its parked cars."""
+        taken = status != _FREE
+        capacity = np.bincount(self.zone, minlength=self.n_zones)
+        parked = np.bincount(self.zone[taken], minlength=self.n_zones)
+        self.zone_load = parked / np.maximum(capacity, 1)
+        # Slots without an entry time count towards load but not departure
+        timed = taken & (entry_ts != lot_state.NO_ENTRY)
+        departures = np.bincount(self.zone[timed], weights=entry_ts[timed].astype(np.float64), minlength=self.n_zones)
+        timed_count = np.bincount(self.zone[timed], minlength=self.n_zones)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.zone_departure = departures / timed_count + dwell_seconds
+
+
+class Request:
+    """What the policy knows about the arriving vehicle."""
+
+    __slots__ = ("size", "departure")
+
+    def __init__(self, size, departure):
+        self.size = size            # lot_state size code of the vehicle
+        self.departure = departure  # expected departure, epoch seconds
+
+
+# --- Policies: (features, candidate positions, request) -> cost per candidate ---
+
+def weighted(entrance=0.0, exit=0.0, waste=0.0, load=0.0, departure=0.0):
+    """Policy summing the normalized cost terms with the given weights."""
+    max_waste = max(len(lot_state.SIZES) - 1, 1)
+
+    def score(f, idx, req, size):
+        cost = np.zeros(len(idx))
+        if entrance:
+            cost += entrance * f.entrance[idx]
+        if exit:
+            cost += exit * f.exit[idx]
+        if waste:
+            cost += waste * (size[idx] - req.size) / max_waste
+        zone = f.zone[idx]
+        if load:
+            cost += load * f.zone_load[zone]
+        if departure:
+            gap = np.abs(f.zone_departure[zone] - req.departure) / DEPARTURE_SCALE_SECONDS
+            # An empty zone has no cohort to match: neither pulls nor pushes
+            cost += departure * np.where(np.isnan(gap), 0.5, np.minimum(gap, 1.0))
+        return cost
+    score.weights = {"entrance": entrance, "exit": exit, "waste": waste, "load": load, "departure": departure}
+    return score
+
+
+def first_free(f, idx, req, size):
+    """The original rule: best-fitting size first, then the lowest-numbered slot."""
+    return (size[idx] - req.size) * len(f.ordinal) + f.ordinal[idx]
+
+
+POLICIES = {
+    "first_free": first_free,
+    "nearest": weighted(entrance=1.0, waste=4.0),
+    "balanced": weighted(entrance=1.0, exit=0.5, waste=4.0, load=1.0, departure=0.5),
+}
+
+
+def register_policy(name, scorer):
+    POLICIES[name] = scorer
+
+
+class Assigner:
+    """Ranks free slots of one lot under a policy."""
+
+    def __init__(self, db_name=DB_NAME, policy=ASSIGNMENT_POLICY, state=None, dwell_seconds=None, feature_rows=None):
+        """
+        Args:
+            state / dwell_seconds / feature_rows: fixed inputs instead of the
+                lot's mirror, analytics and slot_features (simulation).
+        """
+        if policy not in POLICIES:
+            print(f"[Assignment] Unknown policy {policy!r}, using 'first_free'")
+            policy = "first_free"
+        self.db_name = db_name
+        self.policy = policy
+        self.state = state
+        self.feature_rows = feature_rows
+        self._lock = threading.Lock()
+        self._features = None
+        self._features_at = 0.0
+        self._loads_seen = None
+        # Positions handed out since the arrays last reloaded (they still read 'free')
+        self._claimed = set()
+        # (sizes, vehicle size, departure bucket) -> ranking, until the arrays reload
+        self._rankings = {}
+        self._fixed_dwell = dwell_seconds is not None
+        self.dwell_seconds = dwell_seconds if self._fixed_dwell else DEFAULT_DWELL_MINUTES * 60
+        self._dwell_checked = 0.0
+        self.decisions = 0
+        self.fallbacks = 0
+        self.decision_us = 0.0
+
+    def _state(self):
+        """One consistent lot_state snapshot for this decision."""
+        if self.state is not None:
+            return self.state.snapshot()
+        state = lot_state.get_state(self.db_name)
+        state.refresh()
+        return state.snapshot()
+
+    def _feature_rows(self):
+        if self.feature_rows is not None:
+            return self.feature_rows
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                rows = conn.execute("SELECT slot_id, zone, entrance_distance, exit_distance FROM slot_features").fetchall()
+        except sqlite3.OperationalError:
+            return {}
+        return {r[0]: r[1:] for r in rows}
+
+    def _refresh_dwell(self):
+        # Mean stay from the analytics history, computed off the gate path
+        mono = time.monotonic()
+        if self._fixed_dwell or mono - self._dwell_checked < DWELL_REFRESH_SECONDS:
+            return
+        self._dwell_checked = mono
+
+        def load():
+            try:
+                import analytics
+                mean = analytics.history_cache.get(7, self.db_name)["dwell_minutes"]["mean"]
+                if mean:
+                    self.dwell_seconds = mean * 60
+            except Exception as e:
+                print(f"[Assignment] Dwell estimate unavailable: {e}")
+        threading.Thread(target=load, daemon=True).start()
+
+    def _prepare(self, state):
+        """Features aligned with the current arrays (caller holds the lock)."""
+        slot_ids, status, entry_ts = state.slot_ids, state.status, state.entry_ts
+        features = self._features
+        mono = time.monotonic()
+        if (features is None or len(features.slot_ids) != len(slot_ids)
+                or mono - self._features_at >= FEATURE_RELOAD_SECONDS
+                or (state.loads != self._loads_seen and not np.array_equal(features.slot_ids, slot_ids))):
+            features = Features(slot_ids, self._feature_rows())
+            self._features, self._features_at = features, mono
+            self._loads_seen = None
+        if state.loads != self._loads_seen:
+            features.update_load(status, entry_ts, self.dwell_seconds)
+            self._loads_seen = state.loads
+            self._claimed.clear()
+            self._rankings.clear()
+        return features
+
+    def _score(self, state, features, codes, req, depth=RANK_CACHE_DEPTH):
+        """
+        Returns:
+            ([(slot_id, position)] cheapest first, whether that is every candidate),
+            or None if the arrays changed length under us.
+        """
+        slot_ids, size, status = state.slot_ids, state.size, state.status
+        if not len(slot_ids) == len(size) == len(status) == len(features.zone):
+            return None
+        idx = np.flatnonzero((status == _FREE) & np.isin(size, codes))
+        cost = POLICIES[self.policy](features, idx, req, size)
+        if depth is not None and depth < len(idx):
+            top = np.argpartition(cost, depth)[:depth]
+            order = top[np.argsort(cost[top], kind="stable")]
+        else:
+            order = np.argsort(cost, kind="stable")
+        ranked = idx[order]
+        return list(zip(slot_ids[ranked].tolist(), ranked.tolist())), len(ranked) == len(idx)
+
+    def rank(self, vehicle_size, sizes, departure=None, limit=None):
+        """
+        Free slots of the given size classes, cheapest first.
+
+        Args:
+            vehicle_size: size class of the vehicle (sets the waste term).
+            sizes: slot size classes it may use.
+            departure: expected departure (datetime), default now + typical stay.
+            limit: return at most this many.
+        """
+        t0 = time.perf_counter()
+        self._refresh_dwell()
+        state = self._state()
+        if departure is None:
+            departure = time.time() + self.dwell_seconds
+        elif isinstance(departure, datetime.datetime):
+            departure = departure.timestamp()
+        codes = tuple(lot_state.SIZE_CODES[s] for s in sizes if s in lot_state.SIZE_CODES)
+        req = Request(lot_state.SIZE_CODES.get(vehicle_size, min(codes, default=0)),
+                      departure // DEPARTURE_BUCKET_SECONDS * DEPARTURE_BUCKET_SECONDS)
+        key = (codes, req.size, req.departure)
+
+        with self._lock:
+            features = self._prepare(state)
+            loads = self._loads_seen
+            cached = self._rankings.get(key)
+            claimed = set(self._claimed)
+        if cached is None:
+            # Scored outside the lock; only the shared caches are guarded
+            cached = self._score(state, features, codes, req)
+            if cached is None:
+                return []  # arrays mid-reload
+            with self._lock:
+                if self._loads_seen == loads:
+                    self._rankings[key] = cached
+        ranking, complete = cached
+        if limit is None and not complete:
+            ranking, complete = self._score(state, features, codes, req, depth=None) or ([], True)
+
+        wanted = len(ranking) if limit is None else limit
+        ranked = []
+        for entry in ranking:
+            if entry[1] not in claimed:
+                ranked.append(entry)
+                if len(ranked) == wanted:
+                    break
+        if len(ranked) < wanted and not complete:
+            # Claims used up the cached depth: rank everything once, uncached
+            ranking, _ = self._score(state, features, codes, req, depth=None) or ([], True)
+            ranked = [entry for entry in ranking if entry[1] not in claimed][:wanted]
+        self.decisions += 1
+        self.decision_us += (time.perf_counter() - t0) * 1e6
+        return ranked
+
+    def choose(self, cursor, vehicle_size, sizes, departure=None):
+        """
+        The best slot that the database (through `cursor`) still shows free, or None.
+
+        The top slot is confirmed alone, then CONFIRM_CHUNK per query: first
+        over a partial ranking (no full sort), then over the rest. If the
+        arrays are stale enough to exhaust it, fall back to the first free slot.
+        """
+        first = self.rank(vehicle_size, sizes, departure, limit=CONFIRM_CHUNK * 4)
+        ranked = first
+        while ranked:
+            # The best slot alone first: it is usually still free
+            bounds = [0, *range(1, len(ranked), CONFIRM_CHUNK), len(ranked)]
+            for i, j in zip(bounds, bounds[1:]):
+                chunk = ranked[i:j]
+                cursor.execute(f"SELECT slot_id FROM slots WHERE status = 'free' AND slot_id IN ({','.join('?' * len(chunk))})",
+                               [slot_id for slot_id, _ in chunk])
+                free = {row[0] for row in cursor.fetchall()}
+                for slot_id, position in chunk:
+                    if slot_id in free:
+                        with self._lock:
+                            self._claimed.add(position)
+                        return slot_id
+            if ranked is not first or len(first) < CONFIRM_CHUNK * 4:
+                break
+            ranked = self.rank(vehicle_size, sizes, departure)[len(first):]
+        if first:
+            self.fallbacks += 1
+        for check_size in sizes:
+            cursor.execute("SELECT slot_id FROM slots WHERE size_type = ? AND status = 'free' ORDER BY slot_id ASC LIMIT 1", (check_size,))
+            result = cursor.fetchone()
+            if result:
+                return result[0]
+        return None
+
+    def stats(self):
+        scorer = POLICIES.get(self.policy)
+        return {
+            "policy": self.policy,
+            "policies": sorted(POLICIES),
+            "weights": getattr(scorer, "weights", None),
+            "decisions": self.decisions,
+            "mean_decision_us": round(self.decision_us / self.decisions, 1) if self.decisions else None,
+            "fallbacks": self.fallbacks,
+            "dwell_minutes": round(self.dwell_seconds / 60, 1),
+            "zones": int(self._features.n_zones) if self._features is not None else None,
+        }
+
+
+# One assigner per lot database
+_assigners = {}
+_assigners_lock = threading.Lock()
+
+
+def get_assigner(db_name=DB_NAME):
+    assigner = _assigners.get(db_name)
+    if assigner is None:
+        with _assigners_lock:
+            assigner = _assigners.get(db_name)
+            if assigner is None:
+                assigner = Assigner(db_name)
+                _assigners[db_name] = assigner
+    return assigner
+
+
+# --- Policy simulator ---
+
+SIM_SIZE_MIX = {"small": 0.3, "medium": 0.5, "large": 0.2}
+SIM_LAYOUT = {"small": 0.3, "medium": 0.45, "large": 0.25}
+SIM_MEAN_DWELL_MINUTES = 150
+# Walking/driving speeds turning distances into driver time
+SIM_DRIVE_MPS = 3.0
+SIM_WALK_MPS = 1.3
+
+
+def simulate(policy, n_slots=1000, hours=12, seed=1):
+    """
+    Replays a day of arrivals (a morning peak over a steady base) with
+    lognormal stays against an in-memory lot whose gate is at Slot1 and
+    pedestrian exit at the far end. Returns a metric dict.
+    """
+    rng = np.random.default_rng(seed)
+    sizes = list(SIM_LAYOUT)
+    counts = [int(n_slots * SIM_LAYOUT[s]) for s in sizes]
+    counts[-1] = n_slots - sum(counts[:-1])
+    slot_sizes = [s for s, n in zip(sizes, counts) for _ in range(n)]
+    rows = [[f"Slot{i + 1}", s, "free", None] for i, s in enumerate(slot_sizes)]
+    geometry = {row[0]: (None, (i + 1) * SLOT_PITCH_M, (n_slots - i) * SLOT_PITCH_M) for i, row in enumerate(rows)}
+
+    state = lot_state.LotState(":memory:")
+    state.load_rows([tuple(r) for r in rows])
+    assigner = Assigner(":memory:", policy, state=state, dwell_seconds=SIM_MEAN_DWELL_MINUTES * 60,
+                        feature_rows=geometry)
+
+    # Arrivals: thinned Poisson process peaking at 3x the base rate around 09:00
+    base_rate = n_slots / (SIM_MEAN_DWELL_MINUTES * 60) * 0.6
+    start = datetime.datetime(2026, 1, 5, 7, 0).timestamp()
+    events, t = [], start
+    while t < start + hours * 3600:
+        t += rng.exponential(1 / (base_rate * 3))
+        hour = (t - start) / 3600
+        if rng.random() < (1 + 2 * np.exp(-((hour - 2) ** 2) / 2)) / 3:
+            events.append((t, "arrive", None))
+    heapq.heapify(events)
+
+    sigma = 0.6
+    mu = np.log(SIM_MEAN_DWELL_MINUTES * 60) - sigma ** 2 / 2
+    served = denied = upgrades = 0
+    decision_us, drive_m, walk_m, zone_std = [], [], [], []
+    while events:
+        t, kind, i = heapq.heappop(events)
+        if kind == "depart":
+            rows[i][2], rows[i][3] = "free", None
+            continue
+        vehicle = sizes[rng.choice(len(sizes), p=[SIM_SIZE_MIX[s] for s in sizes])]
+        state.load_rows([tuple(r) for r in rows])
+
+        t0 = time.perf_counter()
+        ranked = assigner.rank(vehicle, sizes[sizes.index(vehicle):], limit=1)
+        decision_us.append((time.perf_counter() - t0) * 1e6)
+        if not ranked:
+            denied += 1
+            continue
+        i = ranked[0][1]
+        served += 1
+        upgrades += slot_sizes[i] != vehicle
+        drive_m.append(geometry[rows[i][0]][1])
+        walk_m.append(geometry[rows[i][0]][2])
+        zone_std.append(float(assigner._features.zone_load.std()))
+        rows[i][2], rows[i][3] = "occupied", datetime.datetime.fromtimestamp(t).isoformat()
+        heapq.heappush(events, (t + rng.lognormal(mu, sigma), "depart", i))
+
+    us = np.array(decision_us)
+    return {
+        "policy": policy,
+        "arrivals": served + denied,
+        "served": served,
+        "denied": denied,
+        "upgrade_pct": round(upgrades / max(served, 1) * 100, 1),
+        "drive_s": round(float(np.mean(drive_m)) / SIM_DRIVE_MPS, 1) if drive_m else 0,
+        "walk_s": round(float(np.mean(walk_m)) / SIM_WALK_MPS, 1) if walk_m else 0,
+        "zone_load_std": round(float(np.mean(zone_std)), 3) if zone_std else 0,
+        "decide_us_p50": round(float(np.percentile(us, 50)), 1) if us.size else 0,
+        "decide_us_p99": round(float(np.percentile(us, 99)), 1) if us.size else 0,
+    }
+
+
+if __name__ == "__main__":
+    def arg(name, default):
+        return type(default)(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+    n_slots, hours, seed = arg("--slots", 1000), arg("--hours", 12), arg("--seed", 1)
+    print(f"[Assignment] {n_slots} slots, {hours} h of arrivals, seed {seed}")
+    print(f"[Assignment] {'policy':<11} {'arrivals':>8} {'served':>7} {'denied':>7} {'upgrade%':>8} "
+          f"{'drive s':>8} {'walk s':>7} {'zone std':>8} {'p50 us':>7} {'p99 us':>7}")
+    for name in POLICIES:
+        r = simulate(name, n_slots, hours, seed)
+        print(f"[Assignment] {name:<11} {r['arrivals']:>8} {r['served']:>7} {r['denied']:>7} {r['upgrade_pct']:>8} "
+              f"{r['drive_s']:>8} {r['walk_s']:>7} {r['zone_load_std']:>8} {r['decide_us_p50']:>7} {r['decide_us_p99']:>7}")
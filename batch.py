@@ -0,0 +1,191 @@
+"""
+Bulk entry/exit for gate controllers replaying events buffered offline.
+
+A batch runs in one write transaction (one lock, one fsync). Each event goes
+through ParkingAgent.decide/act on the shared cursor inside its own SAVEPOINT,
+so a failed event leaves no partial writes and the rest still apply. Events
+may carry an idempotency_key: a successful result is stored in the same
+transaction, and replaying the key returns it instead of acting again.
+Failures are not stored, so a retry acts afresh.
+"""
+import os
+import json
+import time
+import sqlite3
+import datetime
+
+import plate_index
+import throttle
+from event_log import log_event
+from records import Action
+
+# Largest accepted batch; bigger replays should be split by the controller
+MAX_BATCH_EVENTS = int(os.environ.get("BATCH_MAX_EVENTS", "1000"))
+# Stored results are kept this long for replays
+IDEMPOTENCY_RETENTION_HOURS = int(os.environ.get("IDEMPOTENCY_RETENTION_HOURS", "72"))
+# Seconds to wait for the write lock held by a live gate
+DB_LOCK_TIMEOUT = 10
+
+
+def init_idempotency_table(conn):
+    """Results of batch events that carried an idempotency_key."""
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT,
+                    result TEXT,
+                    created_at TEXT
+                )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys (created_at)")
+
+
+def _entry(agent, c, event, timestamp, pending):
+    reg_num = (event.get('reg_num') or '').replace(" ", "")
+    if not reg_num:
+        return {'status': 'error', 'message': 'Registration number required'}, None
+    vehicle_size = event.get('vehicle_size', 'medium')
+    # The index only knows committed vehicles; a misread of one let in earlier
+    # in this batch is the same vehicle too
+    match = plate_index.get_index(agent.db_name).resolve_entry(c, reg_num, pending)
+    if match:
+        reg_num = match
+
+    for action in agent.decide({'reg_num': reg_num, 'vehicle_size': vehicle_size}, c):
+        result = agent.act(action, c, timestamp)
+        if result.get('status') == 'error':
+            return {'status': 'error', 'reg_num': reg_num, 'message': result['message']}, None
+        if action.type == 'GRANT_ACCESS':
+            reg_num = action.data.reg_num
+            # What was granted: a booking's size class, not necessarily the one asked for
+            return ({'status': 'success', 'reg_num': reg_num, 'assigned_slot': result['assigned_slot'],
+                     'size': action.data.size},
+                    (reg_num, result['assigned_slot'], "ENTRY", timestamp))
+    return {'status': 'error', 'reg_num': reg_num, 'message': 'No action taken by Agent'}, None
+
+
+def _exit(agent, c, event, timestamp, pending):
+    reg_num = (event.get('reg_num') or '').replace(" ", "")
+    if not reg_num:
+        return {'status': 'error', 'message': 'Registration number required'}, None
+    # Tolerate an OCR confusion against the vehicles parked as of this transaction
+    plate, candidate = plate_index.get_index(agent.db_name).resolve_exit(c, reg_num)
+    if plate is None:
+        return {'status': 'not_found', 'reg_num': reg_num, 'message': 'Vehicle not found',
+                'candidate': candidate}, None
+    reg_num = plate
+
+    result = agent.act(Action('RELEASE_SLOT', reg_num), c, timestamp)
+    if result['status'] != 'success':
+        return {'status': result['status'], 'reg_num': reg_num, 'message': result['message']}, None
+    return ({'status': 'success', 'reg_num': reg_num, 'freed_slot': result['freed_slot'],
+             'duration_seconds': result['duration_seconds']},
+            (reg_num, result['freed_slot'], "EXIT", timestamp))
+
+
+HANDLERS = {"entry": _entry, "exit": _exit}
+
+
+def _local_timestamp(value):
+    """
+    ISO timestamp as naive local time, like every other time in the slots and
+    logs tables; an offset (e.g. '...Z' from a controller on UTC) is converted.
+    """
+    ts = datetime.datetime.fromisoformat(value)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone().replace(tzinfo=None)
+    return ts.isoformat()
+
+
+def _run_event(agent, c, kind, event, logged, pending):
+    if not isinstance(event, dict):
+        return {'status': 'error', 'message': 'Event must be an object'}
+
+    key = event.get('idempotency_key')
+    if key is not None:
+        key = str(key)
+        row = c.execute("SELECT kind, result FROM idempotency_keys WHERE key = ?", (key,)).fetchone()
+        if row:
+            if row[0] != kind:
+                return {'status': 'error', 'idempotency_key': key,
+                        'message': f'idempotency_key was already used by an {row[0]} batch'}
+            result = json.loads(row[1])
+            result['replayed'] = True
+            return result
+
+    try:
+        # Gate controllers send the time the vehicle actually passed
+        timestamp = _local_timestamp(event['timestamp']) if event.get('timestamp') \
+            else datetime.datetime.now().isoformat()
+    except (TypeError, ValueError):
+        return {'status': 'error', 'message': f"Invalid timestamp: {event.get('timestamp')!r}"}
+
+    c.execute("SAVEPOINT batch_event")
+    try:
+        result, log = HANDLERS[kind](agent, c, event, timestamp, pending)
+    except Exception as e:
+        # Not stored under the key: a retry may succeed
+        c.execute("ROLLBACK TO batch_event")
+        c.execute("RELEASE batch_event")
+        return {'status': 'error', 'message': f"Internal Error: {str(e)}"}
+
+    if result['status'] != 'success':
+        # Not stored under the key either: a retry once space frees up (or the
+        # vehicle turns up) should act, not replay the failure
+        c.execute("ROLLBACK TO batch_event")
+        c.execute("RELEASE batch_event")
+        if key is not None:
+            result['idempotency_key'] = key
+        return result
+
+    logged.append(log)
+    pending.add(log[0])
+    if key is not None:
+        result['idempotency_key'] = key
+        c.execute("INSERT INTO idempotency_keys (key, kind, result, created_at) VALUES (?, ?, ?, ?)",
+                  (key, kind, json.dumps(result), datetime.datetime.now().isoformat()))
+    c.execute("RELEASE batch_event")
+    return result
+
+
+def run_batch(agent, kind, events):
+    """
+    Applies a list of entry or exit events in order, in one transaction.
+
+    Returns:
+        dict with per-event `results` (same order as `events`) and counts.
+    """
+    t0 = time.perf_counter()
+    logged = []
+    # Plates this batch has written so far, for resolving later events against
+    pending = plate_index.PendingPlates()
+    conn = sqlite3.connect(agent.db_name, timeout=DB_LOCK_TIMEOUT, isolation_level=None)
+    try:
+        c = conn.cursor()
+        throttle.write_lock_waits.begin(c)
+        cutoff = datetime.datetime.now() - datetime.timedelta(hours=IDEMPOTENCY_RETENTION_HOURS)
+        c.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (cutoff.isoformat(),))
+        results = [_run_event(agent, c, kind, event, logged, pending) for event in events]
+        c.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    # Only committed transitions reach the event log
+    for reg_num, slot_id, action, timestamp in logged:
+        log_event(reg_num, slot_id, action, timestamp, db_name=agent.db_name)
+
+    replayed = sum(1 for r in results if r.get('replayed'))
+    succeeded = sum(1 for r in results if r['status'] == 'success' and not r.get('replayed'))
+    elapsed_ms = round((time.perf_counter() - t0) * 1000, 2)
+    print(f"[Batch] {kind}: {len(events)} events in {elapsed_ms} ms "
+          f"({succeeded} applied, {replayed} replayed, {len(events) - succeeded - replayed} failed)")
+    return {
+        "results": results,
+        "applied": succeeded,
+        "replayed": replayed,
+        "failed": len(events) - succeeded - replayed,
+        "elapsed_ms": elapsed_ms,
+    }
@@ -0,0 +1,124 @@
+"""
+Benchmark for the OCR-tolerant plate matcher.
+
+Builds a PlateMatcher over a large synthetic set of Indian-format plates,
+queries it with misread copies (confusable swaps, one random substitution,
+a dropped character) and compares latency and agreement with a linear scan.
+
+Usage:
+    python bench_plate_match.py [--plates 100000] [--queries 2000] [--scan-queries 20]
+"""
+import sys
+import time
+import random
+import string
+import argparse
+
+from plate_index import PlateMatcher, plate_distance, LETTER_MAP, NUMBER_MAP, MATCH_MAX_DISTANCE
+
+STATES = ["MH", "KA", "DL", "TN", "GJ", "UP", "RJ", "WB", "HR", "KL"]
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def synthetic_plates(n, rng):
+    plates = set()
+    while len(plates) < n:
+        plates.add(f"{rng.choice(STATES)}{rng.randint(1, 99):02d}"
+                   f"{rng.choice(string.ascii_uppercase)}{rng.choice(string.ascii_uppercase)}"
+                   f"{rng.randint(0, 9999):04d}")
+    return sorted(plates)
+
+
+def misread(plate, rng):
+    """A plausible OCR error: confusable swaps, or one wrong/dropped character."""
+    chars = list(plate)
+    kind = rng.choice(("confusion", "substitution", "deletion"))
+    if kind == "confusion":
+        positions = [i for i, ch in enumerate(chars) if ch in LETTER_MAP or ch in NUMBER_MAP]
+        for i in rng.sample(positions, min(2, len(positions))):
+            chars[i] = LETTER_MAP.get(chars[i]) or NUMBER_MAP[chars[i]]
+    elif kind == "substitution":
+        i = rng.randrange(len(chars))
+        chars[i] = rng.choice([ch for ch in string.ascii_uppercase + string.digits if ch != chars[i]])
+    else:
+        del chars[rng.randrange(len(chars))]
+    return kind, "".join(chars)
+
+
+def linear_best_match(plates, query, max_distance):
+    best, best_distance, tied = None, None, False
+    for plate in plates:
+        d = plate_distance(query, plate, max_distance)
+        if d > max_distance:
+            continue
+        if best is None or d < best_distance:
+            best, best_distance, tied = plate, d, False
+        elif d == best_distance:
+            tied = True
+    return (None, None) if best is None or tied else (best, best_distance)
+
+
+def run(n_plates, n_queries, n_scan, seed=7):
+    rng = random.Random(seed)
+    plates = synthetic_plates(n_plates, rng)
+
+    t0 = time.perf_counter()
+    matcher = PlateMatcher(plates)
+    build = time.perf_counter() - t0
+    print(f"[Bench] Indexed {len(matcher)} plates in {build:.2f}s")
+
+    queries = []
+    for _ in range(n_queries):
+        truth = rng.choice(plates)
+        kind, query = misread(truth, rng)
+        queries.append((truth, kind, query))
+
+    latencies = []
+    candidates = []
+    correct = {}
+    total = {}
+    for truth, kind, query in queries:
+        t0 = time.perf_counter()
+        found = matcher.candidates(query)
+        best, _ = matcher.best_match(query, MATCH_MAX_DISTANCE, found)
+        latencies.append(time.perf_counter() - t0)
+        candidates.append(len(found))
+        total[kind] = total.get(kind, 0) + 1
+        correct[kind] = correct.get(kind, 0) + (best == truth)
+
+    print(f"[Bench] Indexed lookup p50 {_percentile(latencies, 50) * 1e6:.0f} us, "
+          f"p99 {_percentile(latencies, 99) * 1e6:.0f} us, "
+          f"mean candidates scored {sum(candidates) / len(candidates):.1f}")
+    for kind in sorted(total):
+        print(f"[Bench]   {kind:<12} recovered {correct[kind]}/{total[kind]} "
+              f"({100 * correct[kind] / total[kind]:.1f}%)")
+
+    # Same answers as brute force, at a fraction of the cost
+    scan_latencies = []
+    disagreements = 0
+    for truth, kind, query in queries[:n_scan]:
+        t0 = time.perf_counter()
+        expected = linear_best_match(plates, query, MATCH_MAX_DISTANCE)
+        scan_latencies.append(time.perf_counter() - t0)
+        if matcher.best_match(query, MATCH_MAX_DISTANCE) != expected:
+            disagreements += 1
+    scan_p50 = _percentile(scan_latencies, 50)
+    print(f"[Bench] Linear scan p50 {scan_p50 * 1e3:.1f} ms "
+          f"({scan_p50 / max(_percentile(latencies, 50), 1e-9):.0f}x slower)")
+    print(f"[Bench] {disagreements}/{min(n_scan, len(queries))} queries disagree with the linear scan")
+    return disagreements == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plates", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--scan-queries", type=int, default=20, help="queries also checked by brute force")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.plates, args.queries, args.scan_queries) else 1)
@@ -0,0 +1,82 @@
+"""
+QR decode throughput benchmark.
+
+Renders slot QR codes into synthetic camera frames and measures frames/sec
+for the old per-call path (new detector, full-resolution colour frame) and
+the QRDecoder fast path (persistent detector, grayscale, downscaled, multi).
+
+Usage:
+    python bench_qr.py [--frames 100] [--width 1920] [--height 1080] [--codes 1]
+"""
+import sys
+import time
+import argparse
+import numpy as np
+import cv2
+import qrcode
+
+from qr_decoder import QRDecoder
+
+
+def make_frame(width, height, payloads, seed=3):
+    rng = np.random.default_rng(seed)
+    # Textured background so detection does some real work
+    frame = rng.integers(60, 200, size=(height, width, 3), dtype=np.uint8)
+    frame = cv2.GaussianBlur(frame, (9, 9), 0)
+    side = min(height, width // max(1, len(payloads))) // 3
+    for i, payload in enumerate(payloads):
+        qr = qrcode.QRCode(border=4)
+        qr.add_data(payload)
+        qr.make(fit=True)
+        code = np.array(qr.make_image(fill_color="black", back_color="white").convert("L"))
+        code = cv2.resize(code, (side, side), interpolation=cv2.INTER_NEAREST)
+        x = (i * width) // len(payloads) + side // 2
+        y = height // 3
+        frame[y:y + side, x:x + side] = code[..., None]
+    return frame
+
+
+def old_path(frame):
+    # What _process_visual_input used to do on every call
+    data, _, _ = cv2.QRCodeDetector().detectAndDecode(frame)
+    return [data] if data else []
+
+
+def measure(label, fn, frame, n):
+    result = fn(frame)  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn(frame)
+    elapsed = time.perf_counter() - t0
+    print(f"[BenchQR] {label:<34} {n / elapsed:7.1f} FPS  ({elapsed / n * 1000:6.2f} ms/frame)  decoded {len(result)}")
+    return n / elapsed
+
+
+def run(frames, width, height, n_codes):
+    payloads = [f"Slot{i + 1}" for i in range(n_codes)]
+    frame = make_frame(width, height, payloads)
+    print(f"[BenchQR] {width}x{height} frame, {n_codes} code(s), {frames} frames per mode")
+
+    baseline = measure("per-call detector, full res", old_path, frame, frames)
+    measure("persistent detector, full res", QRDecoder(max_width=0).decode, frame, frames)
+    fast = measure("persistent, gray, <=960px", QRDecoder(max_width=960).decode, frame, frames)
+    measure("persistent, gray, <=640px", QRDecoder(max_width=640).decode, frame, frames)
+    print(f"[BenchQR] Fast path speed-up: {fast / baseline:.1f}x")
+
+    # What every OCR-lane frame pays before falling back to OCR
+    empty = make_frame(width, height, [])
+    print("[BenchQR] Frame without a code:")
+    empty_baseline = measure("per-call detector, full res", old_path, empty, frames)
+    empty_fast = measure("persistent, gray, <=960px", QRDecoder(max_width=960).decode, empty, frames)
+    print(f"[BenchQR] Empty-frame speed-up: {empty_fast / empty_baseline:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--codes", type=int, default=1)
+    args = parser.parse_args()
+    run(args.frames, args.width, args.height, args.codes)
+    sys.exit(0)
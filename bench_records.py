@@ -0,0 +1,82 @@
+"""
+Slot read/serialize benchmark: sqlite3.Row + dict(row) + json vs plain rows + slots_json.
+
+Builds an in-memory lot with N slots (a third of them occupied) and measures
+time per full-lot read+serialize and the memory held by the decoded rows.
+
+Usage:
+    python bench_records.py [--slots 5000] [--runs 50]
+"""
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tracemalloc
+import datetime
+
+import records
+
+
+def build_lot(n):
+    conn = sqlite3.connect(":memory:")
+    conn.execute('''CREATE TABLE slots (slot_id TEXT PRIMARY KEY, size_type TEXT, status TEXT DEFAULT 'free',
+                    reg_num TEXT, temp_reg_num TEXT, entry_time TEXT, is_verified INTEGER DEFAULT 0)''')
+    now = datetime.datetime.now().isoformat()
+    rows = []
+    for i in range(n):
+        occupied = i % 3 == 0
+        rows.append((f"Slot{i + 1}", ("small", "medium", "large")[i % 3], "occupied" if occupied else "free",
+                     f"MH12AB{i:04d}" if occupied else None, None, now if occupied else None, int(occupied)))
+    conn.executemany("INSERT INTO slots VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    return conn
+
+
+def old_path(conn):
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute("SELECT * FROM slots ORDER BY slot_id").fetchall()
+        result = [dict(row) for row in rows]
+    finally:
+        conn.row_factory = None
+    # What jsonify() does: sorted keys, compact separators
+    return json.dumps(result, separators=(",", ":"), sort_keys=True), result
+
+
+def new_path(conn):
+    rows = records.fetch_slot_rows(conn)
+    return records.slots_json(rows), rows
+
+
+def measure(label, fn, conn, runs):
+    body, held = fn(conn)
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        fn(conn)
+    per_call = (time.perf_counter() - t0) / runs
+
+    tracemalloc.start()
+    _, held = fn(conn)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"[BenchRecords] {label:<28} {per_call * 1000:7.2f} ms/read  {1 / per_call:8.0f} reads/s  "
+          f"{size / 1024:8.0f} KiB held  {len(body) / 1024:6.0f} KiB JSON")
+    return body, per_call
+
+
+def run(n_slots, runs):
+    conn = build_lot(n_slots)
+    print(f"[BenchRecords] {n_slots} slots, {runs} runs")
+    old_body, old_t = measure("sqlite3.Row + dict + json", old_path, conn, runs)
+    new_body, new_t = measure("slot rows + slots_json", new_path, conn, runs)
+    same = json.loads(old_body) == json.loads(new_body)
+    print(f"[BenchRecords] Speed-up {old_t / new_t:.1f}x, identical output: {same}")
+    return same
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slots", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.slots, args.runs) else 1)
@@ -0,0 +1,76 @@
+"""
+/api/slots wire-size and encode-time benchmark.
+
+Builds an in-memory lot with N slots (a third occupied), then compares the
+default JSON array against the columnar snapshot (JSON, MessagePack if
+installed), each raw and compressed, plus a delta after 1% of slots change.
+
+Usage:
+    python bench_slots_wire.py [--slots 5000] [--runs 20]
+"""
+import sys
+import time
+import sqlite3
+import argparse
+import datetime
+
+import records
+import journal
+import compression
+import slot_codec
+
+
+def build_lot(n):
+    conn = sqlite3.connect(":memory:")
+    conn.execute('''CREATE TABLE slots (slot_id TEXT PRIMARY KEY, size_type TEXT, status TEXT DEFAULT 'free',
+                    reg_num TEXT, temp_reg_num TEXT, entry_time TEXT, is_verified INTEGER DEFAULT 0)''')
+    journal.init_journal_tables(conn)
+    now = datetime.datetime.now().isoformat()
+    rows = []
+    for i in range(n):
+        occupied = i % 3 == 0
+        rows.append((f"Slot{i + 1}", ("small", "medium", "large")[i % 3], "occupied" if occupied else "free",
+                     f"MH12AB{i:04d}" if occupied else None, None, now if occupied else None, int(occupied)))
+    conn.executemany("INSERT INTO slots VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    return conn
+
+
+def measure(label, fn, runs, baseline=None):
+    body = fn()
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    per_call = (time.perf_counter() - t0) / runs
+    sizes = [f"{len(body) / 1024:7.1f} KiB raw"]
+    for encoding in compression.ENCODINGS:
+        sizes.append(f"{len(compression.compress(body, encoding)) / 1024:6.1f} KiB {encoding}")
+    ratio = f"  ({baseline / len(body):5.1f}x smaller)" if baseline else ""
+    print(f"[BenchWire] {label:<30} {per_call * 1000:6.2f} ms  {'  '.join(sizes)}{ratio}")
+    return len(body)
+
+
+def run(n_slots, runs):
+    conn = build_lot(n_slots)
+    print(f"[BenchWire] {n_slots} slots, {runs} runs, encodings: {', '.join(compression.ENCODINGS)}")
+
+    full = measure("JSON array (default)", lambda: records.slots_json(records.fetch_slot_rows(conn)).encode(), runs)
+    for fmt in slot_codec.FORMATS:
+        measure(f"{fmt} snapshot", lambda: slot_codec.encode(slot_codec.snapshot(conn), fmt)[0], runs, full)
+
+    version = slot_codec.journal_version(conn)
+    conn.executemany("UPDATE slots SET status = 'free', reg_num = NULL, entry_time = NULL, is_verified = 0 WHERE slot_id = ?",
+                     [(f"Slot{i + 1}",) for i in range(0, n_slots, 100)])
+    conn.commit()
+    for fmt in slot_codec.FORMATS:
+        measure(f"{fmt} delta (1% changed)", lambda: slot_codec.encode(slot_codec.snapshot(conn, version), fmt)[0],
+                runs, full)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slots", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    run(args.slots, args.runs)
+    sys.exit(0)
@@ -0,0 +1,60 @@
+import cv2
+import threading
+import time
+
+# --- SHARED CAMERA SINGLETON ---
+class SharedCamera:
+    def __init__(self):
+        # Try DSHOW first (Windows), then default
+        print("Attempting to open camera with CAP_DSHOW...")
+        self.cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
+        if not self.cap.isOpened():
+             print("CAP_DSHOW failed. Trying default backend...")
+             self.cap = cv2.VideoCapture(0)
+             
+        self.lock = threading.Lock()
+        self.last_frame = None
+        self.is_running = True
+        
+        if not self.cap.isOpened():
+            print("CRITICAL ERROR: Camera 0 could not be opened Check drivers/permissions.")
+        else:
+            print("Camera 0 Opened Successfully.")
+        
+        # Start background reading thread
+        self.thread = threading.Thread(target=self._update_loop, daemon=True)
+        self.thread.start()
+
+    def _update_loop(self):
+        failure_count = 0
+        while self.is_running:
+            if self.cap.isOpened():
+                success, frame = self.cap.read()
+                if success:
+                    with self.lock:
+                        self.last_frame = frame.copy()
+                    failure_count = 0
+                else:
+                    failure_count += 1
+                    if failure_count > 10:
+                        # print("Camera read failed repeatedly. Re-initializing...")
+                        self.cap.release()
+                        time.sleep(1)
+                        self.cap = cv2.VideoCapture(0)
+                        failure_count = 0
+            else:
+                time.sleep(1)
+                self.cap = cv2.VideoCapture(0)
+                
+            time.sleep(0.01) # ~60 FPS cap
+
+    def get_frame(self):
+        with self.lock:
+             if self.last_frame is not None:
+                 return self.last_frame.copy()
+        return None
+
+    def __del__(self):
+        self.is_running = False
+        if self.cap and self.cap.isOpened():
+            self.cap.release()
@@ -0,0 +1,101 @@
+"""
+Negotiated response compression: brotli when the client accepts it and the
+`brotli` package is installed, else gzip.
+
+Applied in an after_request hook to text/JSON responses above MIN_BYTES.
+Bodies carrying an ETag are cached per (path, ETag, encoding), so many
+clients polling the same unchanged state pay for one compression.
+"""
+import gzip
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE = {"application/json", "application/msgpack", "text/html", "text/css", "text/plain",
+                "application/javascript", "image/svg+xml"}
+# Compressed bodies kept per (path, etag, encoding)
+CACHE_ENTRIES = 64
+
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+
+def choose_encoding(accept_encoding, available=ENCODINGS):
+    """Best of `available` (in preference order) allowed by an Accept-Encoding header."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in available:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+class ResponseCompressor:
+    def __init__(self, min_bytes=MIN_BYTES, cache_entries=CACHE_ENTRIES):
+        self.min_bytes = min_bytes
+        self.cache_entries = cache_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _compress_cached(self, path, etag, body, encoding):
+        if etag is None:
+            return compress(body, encoding)
+        # ETags are only unique per resource: two lots can share a journal version
+        key = (path, etag, encoding)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        data = compress(body, encoding)
+        with self._lock:
+            self._cache[key] = data
+            if len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return data
+
+    def apply(self, request, response):
+        """after_request hook: compresses the body in place when worthwhile."""
+        encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+        if (encoding is None or response.status_code != 200 or response.direct_passthrough
+                or response.is_streamed or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE):
+            return response
+        body = response.get_data()
+        if len(body) < self.min_bytes:
+            return response
+
+        etag, _ = response.get_etag()
+        data = self._compress_cached(request.full_path, etag, body, encoding)
+        if len(data) >= len(body):
+            return response
+        response.set_data(data)
+        response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        if etag:
+            # Same resource, different bytes: a weak ETag still matches If-None-Match
+            response.set_etag(etag, weak=True)
+        return response
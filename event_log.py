@@ -0,0 +1,137 @@
+import sqlite3
+import datetime
+import threading
+import queue
+import time
+import atexit
+import os
+
+DB_NAME = "parking.db"
+
+# Flush when this many events are queued, or after this long, whichever comes first
+BATCH_MAX_EVENTS = int(os.environ.get("EVENT_LOG_BATCH_EVENTS", "100"))
+BATCH_MAX_DELAY_MS = int(os.environ.get("EVENT_LOG_BATCH_MS", "200"))
+
+# 'batched'  - log() returns immediately; events are committed by the writer thread
+# 'immediate' - log() blocks until the batch containing the event is committed
+DURABILITY = os.environ.get("EVENT_LOG_DURABILITY", "batched")
+
+
+class EventLogWriter:
+    """
+    Asynchronous, batched writer for the `logs` table.
+
+    Callers enqueue events and return straight away; a single background
+    thread drains the queue and inserts each batch in one transaction, so
+    logging costs one fsync per batch instead of one per event.
+    """
+
+    def __init__(self, db_name=DB_NAME, max_events=BATCH_MAX_EVENTS, max_delay_ms=BATCH_MAX_DELAY_MS,
+                 durability=DURABILITY):
+        if durability not in ("batched", "immediate"):
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.db_name = db_name
+        self.max_events = max_events
+        self.max_delay = max_delay_ms / 1000.0
+        self.durability = durability
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        # Metrics
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-log-writer", daemon=True)
+                self._thread.start()
+
+    def log(self, reg_num, slot_id, action, timestamp=None, wait=None):
+        """
+        Queues one state-transition event.
+
+        Args:
+            wait: Override the durability mode for this call (True = block until committed).
+        """
+        if timestamp is None:
+            timestamp = datetime.datetime.now().isoformat()
+        if wait is None:
+            wait = self.durability == "immediate"
+        done = threading.Event() if wait else None
+        self._ensure_started()
+        self._queue.put(((reg_num, slot_id, action, timestamp), done))
+        if done is not None:
+            done.wait()
+
+    def flush(self, timeout=None):
+        """Blocks until everything queued so far has been committed."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put((None, done))
+        done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            # A flush marker (row None) ends the batch early
+            while batch[-1][0] is not None and len(batch) < self.max_events:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        rows = [row for row, _ in batch if row is not None]
+        if rows:
+            try:
+                with sqlite3.connect(self.db_name) as conn:
+                    conn.executemany("INSERT INTO logs (reg_num, slot_id, action, timestamp) VALUES (?, ?, ?, ?)", rows)
+                    conn.commit()
+                self.written += len(rows)
+                self.batches += 1
+            except sqlite3.Error as e:
+                self.errors += 1
+                print(f"[EventLog] Failed to write {len(rows)} events: {e}")
+        for _, done in batch:
+            if done is not None:
+                done.set()
+
+    def stats(self):
+        return {"queued": self._queue.qsize(), "written": self.written, "batches": self.batches,
+                "errors": self.errors, "durability": self.durability}
+
+
+# Process-wide writer shared by the agent and the routes
+event_log = EventLogWriter()
+atexit.register(event_log.flush, 5)
+
+# One writer per extra database (multi-lot deployments)
+_writers = {DB_NAME: event_log}
+_writers_lock = threading.Lock()
+
+
+def get_writer(db_name=DB_NAME):
+    writer = _writers.get(db_name)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(db_name)
+            if writer is None:
+                writer = EventLogWriter(db_name)
+                atexit.register(writer.flush, 5)
+                _writers[db_name] = writer
+    return writer
+
+
+def log_event(reg_num, slot_id, action, timestamp=None, db_name=DB_NAME):
+    get_writer(db_name).log(reg_num, slot_id, action, timestamp)
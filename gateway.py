@@ -1,6 +1,8 @@
 import flask
 from flask import redirect, jsonify
 import os
+import threading
+import time
 import pymongo
 
 app = flask.Flask(__name__)
@@ -11,6 +13,137 @@ MONGODB_URI = os.environ.get("MONGODB_URI")
 CLUSTER_NAME = "SmartParkingParams"
 COLLECTION_NAME = "system_config"
 
+# How often the background refresher re-reads the tunnel document (seconds)
+REFRESH_INTERVAL = int(os.environ.get("GATEWAY_REFRESH_SECONDS", "15"))
+# Short max-age so edge caches never hold a dead tunnel URL for long
+REDIRECT_MAX_AGE = int(os.environ.get("GATEWAY_REDIRECT_MAX_AGE", "30"))
+
+
+class RedirectTable:
+    """
+    Precomputed slot_id -> target URL table.
+
+    Rebuilt only when the tunnel URL or the published slot set changes, so
+    the request path is a dict lookup with no MongoDB round-trip.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._client = None
+        self._refresher = None
+        self.tunnel_url = None
+        self.slot_ids = ()
+        self.lot_slots = ()
+        self.targets = {}
+        self.built_at = None
+        self.last_refresh = None
+        self.last_error = None
+        self.rebuilds = 0
+        self.hits = 0
+        self.misses = 0
+
+    def rebuild(self, tunnel_url, slot_ids=(), lots=None):
+        """
+        Regenerates the table if the inputs changed. Returns True on rebuild.
+        lots maps extra lot ids to their slot ids; their keys are '<lot_id>/<slot_id>'.
+        """
+        slot_ids = tuple(slot_ids or ())
+        lot_slots = tuple(sorted((lot_id, tuple(ids)) for lot_id, ids in (lots or {}).items()))
+        if tunnel_url == self.tunnel_url and slot_ids == self.slot_ids and lot_slots == self.lot_slots:
+            return False
+
+        targets = {'app': f"{tunnel_url}/mobile"}
+        for slot_id in slot_ids:
+            targets[slot_id] = f"{tunnel_url}/scan/{slot_id}"
+        for lot_id, ids in lot_slots:
+            for slot_id in ids:
+                targets[f"{lot_id}/{slot_id}"] = f"{tunnel_url}/lots/{lot_id}/scan/{slot_id}"
+
+        with self._lock:
+            self.tunnel_url = tunnel_url
+            self.slot_ids = slot_ids
+            self.lot_slots = lot_slots
+            self.targets = targets
+            self.built_at = time.time()
+            self.rebuilds += 1
+        print(f"[Gateway] Redirect table rebuilt: {len(targets)} targets -> {tunnel_url}")
+        return True
+
+    def lookup(self, slot_id, lot_id=None):
+        """Returns the redirect target for slot_id, or None if no tunnel is known."""
+        if lot_id:
+            key = f"{lot_id}/{slot_id}"
+        else:
+            key = 'app' if slot_id.lower() == 'app' else slot_id
+        target = self.targets.get(key)
+        if target is not None:
+            self.hits += 1
+            return target
+
+        self.misses += 1
+        base = self.tunnel_url
+        if not base:
+            return None
+        # Slot not published yet - build the URL but don't grow the table
+        if lot_id:
+            return f"{base}/lots/{lot_id}/scan/{slot_id}"
+        return f"{base}/scan/{slot_id}"
+
+    def refresh(self):
+        """Reads the tunnel document from MongoDB and rebuilds if it changed."""
+        try:
+            if self._client is None:
+                self._client = pymongo.MongoClient(MONGODB_URI, serverSelectionTimeoutMS=2000)
+            collection = self._client[CLUSTER_NAME][COLLECTION_NAME]
+            doc = collection.find_one({"config_id": "main_tunnel"})
+            self.last_refresh = time.time()
+            self.last_error = None
+            if doc and "tunnel_url" in doc:
+                self.rebuild(doc["tunnel_url"], doc.get("slot_ids") or (), doc.get("lots"))
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"[Gateway] Refresh failed: {e}")
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(REFRESH_INTERVAL)
+            self.refresh()
+
+    def ensure_started(self):
+        """Primes the table once and starts the background refresher."""
+        if self._refresher is not None:
+            return
+        with self._start_lock:
+            if self._refresher is not None:
+                return
+            # Published only after the first load, so concurrent cold-start
+            # requests wait for it here instead of finding an empty table
+            self.refresh()
+            refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+            refresher.start()
+            self._refresher = refresher
+
+    def stats(self):
+        now = time.time()
+        lookups = self.hits + self.misses
+        return {
+            "tunnel_url": self.tunnel_url,
+            "entries": len(self.targets),
+            "lots": len(self.lot_slots) + 1,
+            "rebuilds": self.rebuilds,
+            "cache_age_seconds": round(now - self.built_at, 1) if self.built_at else None,
+            "last_refresh_age_seconds": round(now - self.last_refresh, 1) if self.last_refresh else None,
+            "last_error": self.last_error,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+redirect_table = RedirectTable()
+
+
 @app.route('/')
 def home():
     return "<h1>Smart Parking Gateway Active</h1><p>Magic Link Ready.</p>"
@@ -19,37 +152,34 @@ def home():
 def health():
     return jsonify({"status": "ok"})
 
+@app.route('/health/details')
+def health_details():
+    stats = redirect_table.stats()
+    stats["status"] = "ok" if stats["tunnel_url"] else "degraded"
+    response = jsonify(stats)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 @app.route('/qr/<slot_id>')
-def qr_redirect(slot_id):
+@app.route('/qr/<lot_id>/<slot_id>')
+def qr_redirect(slot_id, lot_id=None):
     """
-    Lightweight Gateway Redirection.
+    Lightweight Gateway Redirection (served from the precomputed table).
     """
-    redirect_base = None
-    
-    if MONGODB_URI:
-        try:
-            client = pymongo.MongoClient(MONGODB_URI, serverSelectionTimeoutMS=2000)
-            db = client[CLUSTER_NAME]
-            collection = db[COLLECTION_NAME]
-            
-            doc = collection.find_one({"config_id": "main_tunnel"})
-            if doc and "tunnel_url" in doc:
-                redirect_base = doc["tunnel_url"]
-        except Exception as e:
-            return f"<h1>Database Error</h1><p>{str(e)}</p>", 500
-    else:
+    if not MONGODB_URI:
         return "<h1>Configuration Error</h1><p>MONGODB_URI not set on Render.</p>", 500
 
-    if not redirect_base:
-        return "<h1>System Offline</h1><p>No active tunnel found.</p>", 503
+    redirect_table.ensure_started()
+    target = redirect_table.lookup(slot_id, lot_id)
+
+    if not target:
+        if redirect_table.last_error:
+            return f"<h1>Database Error</h1><p>{redirect_table.last_error}</p>", 500, {'Cache-Control': 'no-store'}
+        return "<h1>System Offline</h1><p>No active tunnel found.</p>", 503, {'Cache-Control': 'no-store'}
 
-    # Redirect
-    if slot_id.lower() == 'app':
-        target = f"{redirect_base}/mobile"
-    else:
-        target = f"{redirect_base}/scan/{slot_id}"
-        
-    return redirect(target, code=302)
+    response = redirect(target, code=302)
+    response.headers['Cache-Control'] = f'public, max-age={REDIRECT_MAX_AGE}'
+    return response
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,344 @@
+"""
+Append-only, replayable journal of slot state changes.
+
+Triggers on `slots` append the full after-image of every changed row to
+slot_journal in the same transaction as the change, wherever the UPDATE
+happens, so `slots` is a materialized view of the journal. Replaying an
+after-image is idempotent.
+
+Snapshots are folded from the previous snapshot plus the journal (never read
+back from `slots`), so a corrupted slots table can be rebuilt from them.
+Recovery loads the latest snapshot and replays only the tail behind it, at
+most ~SNAPSHOT_EVERY_EVENTS events however long the history is. Journal rows
+already folded into the oldest kept snapshot are deleted with it, so the
+journal holds about KEEP_SNAPSHOTS * SNAPSHOT_EVERY_EVENTS rows.
+
+Run:
+    python journal.py verify|rebuild|snapshot|stats [db]
+    python journal.py bench [--slots 500] [--events 200000]
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import datetime
+import threading
+
+from records import SLOT_COLUMNS
+
+DB_NAME = "parking.db"
+
+# A snapshot is taken once this many events have accumulated behind the last one
+SNAPSHOT_EVERY_EVENTS = int(os.environ.get("JOURNAL_SNAPSHOT_EVENTS", "5000"))
+SNAPSHOT_CHECK_INTERVAL = int(os.environ.get("JOURNAL_SNAPSHOT_SECONDS", "60"))
+# Older snapshots are dropped, and the journal up to the oldest one kept
+KEEP_SNAPSHOTS = 3
+
+_COLUMNS = ", ".join(SLOT_COLUMNS)
+_NEW_COLUMNS = ", ".join(f"NEW.{col}" for col in SLOT_COLUMNS)
+_NOW = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+
+
+def init_journal_tables(conn):
+    """Journal and snapshot tables, the triggers that feed them, and a genesis snapshot."""
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS slot_journal (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ts TEXT,
+                    kind TEXT,
+                    slot_id TEXT,
+                    size_type TEXT,
+                    status TEXT,
+                    reg_num TEXT,
+                    temp_reg_num TEXT,
+                    entry_time TEXT,
+                    is_verified INTEGER
+                )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS slot_snapshots (
+                    seq INTEGER PRIMARY KEY,
+                    taken_at TEXT,
+                    slots INTEGER,
+                    data BLOB
+                )''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_slot_journal_insert AFTER INSERT ON slots
+                  BEGIN
+                     INSERT INTO slot_journal (ts, kind, {_COLUMNS}) VALUES ({_NOW}, 'create', {_NEW_COLUMNS});
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_slot_journal_delete AFTER DELETE ON slots
+                  BEGIN
+                     INSERT INTO slot_journal (ts, kind, slot_id) VALUES ({_NOW}, 'delete', OLD.slot_id);
+                  END''')
+    changed = " OR ".join(f"OLD.{col} IS NOT NEW.{col}" for col in SLOT_COLUMNS)
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_slot_journal_update AFTER UPDATE ON slots
+                  WHEN {changed}
+                  BEGIN
+                     INSERT INTO slot_journal (ts, kind, {_COLUMNS}) VALUES ({_NOW},
+                        CASE
+                           WHEN NEW.status = 'free' THEN 'release'
+                           WHEN NEW.status = 'reserved' AND OLD.status = 'reserved' THEN 'reserve'
+                           WHEN NEW.status = 'reserved' THEN 'entry'
+                           WHEN NEW.status = 'occupied' THEN 'verify'
+                           WHEN NEW.status = 'misuse' THEN 'misuse'
+                           WHEN NEW.status = 'rejected' THEN 'reject'
+                           ELSE 'update'
+                        END, {_NEW_COLUMNS});
+                  END''')
+
+    # Databases that predate the journal start from their current slots
+    c.execute("SELECT COUNT(*) FROM slot_snapshots")
+    if c.fetchone()[0] == 0:
+        c.execute("SELECT COUNT(*) FROM slot_journal")
+        if c.fetchone()[0] == 0:
+            state = {row[0]: tuple(row) for row in c.execute(f"SELECT {_COLUMNS} FROM slots")}
+            _store_snapshot(c, 0, state)
+
+
+def mark(cursor, kind):
+    """
+    Records an event that changes no single slot (e.g. 'reset'). The per-slot
+    rows it caused are journaled by the triggers; replay skips markers.
+    """
+    cursor.execute(f"INSERT INTO slot_journal (ts, kind) VALUES ({_NOW}, ?)", (kind,))
+
+
+# --- Replay ---
+
+def _store_snapshot(c, seq, state):
+    data = zlib.compress(json.dumps(list(state.values()), separators=(",", ":")).encode())
+    c.execute("INSERT OR REPLACE INTO slot_snapshots (seq, taken_at, slots, data) VALUES (?, ?, ?, ?)",
+              (seq, datetime.datetime.now().isoformat(), len(state), data))
+
+
+def pruned_through(c):
+    """Journal seq up to which rows may have been deleted (the oldest snapshot's)."""
+    return c.execute("SELECT COALESCE(MIN(seq), 0) FROM slot_snapshots").fetchone()[0]
+
+
+def _latest_snapshot(c):
+    c.execute("SELECT seq, data FROM slot_snapshots ORDER BY seq DESC LIMIT 1")
+    row = c.fetchone()
+    if row is None:
+        return 0, {}
+    return row[0], {slot[0]: tuple(slot) for slot in json.loads(zlib.decompress(row[1]))}
+
+
+def fold(state, events):
+    """
+    Applies (seq, kind, *SLOT_COLUMNS) events to a slot_id -> row dict.
+
+    Returns:
+        (last seq applied, number of events)
+    """
+    seq = None
+    n = 0
+    for event in events:
+        seq, kind, row = event[0], event[1], event[2:]
+        n += 1
+        slot_id = row[0]
+        if slot_id is None:
+            continue  # marker
+        if kind == "delete":
+            state.pop(slot_id, None)
+        else:
+            state[slot_id] = tuple(row)
+    return seq, n
+
+
+def materialize(c):
+    """
+    The slot table as the journal says it should be: latest snapshot + tail.
+    Run inside a transaction so the snapshot and tail are consistent.
+
+    Returns:
+        (state, last seq, events replayed)
+    """
+    snapshot_seq, state = _latest_snapshot(c)
+    events = c.execute(f"SELECT seq, kind, {_COLUMNS} FROM slot_journal WHERE seq > ? ORDER BY seq", (snapshot_seq,))
+    seq, replayed = fold(state, events)
+    return state, seq if seq is not None else snapshot_seq, replayed
+
+
+def _connect(db_name):
+    return sqlite3.connect(db_name, timeout=10, isolation_level=None)
+
+
+def take_snapshot(db_name=DB_NAME, min_events=0):
+    """
+    Folds the tail into a new snapshot (if at least min_events are behind the
+    last one), drops all but the newest KEEP_SNAPSHOTS and deletes the journal
+    rows the oldest remaining one already covers.
+    """
+    conn = _connect(db_name)
+    try:
+        c = conn.cursor()
+        # Write lock up front: a read transaction can't upgrade once another gate has committed
+        c.execute("BEGIN IMMEDIATE")
+        last_seq = c.execute("SELECT COALESCE(MAX(seq), 0) FROM slot_journal").fetchone()[0]
+        snapshot_seq = c.execute("SELECT COALESCE(MAX(seq), 0) FROM slot_snapshots").fetchone()[0]
+        if last_seq - snapshot_seq < max(1, min_events):
+            c.execute("COMMIT")
+            return None
+        t0 = time.perf_counter()
+        state, seq, replayed = materialize(c)
+        _store_snapshot(c, seq, state)
+        c.execute("DELETE FROM slot_snapshots WHERE seq NOT IN (SELECT seq FROM slot_snapshots ORDER BY seq DESC LIMIT ?)",
+                  (KEEP_SNAPSHOTS,))
+        c.execute("DELETE FROM slot_journal WHERE seq <= ?", (pruned_through(c),))
+        pruned = c.rowcount
+        c.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    elapsed = (time.perf_counter() - t0) * 1000
+    print(f"[Journal] Snapshot at seq {seq}: {len(state)} slots, folded {replayed} events, "
+          f"pruned {pruned} ({elapsed:.0f} ms)")
+    return {"seq": seq, "slots": len(state), "folded": replayed, "pruned": pruned}
+
+
+def verify(db_name=DB_NAME):
+    """slot_ids whose row in `slots` differs from the journal's."""
+    conn = _connect(db_name)
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN")
+        state, _, _ = materialize(c)
+        actual = {row[0]: tuple(row) for row in c.execute(f"SELECT {_COLUMNS} FROM slots")}
+        c.execute("COMMIT")
+    finally:
+        conn.close()
+    return sorted(k for k in state.keys() | actual.keys() if state.get(k) != actual.get(k))
+
+
+def rebuild(db_name=DB_NAME):
+    """
+    Rewrites `slots` rows that differ from the journal. Repairs go through the
+    triggers too, so the journal records them as ordinary events.
+    """
+    t0 = time.perf_counter()
+    conn = _connect(db_name)
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        state, seq, replayed = materialize(c)
+        actual = {row[0]: tuple(row) for row in c.execute(f"SELECT {_COLUMNS} FROM slots")}
+        stale = [k for k in actual if k not in state]
+        missing = [row for k, row in state.items() if k not in actual]
+        wrong = [row[1:] + row[:1] for k, row in state.items() if k in actual and row != actual[k]]
+        # Plain DELETE/UPDATE/INSERT (not REPLACE) so the analytics counter triggers fire too
+        c.executemany("DELETE FROM slots WHERE slot_id = ?", [(k,) for k in stale])
+        c.executemany(f"UPDATE slots SET {', '.join(f'{col} = ?' for col in SLOT_COLUMNS[1:])} WHERE slot_id = ?", wrong)
+        c.executemany(f"INSERT INTO slots ({_COLUMNS}) VALUES ({', '.join('?' * len(SLOT_COLUMNS))})", missing)
+        c.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    elapsed = (time.perf_counter() - t0) * 1000
+    repaired = len(stale) + len(missing) + len(wrong)
+    print(f"[Journal] Rebuilt slots at seq {seq}: replayed {replayed} events, repaired {repaired} rows ({elapsed:.0f} ms)")
+    return {"seq": seq, "replayed": replayed, "repaired": repaired, "elapsed_ms": round(elapsed, 1)}
+
+
+def stats(db_name=DB_NAME):
+    with sqlite3.connect(db_name) as conn:
+        c = conn.cursor()
+        last_seq = c.execute("SELECT COALESCE(MAX(seq), 0) FROM slot_journal").fetchone()[0]
+        rows = c.execute("SELECT COUNT(*) FROM slot_journal").fetchone()[0]
+        snapshots = c.execute("SELECT seq, taken_at, slots FROM slot_snapshots ORDER BY seq DESC").fetchall()
+    snapshot_seq = snapshots[0][0] if snapshots else 0
+    return {
+        "last_seq": last_seq,
+        "journal_rows": rows,
+        "tail_events": last_seq - snapshot_seq,
+        "snapshot_every": SNAPSHOT_EVERY_EVENTS,
+        "snapshots": [{"seq": s, "taken_at": t, "slots": n} for s, t, n in snapshots],
+    }
+
+
+def start_snapshot_thread(db_name=DB_NAME, interval=SNAPSHOT_CHECK_INTERVAL):
+    """Snapshots every `interval` seconds once SNAPSHOT_EVERY_EVENTS have accumulated."""
+    def loop():
+        while True:
+            try:
+                take_snapshot(db_name, min_events=SNAPSHOT_EVERY_EVENTS)
+            except Exception as e:
+                print(f"[Journal] Snapshot failed: {e}")
+            time.sleep(interval)
+
+    t = threading.Thread(target=loop, name="journal-snapshot", daemon=True)
+    t.start()
+    return t
+
+
+def _bench(n_slots, n_events):
+    import random
+    import tempfile
+
+    db = os.path.join(tempfile.mkdtemp(prefix="journal_bench_"), "parking.db")
+    with sqlite3.connect(db) as conn:
+        conn.execute(f"CREATE TABLE slots (slot_id TEXT PRIMARY KEY, size_type TEXT, status TEXT DEFAULT 'free', "
+                     f"reg_num TEXT, temp_reg_num TEXT, entry_time TEXT, is_verified INTEGER DEFAULT 0)")
+        init_journal_tables(conn)
+        conn.executemany("INSERT INTO slots (slot_id, size_type) VALUES (?, 'medium')",
+                         [(f"Slot{i}",) for i in range(n_slots)])
+        rng = random.Random(7)
+        now = datetime.datetime.now().isoformat()
+        for start in range(0, n_events, 10000):
+            updates = []
+            for i in range(start, min(n_events, start + 10000)):
+                if rng.random() < 0.5:
+                    updates.append(("reserved", f"MH12AB{i % 10000:04d}", now, f"Slot{rng.randrange(n_slots)}"))
+                else:
+                    updates.append(("free", None, None, f"Slot{rng.randrange(n_slots)}"))
+            conn.executemany("UPDATE slots SET status = ?, reg_num = ?, entry_time = ? WHERE slot_id = ?", updates)
+            conn.commit()
+    print(f"[Journal] {n_slots} slots, {stats(db)['last_seq']} journaled events")
+
+    with sqlite3.connect(db) as conn:
+        t0 = time.perf_counter()
+        state = {}
+        fold(state, conn.execute(f"SELECT seq, kind, {_COLUMNS} FROM slot_journal ORDER BY seq"))
+        print(f"[Journal] Full replay from genesis: {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    take_snapshot(db)
+    # Tail of SNAPSHOT_EVERY_EVENTS changes behind the snapshot (a new plate each
+    # time, so every update really changes a row and is journaled), then a
+    # corrupted table
+    with sqlite3.connect(db) as conn:
+        conn.executemany("UPDATE slots SET status = 'occupied', reg_num = ?, is_verified = 1 WHERE slot_id = ?",
+                         [(f"TL{i:06d}", f"Slot{i % n_slots}") for i in range(SNAPSHOT_EVERY_EVENTS)])
+        conn.commit()
+        conn.execute("DROP TRIGGER trg_slot_journal_update")
+        conn.execute("UPDATE slots SET status = 'free', reg_num = NULL")
+        conn.commit()
+        init_journal_tables(conn)
+    print(f"[Journal] Corrupted: {len(verify(db))} slots differ from the journal")
+    result = rebuild(db)
+    print(f"[Journal] Recovery (snapshot + {result['replayed']} event tail): {result['elapsed_ms']} ms, "
+          f"consistent after: {not verify(db)}")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "bench":
+        n_slots = int(sys.argv[sys.argv.index("--slots") + 1]) if "--slots" in sys.argv else 500
+        n_events = int(sys.argv[sys.argv.index("--events") + 1]) if "--events" in sys.argv else 200000
+        _bench(n_slots, n_events)
+    else:
+        db = sys.argv[2] if len(sys.argv) > 2 else DB_NAME
+        if command == "verify":
+            diff = verify(db)
+            print(f"[Journal] {len(diff)} slots differ from the journal: {diff[:20]}")
+        elif command == "rebuild":
+            rebuild(db)
+        elif command == "snapshot":
+            take_snapshot(db)
+        else:
+            print(json.dumps(stats(db), indent=2))
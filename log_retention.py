@@ -0,0 +1,289 @@
+import sqlite3
+import datetime
+import gzip
+import json
+import os
+import threading
+import time
+
+DB_NAME = "parking.db"
+ARCHIVE_DIR = "log_archive"
+
+# Raw log rows older than this are archived to gzip files and deleted from the hot DB
+RAW_RETENTION_DAYS = int(os.environ.get("LOG_RAW_RETENTION_DAYS", "30"))
+# Hourly rollups older than this are dropped (daily rollups are kept forever)
+HOURLY_RETENTION_DAYS = int(os.environ.get("LOG_HOURLY_RETENTION_DAYS", "180"))
+COMPACTION_INTERVAL = int(os.environ.get("LOG_COMPACTION_SECONDS", "3600"))
+
+# How each logged action moves occupancy (shared with analytics; tuples so
+# they can go straight into np.isin). A vehicle arrives with ENTRY and leaves
+# with EXIT. MISUSE_ACCEPT moves a parked vehicle to the slot it took, so it
+# shifts occupancy between size classes without adding a vehicle. The other
+# misuse outcomes, AUTO_CLEAR (of a rejected slot) and CORRECTION_CLEAR (of
+# the slot a vehicle was flagged in, once verified in its own) leave the
+# vehicle in the slot it was assigned, and don't change occupancy.
+ENTRY_ACTIONS = ("ENTRY",)
+EXIT_ACTIONS = ("EXIT",)
+MOVE_ACTIONS = ("MISUSE_ACCEPT",)
+RESET_ACTIONS = ("RESET",)
+SIZE_CLASSES = ("small", "medium", "large")
+
+
+def init_retention_tables(conn):
+    """Indexes on the raw log plus rollup and watermark tables."""
+    c = conn.cursor()
+    c.execute("CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_logs_reg_num ON logs (reg_num)")
+    c.execute('''CREATE TABLE IF NOT EXISTS log_rollup_hourly (
+                    bucket TEXT,
+                    size_type TEXT,
+                    entries INTEGER DEFAULT 0,
+                    exits INTEGER DEFAULT 0,
+                    events INTEGER DEFAULT 0,
+                    occupancy_end INTEGER DEFAULT 0,
+                    PRIMARY KEY (bucket, size_type)
+                )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS log_rollup_daily (
+                    day TEXT,
+                    size_type TEXT,
+                    entries INTEGER DEFAULT 0,
+                    exits INTEGER DEFAULT 0,
+                    events INTEGER DEFAULT 0,
+                    peak_occupancy INTEGER DEFAULT 0,
+                    PRIMARY KEY (day, size_type)
+                )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS log_rollup_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )''')
+
+
+def _get_state(c, key, default):
+    c.execute("SELECT value FROM log_rollup_state WHERE key = ?", (key,))
+    row = c.fetchone()
+    return row[0] if row else default
+
+
+def _set_state(c, key, value):
+    c.execute("INSERT OR REPLACE INTO log_rollup_state (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+def _previous_slot(c, reg_num, before_id):
+    """Slot the vehicle held before a move: its latest arrival or move before `before_id`."""
+    c.execute(f"""SELECT slot_id FROM logs WHERE reg_num = ? AND id < ?
+                  AND action IN ({",".join("?" * len(ENTRY_ACTIONS + MOVE_ACTIONS))})
+                  ORDER BY id DESC LIMIT 1""", (reg_num, before_id, *ENTRY_ACTIONS, *MOVE_ACTIONS))
+    row = c.fetchone()
+    return row[0] if row else None
+
+
+def rollup_logs(conn, now=None):
+    """
+    Folds raw log rows from completed hours into the hourly/daily rollups.
+    Incremental: a watermark (last rolled-up log id) makes each row count once.
+
+    Returns:
+        Number of raw rows rolled up.
+    """
+    now = now or datetime.datetime.now()
+    cutoff = now.replace(minute=0, second=0, microsecond=0).isoformat()
+    c = conn.cursor()
+
+    watermark = int(_get_state(c, "rollup_watermark", 0))
+    occupancy = {size: int(_get_state(c, f"occupancy:{size}", 0)) for size in SIZE_CLASSES}
+
+    c.execute("SELECT slot_id, size_type FROM slots")
+    slot_sizes = dict(c.fetchall())
+
+    c.execute("SELECT id, reg_num, slot_id, action, timestamp FROM logs WHERE id > ? ORDER BY id", (watermark,))
+    hourly = {}
+    last_id = watermark
+    for log_id, reg_num, slot_id, action, ts in c.fetchall():
+        if not ts:
+            # No hour to count it in; skipped, but the watermark moves past it
+            last_id = log_id
+            continue
+        # Stop at the current (incomplete) hour - it is picked up next run
+        if ts >= cutoff:
+            break
+        last_id = log_id
+        bucket = ts[:13] + ":00"
+
+        if action in RESET_ACTIONS:
+            for size in SIZE_CLASSES:
+                occupancy[size] = 0
+                hourly.setdefault((bucket, size), [0, 0, 0, 0])[3] = 0
+            continue
+
+        size = slot_sizes.get(slot_id)
+        if size not in occupancy:
+            continue
+        counts = hourly.setdefault((bucket, size), [0, 0, 0, 0])
+        counts[2] += 1
+        if action in ENTRY_ACTIONS:
+            counts[0] += 1
+            occupancy[size] += 1
+        elif action in EXIT_ACTIONS:
+            counts[1] += 1
+            occupancy[size] = max(0, occupancy[size] - 1)
+        elif action in MOVE_ACTIONS:
+            old_size = slot_sizes.get(_previous_slot(c, reg_num, log_id))
+            if old_size in occupancy and old_size != size:
+                occupancy[old_size] = max(0, occupancy[old_size] - 1)
+                occupancy[size] += 1
+                hourly.setdefault((bucket, old_size), [0, 0, 0, 0])[3] = occupancy[old_size]
+        counts[3] = occupancy[size]
+
+    if last_id == watermark:
+        return 0
+
+    c.executemany('''INSERT INTO log_rollup_hourly (bucket, size_type, entries, exits, events, occupancy_end)
+                     VALUES (?, ?, ?, ?, ?, ?)
+                     ON CONFLICT (bucket, size_type) DO UPDATE SET
+                        entries = entries + excluded.entries,
+                        exits = exits + excluded.exits,
+                        events = events + excluded.events,
+                        occupancy_end = excluded.occupancy_end''',
+                  [(b, s, e, x, n, o) for (b, s), (e, x, n, o) in hourly.items()])
+
+    # Re-derive the daily rows for every day that changed
+    days = sorted({b[:10] for b, _ in hourly})
+    for day in days:
+        c.execute('''INSERT OR REPLACE INTO log_rollup_daily (day, size_type, entries, exits, events, peak_occupancy)
+                     SELECT substr(bucket, 1, 10), size_type, SUM(entries), SUM(exits), SUM(events), MAX(occupancy_end)
+                     FROM log_rollup_hourly WHERE bucket LIKE ? GROUP BY size_type''', (day + "%",))
+
+    _set_state(c, "rollup_watermark", last_id)
+    for size, value in occupancy.items():
+        _set_state(c, f"occupancy:{size}", value)
+    conn.commit()
+    return last_id - watermark
+
+
+def _archive_path(archive_dir, day):
+    return os.path.join(archive_dir, f"logs-{day}.jsonl.gz")
+
+
+def _write_archives(archive_dir, rows, offsets):
+    """
+    Appends rows to their day's archive as one new gzip member, after cutting
+    the file back to `offsets[day]` so a rerun of an interrupted pass
+    rewrites its own member instead of adding a second copy.
+    """
+    by_day = {}
+    for row in rows:
+        by_day.setdefault(row[4][:10], []).append(row)
+    os.makedirs(archive_dir, exist_ok=True)
+    for day, day_rows in by_day.items():
+        path = _archive_path(archive_dir, day)
+        with open(path, "ab") as raw:
+            raw.truncate(offsets.get(day, 0))
+            # Appending a new gzip member keeps earlier archives for the same day readable
+            with gzip.open(raw, "wt", encoding="utf-8") as f:
+                for log_id, reg_num, slot_id, action, ts in day_rows:
+                    f.write(json.dumps({"id": log_id, "reg_num": reg_num, "slot_id": slot_id,
+                                        "action": action, "timestamp": ts}) + "\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+
+
+def archive_old_logs(conn, now=None, retention_days=RAW_RETENTION_DAYS, archive_dir=ARCHIVE_DIR):
+    """
+    Moves raw rows older than the retention window into one gzip'd JSONL file
+    per day (the day partitions), then deletes them. Only rows already folded
+    into the rollups are touched.
+
+    Crash-safe in three steps: the pass (rows chosen, file sizes) is recorded
+    first, then the archives are written, then the rows are deleted in the
+    same transaction that advances the archive watermark. A pass found still
+    pending is redone from its record, so no row is archived twice.
+
+    Returns:
+        Number of rows archived.
+    """
+    c = conn.cursor()
+    archived = 0
+    pending = _get_state(c, "archive_pending", None)
+    if pending:
+        pending = json.loads(pending)
+        print(f"[LogRetention] Redoing interrupted archive pass up to log id {pending['last_id']}")
+        archived += _archive_pass(conn, pending, archive_dir)
+
+    now = now or datetime.datetime.now()
+    cutoff = (now - datetime.timedelta(days=retention_days)).replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+    watermark = int(_get_state(c, "rollup_watermark", 0))
+    c.execute("SELECT MAX(id) FROM logs WHERE timestamp < ? AND id <= ?", (cutoff, watermark))
+    last_id = c.fetchone()[0]
+    if last_id is None:
+        return archived
+
+    c.execute("SELECT DISTINCT substr(timestamp, 1, 10) FROM logs WHERE timestamp < ? AND id <= ?", (cutoff, last_id))
+    offsets = {}
+    for (day,) in c.fetchall():
+        path = _archive_path(archive_dir, day)
+        offsets[day] = os.path.getsize(path) if os.path.exists(path) else 0
+    pending = {"last_id": last_id, "cutoff": cutoff, "offsets": offsets}
+    _set_state(c, "archive_pending", json.dumps(pending))
+    conn.commit()
+    return archived + _archive_pass(conn, pending, archive_dir)
+
+
+def _archive_pass(conn, pending, archive_dir):
+    c = conn.cursor()
+    c.execute("SELECT id, reg_num, slot_id, action, timestamp FROM logs WHERE timestamp < ? AND id <= ? ORDER BY id",
+              (pending["cutoff"], pending["last_id"]))
+    rows = c.fetchall()
+    _write_archives(archive_dir, rows, pending["offsets"])
+
+    c.executemany("DELETE FROM logs WHERE id = ?", [(r[0],) for r in rows])
+    _set_state(c, "archive_watermark", pending["last_id"])
+    c.execute("DELETE FROM log_rollup_state WHERE key = 'archive_pending'")
+    conn.commit()
+    return len(rows)
+
+
+def prune_hourly_rollups(conn, now=None, retention_days=HOURLY_RETENTION_DAYS):
+    now = now or datetime.datetime.now()
+    cutoff = (now - datetime.timedelta(days=retention_days)).isoformat()
+    c = conn.cursor()
+    c.execute("DELETE FROM log_rollup_hourly WHERE bucket < ?", (cutoff,))
+    conn.commit()
+    return c.rowcount
+
+
+def compact_logs(db_name=DB_NAME, now=None, vacuum=False, archive_dir=ARCHIVE_DIR):
+    """Runs one full retention pass: rollup, archive, prune."""
+    t0 = time.perf_counter()
+    with sqlite3.connect(db_name) as conn:
+        init_retention_tables(conn)
+        rolled = rollup_logs(conn, now)
+        archived = archive_old_logs(conn, now, archive_dir=archive_dir)
+        pruned = prune_hourly_rollups(conn, now)
+    if vacuum and archived:
+        # VACUUM can't run inside a transaction
+        conn = sqlite3.connect(db_name, isolation_level=None)
+        conn.execute("VACUUM")
+        conn.close()
+    elapsed = (time.perf_counter() - t0) * 1000
+    print(f"[LogRetention] Rolled up {rolled}, archived {archived}, pruned {pruned} hourly rows ({elapsed:.0f} ms)")
+    return {"rolled_up": rolled, "archived": archived, "pruned_hourly": pruned}
+
+
+def start_compaction_thread(db_name=DB_NAME, interval=COMPACTION_INTERVAL, archive_dir=ARCHIVE_DIR):
+    """Runs compact_logs() now and then every `interval` seconds in the background."""
+    def loop():
+        while True:
+            try:
+                compact_logs(db_name, archive_dir=archive_dir)
+            except Exception as e:
+                print(f"[LogRetention] Compaction failed: {e}")
+            time.sleep(interval)
+
+    t = threading.Thread(target=loop, name="log-compaction", daemon=True)
+    t.start()
+    return t
+
+
+if __name__ == "__main__":
+    import sys
+    compact_logs(vacuum="--vacuum" in sys.argv)
@@ -0,0 +1,239 @@
+"""
+Columnar, NumPy-backed mirror of a lot's slot table.
+
+Status, size class and entry time live in parallel arrays. A status x size
+count matrix and per-status position arrays are built in one vectorized pass
+per reload, so availability per size class and utilization are slices of
+it, and "rejected for longer than X" only compares that status's timestamps.
+
+Run:
+    python lot_state.py [--slots 100000]
+"""
+import os
+import sys
+import time
+import sqlite3
+import datetime
+import threading
+import numpy as np
+
+DB_NAME = "parking.db"
+
+STATUSES = ("free", "reserved", "occupied", "misuse", "rejected")
+SIZES = ("small", "medium", "large")
+STATUS_CODES = {s: i for i, s in enumerate(STATUSES)}
+SIZE_CODES = {s: i for i, s in enumerate(SIZES)}
+# Values outside the known sets get the code one past the end
+UNKNOWN_STATUS = len(STATUSES)
+UNKNOWN_SIZE = len(SIZES)
+# Entry time for slots without one: sorts after every real cutoff
+NO_ENTRY = np.iinfo(np.int64).max
+
+# Seconds between PRAGMA data_version checks (a reload reads every slot)
+FRESHNESS_INTERVAL = float(os.environ.get("LOT_STATE_FRESHNESS_SECONDS", "0.5"))
+
+
+def _encode(values, codes, unknown):
+    """Maps a column of strings to small ints via np.unique (one dict lookup per distinct value)."""
+    if not len(values):
+        return np.empty(0, np.intp)
+    uniques, inverse = np.unique(np.array(values, dtype=object).astype(str), return_inverse=True)
+    table = np.array([codes.get(u, unknown) for u in uniques], np.intp)
+    return table[inverse]
+
+
+class Snapshot:
+    """
+    One load of the slot table. Never modified once built (the arrays are
+    read-only), so a reader holding one sees a consistent lot however many
+    reloads happen meanwhile.
+    """
+
+    __slots__ = ("slot_ids", "status", "size", "entry_ts", "counts", "by_status", "loads")
+
+    def __init__(self, slot_ids, status, size, entry_ts, counts, by_status, loads):
+        for array in (slot_ids, status, size, entry_ts, counts, *by_status.values()):
+            array.flags.writeable = False
+        self.slot_ids = slot_ids
+        self.status = status
+        self.size = size
+        # Entry time as epoch seconds (naive local time, like the stored ISO strings)
+        self.entry_ts = entry_ts
+        # counts[status, size]: every summary query is a slice of this
+        self.counts = counts
+        # Slot positions per status code
+        self.by_status = by_status
+        self.loads = loads
+
+    @classmethod
+    def from_rows(cls, rows, loads):
+        """From (slot_id, size_type, status, entry_time) rows."""
+        slot_ids, sizes, statuses, entry_times = zip(*rows) if rows else ((), (), (), ())
+        times = np.array(entry_times, dtype="datetime64[us]").astype("datetime64[s]")
+        entry_ts = times.astype(np.int64)
+        entry_ts[np.isnat(times)] = NO_ENTRY
+        status = _encode(statuses, STATUS_CODES, UNKNOWN_STATUS)
+        size = _encode(sizes, SIZE_CODES, UNKNOWN_SIZE)
+        n_sizes = len(SIZES) + 1
+        counts = np.bincount(status * n_sizes + size, minlength=(len(STATUSES) + 1) * n_sizes)
+        # Sorted once so expiry checks only touch that status
+        order = np.argsort(status, kind="stable")
+        bounds = np.searchsorted(status[order], np.arange(len(STATUSES) + 2))
+        by_status = {code: order[bounds[code]:bounds[code + 1]] for code in range(len(STATUSES))}
+        return cls(np.array(slot_ids, dtype=object), status, size, entry_ts,
+                   counts.reshape(len(STATUSES) + 1, n_sizes), by_status, loads)
+
+
+class LotState:
+    """
+    Arrays for one lot database, reloaded when the database changes.
+
+    A reload builds a new Snapshot and swaps the one reference, so queries
+    read everything from a single snapshot without taking the lock.
+    """
+
+    def __init__(self, db_name=DB_NAME, freshness_interval=FRESHNESS_INTERVAL):
+        self.db_name = db_name
+        self.freshness_interval = freshness_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._data_version = None
+        self._checked_at = 0.0
+        self._snapshot = Snapshot.from_rows([], 0)
+        self.load_ms = 0.0
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        return self._conn
+
+    def snapshot(self):
+        """The current arrays, consistent with each other (doesn't refresh)."""
+        return self._snapshot
+
+    # Single-array reads of the current snapshot; take snapshot() to read several
+    slot_ids = property(lambda self: self._snapshot.slot_ids)
+    status = property(lambda self: self._snapshot.status)
+    size = property(lambda self: self._snapshot.size)
+    entry_ts = property(lambda self: self._snapshot.entry_ts)
+    counts = property(lambda self: self._snapshot.counts)
+    loads = property(lambda self: self._snapshot.loads)
+
+    def load_rows(self, rows):
+        """Replaces the arrays from (slot_id, size_type, status, entry_time) rows."""
+        t0 = time.perf_counter()
+        self._snapshot = Snapshot.from_rows(rows, self._snapshot.loads + 1)
+        self.load_ms = (time.perf_counter() - t0) * 1000
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self._data_version is not None and now - self._checked_at < self.freshness_interval:
+            return
+        with self._lock:
+            conn = self._connection()
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            self._checked_at = now
+            if force or data_version != self._data_version:
+                rows = conn.execute("SELECT slot_id, size_type, status, entry_time FROM slots ORDER BY slot_id").fetchall()
+                self.load_rows(rows)
+                self._data_version = data_version
+
+    # --- Vectorized queries (each reads one snapshot; pass one to share it) ---
+
+    def counts_by_status(self, snap=None):
+        counts = (snap or self._snapshot).counts[:len(STATUSES)].sum(axis=1)
+        return {s: int(n) for s, n in zip(STATUSES, counts)}
+
+    def capacity_by_size(self, snap=None):
+        counts = (snap or self._snapshot).counts[:, :len(SIZES)].sum(axis=0)
+        return {s: int(n) for s, n in zip(SIZES, counts)}
+
+    def available_by_size(self, snap=None):
+        counts = (snap or self._snapshot).counts[STATUS_CODES["free"], :len(SIZES)]
+        return {s: int(n) for s, n in zip(SIZES, counts)}
+
+    def utilization(self, snap=None):
+        snap = snap or self._snapshot
+        total = len(snap.status)
+        occupied = int(snap.counts[STATUS_CODES["occupied"]].sum())
+        return round(occupied / total * 100, 1) if total else 0
+
+    def expired(self, status, older_than_seconds, now=None):
+        """slot_ids whose status is `status` and whose entry_time is older than the cutoff."""
+        snap = self._snapshot
+        now = now or datetime.datetime.now()
+        cutoff = np.datetime64(now, "s").astype(np.int64) - int(older_than_seconds)
+        idx = snap.by_status.get(STATUS_CODES[status])
+        if idx is None or not len(idx):
+            return []
+        return snap.slot_ids[idx[snap.entry_ts[idx] < cutoff]].tolist()
+
+    def summary(self):
+        self.refresh()
+        snap = self._snapshot
+        t0 = time.perf_counter()
+        result = {
+            "total": int(len(snap.status)),
+            "by_status": self.counts_by_status(snap),
+            "capacity_by_size": self.capacity_by_size(snap),
+            "available_by_size": self.available_by_size(snap),
+            "utilization": self.utilization(snap),
+        }
+        result["compute_us"] = round((time.perf_counter() - t0) * 1e6, 1)
+        result["load_ms"] = round(self.load_ms, 2)
+        return result
+
+
+# One mirror per lot database
+_states = {}
+_states_lock = threading.Lock()
+
+
+def get_state(db_name=DB_NAME):
+    state = _states.get(db_name)
+    if state is None:
+        with _states_lock:
+            state = _states.get(db_name)
+            if state is None:
+                state = LotState(db_name)
+                _states[db_name] = state
+    return state
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[sys.argv.index("--slots") + 1]) if "--slots" in sys.argv else 100000
+    rng = np.random.default_rng(1)
+    now = datetime.datetime.now()
+    rows = []
+    for i in range(n):
+        status = STATUSES[rng.integers(0, len(STATUSES))]
+        entry = None if status == "free" else (now - datetime.timedelta(seconds=int(rng.integers(0, 3600)))).isoformat()
+        rows.append((f"Slot{i + 1}", SIZES[i % 3], status, entry))
+
+    state = LotState(":memory:")
+    state.load_rows(rows)
+    print(f"[LotState] Loaded {n} slots in {state.load_ms:.1f} ms")
+
+    runs = 200
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        state.counts_by_status()
+        state.capacity_by_size()
+        state.available_by_size()
+        state.utilization()
+    per = (time.perf_counter() - t0) / runs
+    print(f"[LotState] Summary (counts, capacity, availability, utilization): {per * 1e6:.0f} us")
+
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        expired = state.expired("rejected", 600, now)
+    print(f"[LotState] Rejected > 10 min: {len(expired)} slots in {(time.perf_counter() - t0) / runs * 1e6:.0f} us")
+
+    t0 = time.perf_counter()
+    loop_counts = {}
+    for _, size, status, _ in rows:
+        if status == "free":
+            loop_counts[size] = loop_counts.get(size, 0) + 1
+    print(f"[LotState] Same availability as a Python row loop: "
+          f"{loop_counts == {k: v for k, v in state.available_by_size().items() if v}} "
+          f"(loop {(time.perf_counter() - t0) * 1000:.1f} ms)")
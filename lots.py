@@ -0,0 +1,183 @@
+import os
+import re
+import json
+import threading
+import contextlib
+
+# The original single-lot deployment keeps its database where it always was
+DEFAULT_LOT = "main"
+DEFAULT_DB = "parking.db"
+DEFAULT_LAYOUT = {"small": 10, "medium": 10, "large": 10}
+
+# Every other lot gets its own SQLite file here, so lots never share a write lock
+LOTS_DIR = "lots"
+REGISTRY_FILE = os.path.join(LOTS_DIR, "lots.json")
+
+_LOT_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """
+    Blocking exclusive lock on `path` across processes (gunicorn workers each
+    have their own threading locks).
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a+") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def is_valid_lot_id(lot_id):
+    return bool(isinstance(lot_id, str) and _LOT_ID_RE.match(lot_id))
+
+
+def validate_layout(layout):
+    """Slot count per size class, defaulting missing sizes to 0. Raises ValueError."""
+    if layout is None:
+        return dict(DEFAULT_LAYOUT)
+    if not isinstance(layout, dict):
+        raise ValueError("layout must be an object of slot counts per size")
+    unknown = set(layout) - set(DEFAULT_LAYOUT)
+    if unknown:
+        raise ValueError(f"Unknown sizes in layout: {', '.join(sorted(map(str, unknown)))}")
+    counts = {}
+    for size in DEFAULT_LAYOUT:
+        n = layout.get(size, 0)
+        if isinstance(n, bool) or not isinstance(n, int) or n < 0:
+            raise ValueError(f"layout['{size}'] must be a non-negative integer")
+        counts[size] = n
+    if not sum(counts.values()):
+        raise ValueError("layout must have at least one slot")
+    return counts
+
+
+class LotRegistry:
+    """
+    Registry of parking facilities served by this backend.
+
+    Each lot is a separate SQLite database with its own ParkingAgent, so
+    adding a lot adds capacity without adding contention on existing ones.
+    """
+
+    def __init__(self, registry_file=REGISTRY_FILE):
+        self.registry_file = registry_file
+        self.lock_file = os.path.join(os.path.dirname(registry_file), ".registry.lock")
+        self._lock = threading.Lock()
+        self._agents = {}
+        self._mtime = None
+        self._lots = {DEFAULT_LOT: {"name": "Main Lot", "layout": DEFAULT_LAYOUT}}
+        self._load()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.registry_file).st_mtime_ns
+            with open(self.registry_file, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        # Swapped whole: readers iterate the dict without the lock
+        self._lots = {**self._lots, **saved}
+        self._mtime = mtime
+
+    def reload(self):
+        """
+        Picks up lots registered by other processes (gunicorn workers each
+        hold a registry; the file is what they share). Cheap when unchanged.
+        """
+        try:
+            mtime = os.stat(self.registry_file).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            with self._lock:
+                self._load()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.registry_file), exist_ok=True)
+        extra = {k: v for k, v in self._lots.items() if k != DEFAULT_LOT}
+        tmp_path = self.registry_file + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(extra, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.registry_file)
+
+    def exists(self, lot_id):
+        if lot_id not in self._lots:
+            self.reload()
+        return lot_id in self._lots
+
+    def db_path(self, lot_id):
+        if lot_id == DEFAULT_LOT:
+            return DEFAULT_DB
+        return os.path.join(LOTS_DIR, f"{lot_id}.db")
+
+    def layout(self, lot_id):
+        return self._lots[lot_id]["layout"]
+
+    def list_lots(self):
+        return [{"lot_id": lot_id, "name": info["name"], "layout": info["layout"], "db": self.db_path(lot_id)}
+                for lot_id, info in sorted(self._lots.items())]
+
+    def add_lot(self, lot_id, name=None, layout=None, prepare=None):
+        """
+        Registers a new lot. Raises ValueError on a bad or duplicate id or layout.
+
+        Args:
+            prepare: called as prepare(db_path, layout) before the lot is
+                registered (database setup); if it raises, nothing is
+                registered and a database file it created is removed.
+        """
+        if not is_valid_lot_id(lot_id):
+            raise ValueError(f"Invalid lot id '{lot_id}'")
+        layout = validate_layout(layout)
+        db_path = self.db_path(lot_id)
+        # Read, check, prepare and save under the file lock too, or two workers
+        # adding lots at once would each overwrite the other's
+        with self._lock, _file_lock(self.lock_file):
+            # Another worker may have registered lots since we last read the file
+            self._load()
+            if lot_id in self._lots:
+                raise ValueError(f"Lot '{lot_id}' already exists")
+            os.makedirs(LOTS_DIR, exist_ok=True)
+            if prepare is not None:
+                existed = os.path.exists(db_path)
+                try:
+                    prepare(db_path, layout)
+                except Exception:
+                    if not existed:
+                        for path in (db_path, db_path + "-wal", db_path + "-shm"):
+                            if os.path.exists(path):
+                                os.remove(path)
+                    raise
+            info = {"name": name or lot_id, "layout": layout}
+            self._lots = {**self._lots, lot_id: info}
+            self._save()
+        return info
+
+    def get_agent(self, lot_id, base_agent):
+        """Per-lot ParkingAgent sharing base_agent's perception models."""
+        if lot_id == DEFAULT_LOT or base_agent is None:
+            return base_agent
+        agent = self._agents.get(lot_id)
+        if agent is None:
+            with self._lock:
+                agent = self._agents.get(lot_id)
+                if agent is None:
+                    agent = base_agent.for_database(self.db_path(lot_id), lot_id)
+                    self._agents[lot_id] = agent
+        return agent
+
+
+lot_registry = LotRegistry()
@@ -0,0 +1,110 @@
+"""
+Background maintenance for every lot: log compaction, journal snapshots and
+pre-booking expiry.
+
+Exactly one process per deployment runs it. Every server process calls
+start(); the first to take an exclusive lock on LOCK_FILE becomes the owner
+and the rest retry every POLL_SECONDS, so under gunicorn one worker does the
+work and another takes over if it dies. (Don't run gunicorn with --preload:
+threads started in the master don't survive the fork.)
+
+The owner re-reads the lot registry on the same interval, so a lot created
+through POST /lots in any worker gets its threads without a restart.
+"""
+import os
+import time
+import threading
+
+import journal
+import lots
+import log_retention
+import reservations
+
+LOCK_FILE = os.environ.get("MAINTENANCE_LOCK_FILE", os.path.join(lots.LOTS_DIR, "maintenance.lock"))
+POLL_SECONDS = int(os.environ.get("MAINTENANCE_POLL_SECONDS", "30"))
+
+_lock = threading.Lock()
+_lock_file = None
+_started_lots = set()
+_poller = None
+
+
+def _try_lock(path):
+    """Non-blocking exclusive lock held for the life of the process; None if taken."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    f = open(path, "a+")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    f.seek(0)
+    f.truncate()
+    f.write(str(os.getpid()))
+    f.flush()
+    return f
+
+
+def is_owner():
+    return _lock_file is not None
+
+
+def start_lot(lot_id, db_name):
+    """Starts one lot's threads, if this process is the owner and hasn't already."""
+    with _lock:
+        if _lock_file is None or lot_id in _started_lots:
+            return False
+        _started_lots.add(lot_id)
+
+    archive_dir = log_retention.ARCHIVE_DIR if lot_id == lots.DEFAULT_LOT \
+        else os.path.join(log_retention.ARCHIVE_DIR, lot_id)
+    # Rolls up, archives and prunes the logs table periodically
+    log_retention.start_compaction_thread(db_name, archive_dir=archive_dir)
+    # Folds the slot journal into snapshots so recovery replays only the tail
+    journal.start_snapshot_thread(db_name)
+    # Expires pre-bookings not claimed at the gate within their grace period
+    reservations.get_engine(db_name).start_expiry_thread()
+    print(f"[Maintenance] Started background work for lot '{lot_id}'")
+    return True
+
+
+def _start_all():
+    for lot in lots.lot_registry.list_lots():
+        start_lot(lot["lot_id"], lot["db"])
+
+
+def _poll():
+    global _lock_file
+    while True:
+        if _lock_file is None:
+            _lock_file = _try_lock(LOCK_FILE)
+            if _lock_file is not None:
+                print(f"[Maintenance] Took over as owner (pid {os.getpid()})")
+        if _lock_file is not None:
+            # Lots registered by other processes since the last look
+            lots.lot_registry.reload()
+            _start_all()
+        time.sleep(POLL_SECONDS)
+
+
+def start():
+    """Becomes the owner if no other process is, and keeps watching. Returns is_owner()."""
+    global _lock_file, _poller
+    with _lock:
+        if _poller is not None:
+            return is_owner()
+        _lock_file = _try_lock(LOCK_FILE)
+        _poller = threading.Thread(target=_poll, name="maintenance", daemon=True)
+    if _lock_file is None:
+        print(f"[Maintenance] Another process owns background work ({LOCK_FILE}); standing by")
+    _poller.start()
+    return is_owner()
+
+
+def stats():
+    return {"owner": is_owner(), "pid": os.getpid(), "lots": sorted(_started_lots)}
@@ -1,10 +1,27 @@
 import sqlite3
 import qrcode
+import qrcode.image.svg
 import os
+import io
+import threading
+import zipfile
+from collections import OrderedDict
+import lots
+from lots import DEFAULT_LOT
 import socket
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 
 DB_NAME = "parking.db"
 QR_DIR = "DEMO FOR PARKING"
+MANIFEST_FILE = os.path.join(QR_DIR, "manifest.json")
+
+# Anything that changes the rendered image must live here (it is part of the hash)
+RENDER_PARAMS = {"version": 1, "error_correction": "L", "box_size": 10, "border": 4}
+QR_MIMETYPES = {"png": "image/png", "svg": "image/svg+xml"}
+# Below this many stale codes, process start-up costs more than it saves
+PARALLEL_THRESHOLD = 200
 
 def get_local_ip():
     try:
@@ -30,74 +47,240 @@ def get_tunnel_url():
     """
     return "https://parking-demo-uepk.onrender.com"
 
-def generate_qrs(force=False, url=None):
+def _qr_hash(slot_id, data_url):
+    """Content hash of everything that affects the rendered PNG."""
+    payload = json.dumps({"slot_id": slot_id, "url": data_url, "render": RENDER_PARAMS}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _load_manifest(manifest_file=MANIFEST_FILE):
+    try:
+        with open(manifest_file, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _atomic_write(file_path, write_fn):
+    """Writes via a temp file in the same directory, then renames into place."""
+    tmp_path = f"{file_path}.tmp{os.getpid()}"
+    try:
+        write_fn(tmp_path)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+def _save_manifest(manifest, manifest_file=MANIFEST_FILE):
+    def write(path):
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    _atomic_write(manifest_file, write)
+
+def slot_qr_url(slot_id, url=None, lot_id=None):
+    """The URL encoded in a slot's QR code. Lots other than the default get /qr/<lot_id>/<slot_id>."""
+    tunnel_url = url if url else get_tunnel_url()
+    if lot_id and lot_id != DEFAULT_LOT:
+        return f"{tunnel_url}/qr/{lot_id}/{slot_id}"
+    return f"{tunnel_url}/qr/{slot_id}"
+
+def qr_etag(slot_id, data_url, fmt="png"):
+    """Stable ETag for a rendered code - known without rendering it."""
+    return f"{_qr_hash(slot_id, data_url)[:32]}-{fmt}"
+
+def _make_qr(data_url):
+    qr = qrcode.QRCode(
+        version=RENDER_PARAMS["version"],
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=RENDER_PARAMS["box_size"],
+        border=RENDER_PARAMS["border"],
+    )
+    qr.add_data(data_url)
+    qr.make(fit=True)
+    return qr
+
+def render_qr_bytes(data_url, fmt="png"):
+    """Renders a QR code in memory. fmt is 'png' or 'svg'."""
+    qr = _make_qr(data_url)
+    buf = io.BytesIO()
+    if fmt == "svg":
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+        img.save(buf)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+        img.save(buf, format="PNG")
+    return buf.getvalue()
+
+def _render_qr(job):
+    """Renders one QR PNG. Top-level so it can run in a worker process."""
+    slot_id, data_url, file_path = job
+    img = _make_qr(data_url).make_image(fill_color="black", back_color="white")
+    _atomic_write(file_path, lambda path: img.save(path, format="PNG"))
+    return slot_id
+
+class QRImageCache:
+    """
+    LRU cache of rendered QR images, bounded by total bytes.
+    Keyed by ETag, so a changed URL or render param is a natural miss.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, slot_id, data_url, fmt="png"):
+        """Returns (etag, image_bytes), rendering on a miss."""
+        etag = qr_etag(slot_id, data_url, fmt)
+        with self._lock:
+            body = self._items.get(etag)
+            if body is not None:
+                self._items.move_to_end(etag)
+                self.hits += 1
+                return etag, body
+            self.misses += 1
+
+        body = render_qr_bytes(data_url, fmt)
+        if len(body) > self.max_bytes:
+            return etag, body
+
+        with self._lock:
+            if etag not in self._items:
+                self._items[etag] = body
+                self.total_bytes += len(body)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.total_bytes -= len(evicted)
+                self.evictions += 1
+        return etag, body
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self.total_bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable write target that hands written bytes back as chunks."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+def iter_qr_archive(slot_ids, url=None, fmt="png", lot_id=None):
+    """
+    Streams a ZIP of QR codes for printing, one slot at a time,
+    so memory stays flat regardless of lot size.
+    """
+    sink = _ChunkSink()
+    # PNGs are already deflated - storing avoids burning CPU for nothing
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+        for slot_id in slot_ids:
+            zf.writestr(f"{slot_id}.{fmt}", render_qr_bytes(slot_qr_url(slot_id, url, lot_id), fmt))
+            yield from sink.drain()
+    yield from sink.drain()
+
+def generate_qrs(force=False, url=None, workers=None, lot_id=None):
     """
     Generate QR codes for all parking slots.
-    
+
+    Generation is incremental: each PNG is keyed by a hash of slot_id, URL and
+    render params in the manifest, and unchanged codes are skipped.
+
     Args:
-        force: If True, regenerate even if QRs exist
+        force: If True, regenerate every code even if its hash is unchanged
         url: Optional base URL to use for the QR code (overrides DB/fallback)
+        workers: Process count for rendering. None = auto (pool only for large lots), 1 = serial
+        lot_id: Generate for this lot (own database, codes in a QR_DIR/<lot_id> subfolder)
+
+    Returns:
+        True if any QR code was (re)generated.
     """
-    if not force and qrs_exist():
-        print(f"[make_qrs] QR codes already exist in '{QR_DIR}'. Skipping.")
-        return False
-    
-    # Create or clear directory
-    if not os.path.exists(QR_DIR):
-        os.makedirs(QR_DIR)
-        print(f"[make_qrs] Created directory: {QR_DIR}")
-    else:
-        for f in os.listdir(QR_DIR):
-            file_path = os.path.join(QR_DIR, f)
-            try:
-                if os.path.isfile(file_path):
-                    os.unlink(file_path)
-            except Exception as e:
-                print(f"[make_qrs] Error deleting {file_path}: {e}")
-        print(f"[make_qrs] Cleared existing QR codes in {QR_DIR}")
+    db_name, qr_dir = DB_NAME, QR_DIR
+    if lot_id and lot_id != DEFAULT_LOT:
+        db_name = lots.lot_registry.db_path(lot_id)
+        qr_dir = os.path.join(QR_DIR, lot_id)
+    manifest_file = os.path.join(qr_dir, "manifest.json")
+
+    if not os.path.exists(qr_dir):
+        os.makedirs(qr_dir)
+        print(f"[make_qrs] Created directory: {qr_dir}")
 
     # Get all slots from database
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(db_name) as conn:
         c = conn.cursor()
         c.execute("SELECT slot_id FROM slots")
-        slots = c.fetchall()
+        slots = [row[0] for row in c.fetchall()]
 
     if not slots:
         print("[make_qrs] No slots found in database.")
         return False
 
     tunnel_url = url if url else get_tunnel_url()
-    generated_count = 0
-    
     print(f"[make_qrs] Using URL: {tunnel_url}")
 
-    # Generate QR for each slot
-    for slot in slots:
-        slot_id = slot[0]
-        url = f"{tunnel_url}/qr/{slot_id}"
-        
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(url)
-        qr.make(fit=True)
+    old_manifest = {} if force else _load_manifest(manifest_file)
+    manifest = {}
+    jobs = []
+    for slot_id in slots:
+        data_url = slot_qr_url(slot_id, tunnel_url, lot_id)
+        digest = _qr_hash(slot_id, data_url)
+        file_path = os.path.join(qr_dir, f"{slot_id}.png")
+        manifest[slot_id] = digest
+        if old_manifest.get(slot_id) != digest or not os.path.exists(file_path):
+            jobs.append((slot_id, data_url, file_path))
 
-        img = qr.make_image(fill_color="black", back_color="white")
-        file_path = os.path.join(QR_DIR, f"{slot_id}.png")
-        img.save(file_path)
-        generated_count += 1
+    # Remove codes for slots that no longer exist
+    for f in os.listdir(qr_dir):
+        if f.endswith('.png') and f[:-4] not in manifest:
+            try:
+                os.unlink(os.path.join(qr_dir, f))
+            except OSError as e:
+                print(f"[make_qrs] Error deleting {f}: {e}")
+
+    if not jobs:
+        print(f"[make_qrs] All {len(slots)} QR codes up to date in '{qr_dir}'. Skipping.")
+        if old_manifest != manifest:
+            _save_manifest(manifest, manifest_file)
+        return False
 
-    print(f"[make_qrs] Generated {generated_count} QR codes in '{QR_DIR}' folder.")
+    if workers is None:
+        workers = (os.cpu_count() or 1) if len(jobs) >= PARALLEL_THRESHOLD else 1
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            generated_count = sum(1 for _ in pool.map(_render_qr, jobs, chunksize=32))
+    else:
+        generated_count = sum(1 for _ in map(_render_qr, jobs))
+
+    _save_manifest(manifest, manifest_file)
+    print(f"[make_qrs] Generated {generated_count} QR codes in '{qr_dir}' folder "
+          f"({len(slots) - generated_count} unchanged, workers={workers}).")
     return True
 
 if __name__ == "__main__":
     import sys
     force = "--force" in sys.argv or "-f" in sys.argv
-    
+    workers = None
+    if "--workers" in sys.argv:
+        workers = int(sys.argv[sys.argv.index("--workers") + 1])
+
     if force:
         print("[make_qrs] Force regeneration enabled.")
-    
-    generate_qrs(force=force)
+
+    lot_id = None
+    if "--lot" in sys.argv:
+        lot_id = sys.argv[sys.argv.index("--lot") + 1]
+
+    generate_qrs(force=force, workers=workers, lot_id=lot_id)
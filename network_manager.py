@@ -10,8 +10,11 @@ from pymongo import MongoClient
 from dotenv import load_dotenv
 import subprocess
 import threading
+import queue
 import sys
 import shutil
+import shlex
+import lots
 
 load_dotenv()
 
@@ -24,10 +27,224 @@ COLLECTION_NAME = "system_config"
 # Cloudflare Configuration
 CLOUDFLARED_URL_WINDOWS = "https://github.com/cloudflare/cloudflared/releases/latest/download/cloudflared-windows-amd64.exe"
 CLOUDFLARED_EXE = "cloudflared.exe"
+TUNNEL_URL_PATTERN = r"https://[a-zA-Z0-9-]+\.trycloudflare\.com"
+
+# Tunnel Supervision
+PROBE_INTERVAL = 10          # seconds between public URL probes
+PROBE_TIMEOUT = 5
+PROBE_FAILURE_THRESHOLD = 3  # consecutive failed probes before a restart
+MAX_RESTART_BACKOFF = 60
+STABLE_SESSION_SECONDS = 60  # sessions longer than this reset the backoff
+URL_DEADLINE = 60            # seconds a fresh process gets to print its URL before a restart
+MONGO_TIMEOUT_MS = 5000      # cloud sync connect, server selection and socket timeout
+
+class TunnelSupervisor:
+    """
+    Keeps a tunnel process alive and its public URL reachable.
+
+    Restarts the process (with exponential backoff) when it exits, when it
+    prints no URL within `url_deadline` seconds, or when the public URL fails
+    `failure_threshold` consecutive probes. Every new URL is handed to
+    `on_url` on a callback thread of its own, so a slow callback never stops
+    the process's stderr from being drained.
+    """
+
+    def __init__(self, cmd, on_url=None, probe_interval=PROBE_INTERVAL, probe_timeout=PROBE_TIMEOUT,
+                 failure_threshold=PROBE_FAILURE_THRESHOLD, max_backoff=MAX_RESTART_BACKOFF,
+                 url_pattern=TUNNEL_URL_PATTERN, url_deadline=URL_DEADLINE):
+        self.cmd = cmd
+        self.on_url = on_url
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.failure_threshold = failure_threshold
+        self.max_backoff = max_backoff
+        self.url_pattern = re.compile(url_pattern)
+        self.url_deadline = url_deadline
+
+        self.process = None
+        self.public_url = None
+        self._lock = threading.Lock()
+        self._url_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        # URLs waiting for on_url, handled in order by one thread
+        self._url_queue = queue.Queue()
+
+        # Metrics
+        self.started_at = None
+        self.session_started = None
+        self.connected_seconds = 0.0
+        self.restarts = 0
+        self.last_restart_reason = None
+        self.probes = 0
+        self.probe_failures = 0
+        self.consecutive_failures = 0
+        self.last_latency_ms = None
+        self._latency_sum_ms = 0.0
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        if self.on_url:
+            threading.Thread(target=self._deliver_urls, daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._terminate()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def wait_for_url(self, timeout=None):
+        self._url_event.wait(timeout)
+        with self._lock:
+            return self.public_url
+
+    def _spawn(self):
+        # We need to capture stderr because cloudflared prints the URL there
+        self.process = subprocess.Popen(
+            self.cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1
+        )
+        print(f"[TunnelSupervisor] Tunnel Started (PID: {self.process.pid})")
+        threading.Thread(target=self._read_output, args=(self.process,), daemon=True).start()
+
+    def _read_output(self, proc):
+        # Keep draining stderr for the whole process lifetime so the pipe never fills up
+        for line in proc.stderr:
+            match = self.url_pattern.search(line)
+            if match and proc is self.process:
+                found_url = match.group(0)
+                with self._lock:
+                    if found_url == self.public_url:
+                        continue
+                    self.public_url = found_url
+                    self.session_started = time.time()
+                    self.consecutive_failures = 0
+                print(f"\n[TunnelSupervisor] FOUND TUNNEL URL: {found_url}\n")
+                self._url_event.set()
+                if self.on_url:
+                    self._url_queue.put(found_url)
+
+    def _deliver_urls(self):
+        while True:
+            found_url = self._url_queue.get()
+            try:
+                self.on_url(found_url)
+            except Exception as e:
+                print(f"[TunnelSupervisor] URL callback failed: {e}")
+
+    def _probe(self):
+        """Returns True if the public URL answered without a gateway error."""
+        url = self.public_url
+        if not url:
+            return True
+        self.probes += 1
+        t0 = time.perf_counter()
+        try:
+            response = requests.get(url, timeout=self.probe_timeout, allow_redirects=False)
+            ok = response.status_code < 500
+        except requests.RequestException:
+            ok = False
+        latency_ms = (time.perf_counter() - t0) * 1000
+        if ok:
+            self.last_latency_ms = round(latency_ms, 1)
+            self._latency_sum_ms += latency_ms
+            self.consecutive_failures = 0
+        else:
+            self.probe_failures += 1
+            self.consecutive_failures += 1
+        return ok
+
+    def _terminate(self):
+        proc = self.process
+        if proc and proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    def _end_session(self):
+        with self._lock:
+            if self.session_started is not None:
+                self.connected_seconds += time.time() - self.session_started
+            self.session_started = None
+            self.public_url = None
+            self._url_event.clear()
+
+    def _run(self):
+        backoff = 1
+        while not self._stop_event.is_set():
+            try:
+                self._spawn()
+            except OSError as e:
+                print(f"[TunnelSupervisor] Failed to start tunnel: {e}")
+                reason = "spawn failed"
+            else:
+                spawned = time.time()
+                next_probe = spawned + self.probe_interval
+                reason = None
+                while not self._stop_event.wait(1):
+                    if self.process.poll() is not None:
+                        reason = f"process exited ({self.process.returncode})"
+                        break
+                    if self.public_url is None and time.time() - spawned > self.url_deadline:
+                        reason = f"no URL within {self.url_deadline}s"
+                        break
+                    if time.time() >= next_probe:
+                        next_probe = time.time() + self.probe_interval
+                        if not self._probe() and self.consecutive_failures >= self.failure_threshold:
+                            reason = f"{self.consecutive_failures} failed probes"
+                            break
+                # A session that stayed up for a while resets the backoff
+                if time.time() - spawned > STABLE_SESSION_SECONDS:
+                    backoff = 1
+
+            self._terminate()
+            self._end_session()
+            if self._stop_event.is_set():
+                break
+
+            self.restarts += 1
+            self.last_restart_reason = reason
+            print(f"[TunnelSupervisor] Tunnel down: {reason}. Restarting in {backoff}s...")
+            self._stop_event.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def metrics(self):
+        now = time.time()
+        with self._lock:
+            session = now - self.session_started if self.session_started else 0.0
+            connected = self.connected_seconds + session
+        proc = self.process
+        successes = self.probes - self.probe_failures
+        return {
+            "running": proc is not None and proc.poll() is None,
+            "public_url": self.public_url,
+            "pid": proc.pid if proc else None,
+            "session_uptime_seconds": round(session, 1),
+            "uptime_seconds": round(now - self.started_at, 1) if self.started_at else 0.0,
+            "connected_seconds": round(connected, 1),
+            # Share of probes the public URL answered; None until one has run
+            "availability": round(successes / self.probes, 4) if self.probes else None,
+            "restarts": self.restarts,
+            "last_restart_reason": self.last_restart_reason,
+            "probes": self.probes,
+            "probe_failures": self.probe_failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_latency_ms": self.last_latency_ms,
+            "avg_latency_ms": round(self._latency_sum_ms / successes, 1) if successes else None,
+        }
+
 
 class NetworkManager:
-    _tunnel_process = None
+    _supervisor = None
     _public_url = None
+    _last_synced_url = None
     _lock = threading.Lock()
 
     @staticmethod
@@ -59,77 +276,51 @@ class NetworkManager:
         return True
 
     @staticmethod
-    def _start_tunnel_thread():
-        """Runs the tunnel in a background thread and captures the URL."""
-        cmd = [CLOUDFLARED_EXE, "tunnel", "--url", "http://localhost:5000"]
-        
-        # Use subprocess to run the command
-        # We need to capture stderr because cloudflared prints the URL there
-        NetworkManager._tunnel_process = subprocess.Popen(
-            cmd, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE, 
-            text=True,
-            bufsize=1
-        )
-        
-        print(f"[NetworkManager] Cloudflare Tunnel Started (PID: {NetworkManager._tunnel_process.pid})")
-        
-        # Regex to find the URL
-        url_pattern = re.compile(r"https://[a-zA-Z0-9-]+\.trycloudflare\.com")
-        
-        # Read stderr line by line to find the URL
-        while True:
-            line = NetworkManager._tunnel_process.stderr.readline()
-            if not line:
-                break
-            
-            # print(f"[Cloudflared] {line.strip()}") # Optional: debug output
-            
-            match = url_pattern.search(line)
-            if match:
-                found_url = match.group(0)
-                print(f"\n[NetworkManager] FOUND TUNNEL URL: {found_url}\n")
-                
-                with NetworkManager._lock:
-                    NetworkManager._public_url = found_url
-                
-                # Sync immediately once found
-                NetworkManager.sync_to_cloud(found_url)
-                
-                # We can stop reading aggressively now, but we need to keep the process alive
-                # In a real app we might want to keep logging
-                
+    def _tunnel_cmd():
+        """cloudflared command line. CLOUDFLARED_CMD overrides it (e.g. a fake tunnel for local testing)."""
+        override = os.environ.get("CLOUDFLARED_CMD")
+        if override:
+            return shlex.split(override)
+        return [CLOUDFLARED_EXE, "tunnel", "--url", "http://localhost:5000"]
+
+    @staticmethod
+    def _on_tunnel_url(found_url):
+        """Called by the supervisor every time the tunnel comes up with a URL."""
+        with NetworkManager._lock:
+            NetworkManager._public_url = found_url
+        NetworkManager.update_db(NetworkManager.get_local_ip(), found_url)
+        NetworkManager.sync_to_cloud(found_url)
+
     @staticmethod
     def get_public_url_auto():
         """
         Orchestrates the download and execution of the tunnel.
         """
         # 1. Download if needed
-        if not NetworkManager._download_cloudflared():
+        if not os.environ.get("CLOUDFLARED_CMD") and not NetworkManager._download_cloudflared():
             return None
-            
-        # 2. Start in background if not already running
-        if NetworkManager._tunnel_process is None:
-            t = threading.Thread(target=NetworkManager._start_tunnel_thread, daemon=True)
-            t.start()
-            
+
+        # 2. Start the supervisor if not already running
+        if NetworkManager._supervisor is None:
+            NetworkManager._supervisor = TunnelSupervisor(NetworkManager._tunnel_cmd(), on_url=NetworkManager._on_tunnel_url)
+            NetworkManager._supervisor.start()
+
             # 3. Wait for URL (with timeout)
             print("[NetworkManager] Waiting for Tunnel URL...")
-            attempts = 0
-            while attempts < 30: # Wait up to 30 seconds
-                with NetworkManager._lock:
-                    if NetworkManager._public_url:
-                        return NetworkManager._public_url
-                time.sleep(1)
-                attempts += 1
-                
-            print("[NetworkManager] Timed out waiting for Tunnel URL.")
-            return None
+            url = NetworkManager._supervisor.wait_for_url(timeout=30)
+            if not url:
+                print("[NetworkManager] Timed out waiting for Tunnel URL.")
+            return url
         else:
             with NetworkManager._lock:
                 return NetworkManager._public_url
 
+    @staticmethod
+    def tunnel_metrics():
+        if NetworkManager._supervisor is None:
+            return {"running": False}
+        return NetworkManager._supervisor.metrics()
+
     @staticmethod
     def update_db(local_ip, public_url):
         with sqlite3.connect(DB_NAME) as conn:
@@ -146,21 +337,54 @@ class NetworkManager:
             conn.commit()
 
     @staticmethod
-    def sync_to_cloud(public_url):
+    def _get_slot_ids(db_name=DB_NAME):
+        try:
+            with sqlite3.connect(db_name) as conn:
+                c = conn.cursor()
+                c.execute("SELECT slot_id FROM slots ORDER BY slot_id")
+                return [r[0] for r in c.fetchall()]
+        except sqlite3.Error:
+            return []
+
+    @staticmethod
+    def _get_lot_slot_ids():
+        """{lot_id: [slot_id, ...]} for every lot other than the default one."""
+        return {lot["lot_id"]: NetworkManager._get_slot_ids(lot["db"])
+                for lot in lots.lot_registry.list_lots() if lot["lot_id"] != lots.DEFAULT_LOT}
+
+    @staticmethod
+    def sync_to_cloud(public_url, force=False):
+        # Deduplicate: the supervisor may report the same URL more than once
+        with NetworkManager._lock:
+            if not force and public_url == NetworkManager._last_synced_url:
+                return
         if not MONGODB_URI:
             print("[NetworkManager] WARNING: MONGODB_URI not set. Cloud sync skipped.")
             return
 
         try:
-            client = MongoClient(MONGODB_URI)
+            # Bounded: a slow Atlas connection must not hold up the callback thread forever
+            client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+                                 connectTimeoutMS=MONGO_TIMEOUT_MS, socketTimeoutMS=MONGO_TIMEOUT_MS)
             db = client[CLUSTER_NAME]
             collection = db[COLLECTION_NAME]
-            
+
+            # Publish the slot set too, so the gateway can precompute its redirect table
+            update = {"tunnel_url": public_url, "last_updated": time.time()}
+            slot_ids = NetworkManager._get_slot_ids()
+            if slot_ids:
+                update["slot_ids"] = slot_ids
+            lot_slots = NetworkManager._get_lot_slot_ids()
+            if lot_slots:
+                update["lots"] = lot_slots
+
             result = collection.update_one(
-                {"config_id": "main_tunnel"}, 
-                {"$set": {"tunnel_url": public_url, "last_updated": time.time()}},
+                {"config_id": "main_tunnel"},
+                {"$set": update},
                 upsert=True
             )
+            with NetworkManager._lock:
+                NetworkManager._last_synced_url = public_url
             print(f"[NetworkManager] Cloud Sync Success. Tunnel URL Updated.")
         except Exception as e:
             print(f"[NetworkManager] Cloud Sync FAILED: {e}")
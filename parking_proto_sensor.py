@@ -6,28 +6,60 @@ import numpy as np
 import easyocr
 import re
 import os
+import json
 import threading
 import time
 import make_qrs # Import the QR generator module
-from flask import Flask, render_template, request, jsonify, redirect, url_for, Response
+import external_sensors
+import log_retention
+import analytics
+import lots
+import plate_index
+import records
+import lot_state
+import throttle
+import batch
+import journal
+import assets
+import compression
+import slot_codec
+import reservations
+import assignment
+import maintenance
+import tempfile
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, g, abort
 from dotenv import load_dotenv
+from jinja2 import FileSystemBytecodeCache
 
 # Load Env Vars explicitly
 load_dotenv()
 
 # --- Project Imports ---
 from agent import ParkingAgent
+from camera import SharedCamera
 from network_manager import NetworkManager
+from startup import StartupOrchestrator
+from event_log import log_event
 
 # 1. Get the absolute path of the directory the script is running from
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
 # 2. Define the absolute path for the templates folder
 TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
 
 # 3. Pass the absolute path when creating the Flask app
-app = Flask(__name__, template_folder=TEMPLATE_DIR)
-app = Flask(__name__, template_folder=TEMPLATE_DIR)
+# (static files are served by static_asset below: fingerprinted + gzipped)
+app = Flask(__name__, template_folder=TEMPLATE_DIR, static_folder=None)
+app = Flask(__name__, template_folder=TEMPLATE_DIR, static_folder=None)
+
+# Compiled templates survive restarts (and are shared by web workers)
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'parking_jinja_cache'))
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+
+asset_manifest = assets.AssetManifest(STATIC_DIR)
+app.jinja_env.globals['asset_url'] = asset_manifest.url
 DB_NAME = "parking.db"
 
 # --- DEPLOYMENT CONTEXT ---
@@ -41,6 +73,23 @@ if IS_RENDER:
 else:
     print("Context: RUNNING LOCALLY")
 
+# 'local'  - this process owns camera + OCR (single-process app.run)
+# 'remote' - stateless web worker; camera + OCR live in perception_service.py
+PERCEPTION_MODE = os.environ.get('PERCEPTION_MODE', 'local').lower()
+IS_WEB_WORKER = PERCEPTION_MODE == 'remote'
+# With several web workers, the rate limiter, the /anpr SingleFlight and the
+# per-lot agents are per worker: limits apply per worker (N workers allow N
+# times the configured rate) and only calls within one worker coalesce. Lots,
+# slots and bookings are shared through the lot registry file and SQLite.
+
+# Per-lane perception, e.g. LANE_PERCEPTION='{"gate2": "qr"}': 'qr' lanes only
+# take QR passes and never run OCR; unlisted lanes use 'image' (QR, then OCR)
+LANE_PERCEPTION = json.loads(os.environ.get('LANE_PERCEPTION', '{}'))
+# Lanes that get their own rate-limit bucket: GATE_LANES='gate1,gate2' plus those above
+KNOWN_LANES = set(LANE_PERCEPTION) | {lane.strip() for lane in os.environ.get('GATE_LANES', '').split(',') if lane.strip()}
+# Peers allowed to report the client address in CF-Connecting-IP (the local cloudflared)
+TRUSTED_PROXIES = {addr.strip() for addr in os.environ.get('TRUSTED_PROXIES', '127.0.0.1,::1').split(',') if addr.strip()}
+
 # MongoDB Config (For Render Redirect)
 MONGODB_URI = os.environ.get("MONGODB_URI")
 CLUSTER_NAME = "SmartParkingParams"
@@ -49,81 +98,40 @@ COLLECTION_NAME = "system_config"
 # --- AGENT INITIALIZATION ---
 # Initialize the Intelligent Agent
 parking_agent = None
-if not IS_RENDER:
+perception_client = None
+if IS_RENDER:
+    print("Skipping Agent Init (Cloud Mode)")
+elif IS_WEB_WORKER:
+    # Decide/act only - perception requests go to the owner process
+    from perception_service import PerceptionClient
+    parking_agent = ParkingAgent(load_ocr=False)
+    perception_client = PerceptionClient()
+    print("Agent Initialized (Web Worker - perception is remote).")
+else:
     print("Initializing Real-Time Parking Agent...")
     parking_agent = ParkingAgent() 
     print("Agent Initialized.")
-else:
-    print("Skipping Agent Init (Cloud Mode)")
 
 # --- SHARED CAMERA SINGLETON ---
-# --- SHARED CAMERA SINGLETON ---
-class SharedCamera:
-    def __init__(self):
-        # Try DSHOW first (Windows), then default
-        print("Attempting to open camera with CAP_DSHOW...")
-        self.cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-        if not self.cap.isOpened():
-             print("CAP_DSHOW failed. Trying default backend...")
-             self.cap = cv2.VideoCapture(0)
-             
-        self.lock = threading.Lock()
-        self.last_frame = None
-        self.is_running = True
-        
-        if not self.cap.isOpened():
-            print("CRITICAL ERROR: Camera 0 could not be opened Check drivers/permissions.")
-        else:
-            print("Camera 0 Opened Successfully.")
-        
-        # Start background reading thread
-        self.thread = threading.Thread(target=self._update_loop, daemon=True)
-        self.thread.start()
-
-    def _update_loop(self):
-        failure_count = 0
-        while self.is_running:
-            if self.cap.isOpened():
-                success, frame = self.cap.read()
-                if success:
-                    with self.lock:
-                        self.last_frame = frame.copy()
-                    failure_count = 0
-                else:
-                    failure_count += 1
-                    if failure_count > 10:
-                        # print("Camera read failed repeatedly. Re-initializing...")
-                        self.cap.release()
-                        time.sleep(1)
-                        self.cap = cv2.VideoCapture(0)
-                        failure_count = 0
-            else:
-                time.sleep(1)
-                self.cap = cv2.VideoCapture(0)
-                
-            time.sleep(0.01) # ~60 FPS cap
-
-    def get_frame(self):
-        with self.lock:
-             if self.last_frame is not None:
-                 return self.last_frame.copy()
-        return None
-
-    def __del__(self):
-        self.is_running = False
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
-
+# (SharedCamera lives in camera.py so the perception service can own it)
 # Global Camera Instance
 camera_system = None
+# Web workers poll shared memory; no point streaming faster than the pump fills it
+FRAME_STREAM_INTERVAL = 0.03
 
-def generate_frames():
+def _frame_source():
     global camera_system
+    if IS_WEB_WORKER:
+        return perception_client
     if camera_system is None:
         camera_system = SharedCamera()
-        
+    return camera_system
+
+def generate_frames():
+    source = _frame_source()
+
     while True:
-        frame = camera_system.get_frame()
+        frame = source.get_frame()
         if frame is None:
             # Send black frame if no camera
             blank = np.zeros((480, 640, 3), dtype=np.uint8)
@@ -145,10 +153,15 @@ def generate_frames():
         # Don't loop too fast if there's no camera
         if frame is None:
             time.sleep(0.5)
+        elif IS_WEB_WORKER:
+            time.sleep(FRAME_STREAM_INTERVAL)
 
-def init_db():
-    with sqlite3.connect(DB_NAME) as conn:
+def init_db(db_name=DB_NAME, layout=None):
+    layout = layout or lots.DEFAULT_LAYOUT
+    with sqlite3.connect(db_name) as conn:
         c = conn.cursor()
+        # WAL lets readers proceed while a gate holds the write lock
+        c.execute("PRAGMA journal_mode=WAL")
         # Create slots table
         c.execute('''CREATE TABLE IF NOT EXISTS slots (
                         slot_id TEXT PRIMARY KEY,
@@ -165,6 +178,9 @@ def init_db():
             c.execute("ALTER TABLE slots ADD COLUMN temp_reg_num TEXT")
         except sqlite3.OperationalError:
             pass # Column likely exists
+        # Plate lookups (exit, verification, misuse) hit these instead of scanning slots
+        c.execute("CREATE INDEX IF NOT EXISTS idx_slots_reg_num ON slots (reg_num)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_slots_temp_reg_num ON slots (temp_reg_num)")
         # Create logs table for analytics
         c.execute('''CREATE TABLE IF NOT EXISTS logs (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -173,44 +189,230 @@ def init_db():
                         action TEXT,
                         timestamp TEXT
                     )''')
+        # Log indexes + rollup tables for analytics history
+        log_retention.init_retention_tables(conn)
+        # Trigger-maintained occupancy counters
+        analytics.init_counter_tables(conn)
+        # Append-only journal of slot changes (slots is its materialized view)
+        journal.init_journal_tables(conn)
+        # Stored results for /entry/batch and /exit/batch replays
+        batch.init_idempotency_table(conn)
+        # Pre-bookings and their version counter
+        reservations.init_booking_tables(conn)
+        # Optional slot geometry (zone, distances) for the assignment policy
+        assignment.init_feature_table(conn)
 
         
         # Initialize slots if empty or count mismatch (Re-configuration)
         c.execute("SELECT count(*) FROM slots")
         count = c.fetchone()[0]
         
-        target_count = 30
+        target_count = sum(layout.values())
         if count != target_count:
             print(f"Migration: Slot count mismatch ({count} vs {target_count}). Re-initializing slots...")
             c.execute("DELETE FROM slots") # Reset slots table
             
             slots_data = []
             
-            # 10 Small (Mini) Slots (Slot1 - Slot10)
-            slots_data.extend([(f'Slot{i}', 'small') for i in range(1, 11)])
-            
-            # 10 Medium (Sedan) Slots (Slot11 - Slot20)
-            slots_data.extend([(f'Slot{i}', 'medium') for i in range(11, 21)])
-            
-            # 10 Large (SUV) Slots (Slot21 - Slot30)
-            slots_data.extend([(f'Slot{i}', 'large') for i in range(21, 31)])
+            # Numbered in layout order: Small (Mini), then Medium (Sedan), then Large (SUV)
+            # Default layout: Slot1-10 small, Slot11-20 medium, Slot21-30 large
+            next_id = 1
+            for size in ('small', 'medium', 'large'):
+                n = layout.get(size, 0)
+                slots_data.extend([(f'Slot{i}', size) for i in range(next_id, next_id + n)])
+                next_id += n
 
             c.executemany("INSERT INTO slots (slot_id, size_type) VALUES (?, ?)", slots_data)
-            print("Initialized 30 Slots (10 Small, 10 Medium, 10 Large).")
+            print(f"Initialized {target_count} Slots ({layout.get('small', 0)} Small, {layout.get('medium', 0)} Medium, {layout.get('large', 0)} Large).")
 
-# If on Render, initialize DB immediately when this module is imported by Gunicorn
-if IS_RENDER:
+# If on Render (or a gunicorn web worker), initialize DB immediately when this module is imported
+if IS_RENDER or IS_WEB_WORKER:
     try:
         init_db()
         print("Render DB Initialization Complete.")
     except Exception as e:
         print(f"Render DB Init Failed: {e}")
+    # No __main__ under gunicorn: one worker (by lock file) runs the background work
+    maintenance.start()
 
 
 
 
 # --- Routes Refactored to use Agent ---
 
+# Tracks background startup phases (populated in __main__)
+startup_orchestrator = StartupOrchestrator()
+
+@app.before_request
+def _track_first_request():
+    startup_orchestrator.mark_first_request()
+
+# --- MULTI-LOT CONTEXT ---
+# Lot-scoped routes are also served under /lots/<lot_id>/... (see bottom of file).
+# Without a prefix they act on the default lot (the original parking.db).
+
+def current_lot():
+    return getattr(g, 'lot_id', lots.DEFAULT_LOT)
+
+def current_db():
+    return lots.lot_registry.db_path(current_lot())
+
+def current_agent():
+    return lots.lot_registry.get_agent(current_lot(), parking_agent)
+
+@app.url_value_preprocessor
+def _pull_lot_id(endpoint, values):
+    if values and 'lot_id' in values:
+        g.lot_id = values.pop('lot_id')
+        if not lots.lot_registry.exists(g.lot_id):
+            abort(404)
+
+# --- RATE LIMITING ---
+# Token bucket per route and client: the client IP, split per gate lane for
+# lanes in KNOWN_LANES. Lane names come from the request, so unknown ones are
+# ignored rather than minting a fresh bucket per value.
+# RATE_LIMITS='{"anpr": {"rate": 1, "burst": 3}}' overrides per route (a missing
+# field keeps the default, null lifts the limit); 'off' disables.
+_rate_limits_env = os.environ.get('RATE_LIMITS', '').strip()
+if _rate_limits_env.lower() == 'off':
+    rate_limiter = throttle.RateLimiter({})
+else:
+    try:
+        _overrides = json.loads(_rate_limits_env or '{}')
+        if not isinstance(_overrides, dict):
+            raise ValueError("RATE_LIMITS must be a JSON object")
+        rate_limiter = throttle.RateLimiter({**throttle.DEFAULT_LIMITS, **_overrides})
+    except ValueError as e:
+        print(f"[RateLimit] Ignoring invalid RATE_LIMITS ({e}); using defaults")
+        rate_limiter = throttle.RateLimiter()
+# Concurrent /anpr calls for the same lot and percept share one OCR run
+anpr_flight = throttle.SingleFlight()
+
+def _request_lane():
+    body = request.get_json(silent=True)
+    lane = request.args.get('lane') or (body.get('lane') if isinstance(body, dict) else None)
+    return lane if isinstance(lane, str) else None
+
+def _client_address():
+    # The tunnel connects from loopback; anyone else could forge the header
+    if request.remote_addr in TRUSTED_PROXIES:
+        return request.headers.get('CF-Connecting-IP') or request.remote_addr
+    return request.remote_addr
+
+@app.before_request
+def _rate_limit():
+    view = app.view_functions.get(request.endpoint)
+    # Lot-scoped aliases (lot_<endpoint>) share the view, and so the limit
+    route = getattr(view, '__name__', None)
+    if route not in rate_limiter.limits:
+        return None
+    lane = _request_lane()
+    client = _client_address()
+    if lane in KNOWN_LANES:
+        client = f"{client}:lane:{lane}"
+    wait = rate_limiter.check(route, f"{current_lot()}:{client}")
+    if wait:
+        retry_after = max(1, int(wait + 0.999))
+        print(f"[RateLimit] {route} rejected for {client} (retry in {wait:.1f}s)")
+        return jsonify({"error": "Too many requests", "retry_after": retry_after}), 429, {'Retry-After': str(retry_after)}
+    return None
+
+@app.route('/api/journal', methods=['GET'])
+def journal_stats():
+    """
+    Slot journal position and snapshots; ?verify=1 also lists slots that
+    differ from the journal (repair with `python journal.py rebuild <db>`).
+    """
+    result = journal.stats(current_db())
+    if request.args.get('verify'):
+        result['mismatched_slots'] = journal.verify(current_db())
+    return jsonify(result)
+
+@app.route('/api/limits', methods=['GET'])
+def limits_stats():
+    """
+    Rate limit table with allowed/rejected counts, /anpr coalescing counters,
+    and how long gate writes waited for the database write lock.
+    """
+    return jsonify({"limits": rate_limiter.stats(), "anpr_single_flight": anpr_flight.stats(),
+                    "write_lock": throttle.write_lock_waits.stats()})
+
+@app.route('/api/bookings', methods=['POST'])
+def create_booking():
+    """
+    Pre-books a size class for a time window.
+    Body: {"reg_num", "size", "start", "end"} (ISO times). 409 when that size is full.
+    """
+    data = request.get_json(silent=True) or {}
+    reg_num = (data.get('reg_num') or '').replace(" ", "")
+    if not reg_num or not data.get('start') or not data.get('end'):
+        return jsonify({"error": "reg_num, start and end are required"}), 400
+    try:
+        booking = reservations.get_engine(current_db()).book(reg_num, data.get('size', 'medium'), data['start'], data['end'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if booking is None:
+        return jsonify({"error": f"No {data.get('size', 'medium')} capacity left in that window"}), 409
+    return jsonify({**booking, "start": booking['start'].isoformat(), "end": booking['end'].isoformat()}), 201
+
+@app.route('/api/bookings', methods=['GET'])
+def list_bookings():
+    engine = reservations.get_engine(current_db())
+    return jsonify({"bookings": engine.upcoming(), "stats": engine.stats()})
+
+@app.route('/api/bookings/availability', methods=['GET'])
+def booking_availability():
+    """
+    How many more bookings of ?size fit over all of [?start, ?end).
+    """
+    size = request.args.get('size', 'medium')
+    start, end = request.args.get('start'), request.args.get('end')
+    if not start or not end:
+        return jsonify({"error": "start and end are required"}), 400
+    try:
+        available = reservations.get_engine(current_db()).available(size, start, end)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"size": size, "start": start, "end": end, "available": available})
+
+@app.route('/api/bookings/<int:booking_id>', methods=['DELETE'])
+def cancel_booking(booking_id):
+    if not reservations.get_engine(current_db()).cancel(booking_id):
+        return jsonify({"error": "No held booking with that id"}), 404
+    return jsonify({"message": "Booking cancelled", "booking_id": booking_id})
+
+@app.route('/api/assignment', methods=['GET'])
+def assignment_stats():
+    """
+    Active slot assignment policy, its weights and decision timings.
+    """
+    return jsonify(assignment.get_assigner(current_db()).stats())
+
+@app.context_processor
+def _inject_lot_prefix():
+    lot_id = current_lot()
+    return {'lot_id': lot_id, 'lot_prefix': '' if lot_id == lots.DEFAULT_LOT else f'/lots/{lot_id}'}
+
+# gzip/brotli for JSON and HTML bodies, negotiated per request
+response_compressor = compression.ResponseCompressor()
+
+@app.after_request
+def _compress_response(response):
+    return response_compressor.apply(request, response)
+
+@app.route('/static/<path:filename>')
+def static_asset(filename):
+    return asset_manifest.response(filename)
+
+@app.route('/ready')
+def ready():
+    """
+    Readiness probe: per-phase startup status and timings.
+    """
+    report = startup_orchestrator.report()
+    report['maintenance'] = maintenance.stats()
+    return jsonify(report), (200 if report['ready'] else 503)
+
 @app.route('/')
 def index():
     return redirect(url_for('slots_dashboard'))
@@ -221,17 +423,8 @@ def video_feed():
 
 @app.route('/slots')
 def slots_dashboard():
-    with sqlite3.connect(DB_NAME) as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        c.execute("SELECT * FROM slots ORDER BY slot_id")
-        slots = c.fetchall()
-        
-        # Calculate stats
-        total = len(slots)
-        occupied = sum(1 for s in slots if s['status'] == 'occupied')
-        utilization = round((occupied / total) * 100, 1) if total > 0 else 0
-        
+    # Stats come from the running counters - no slot scan
+    utilization = analytics.get_occupancy(current_db())['utilization']
     return render_template('index_sensor.html', utilization=utilization)
 
 @app.route('/dashboard')
@@ -240,11 +433,8 @@ def dashboard_view():
 
 @app.route('/status')
 def allotment_status():
-    with sqlite3.connect(DB_NAME) as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        c.execute("SELECT * FROM slots ORDER BY slot_id")
-        slots = c.fetchall()
+    with sqlite3.connect(current_db()) as conn:
+        slots = records.fetch_slots(conn)
     return render_template('status.html', slots=slots)
 
 @app.route('/entry', methods=['POST'])
@@ -259,17 +449,18 @@ def entry():
         }
         
         # 2. DECIDE: Agent makes a decision
-        actions = parking_agent.decide(percepts)
+        actions = current_agent().decide(percepts)
         
         # 3. ACT: System executes Agent's chosen action
         response = None
         for action in actions:
-            result = parking_agent.act(action)
+            result = current_agent().act(action)
             
-            if action['type'] == 'GRANT_ACCESS':
-                response = jsonify({"message": "Entry successful", "assigned_slot": result['assigned_slot'], "size": percepts['vehicle_size']})
-            elif action['type'] == 'DENY_ACCESS':
+            if result.get('status') == 'error':
                 return jsonify({"error": result['message']}), 400
+            if action.type == 'GRANT_ACCESS':
+                response = jsonify({"message": "Entry successful", "assigned_slot": result['assigned_slot'],
+                                    "size": action.data.size, "booking_id": result.get('booking_id')})
                 
         if response:
             return response
@@ -282,45 +473,63 @@ def entry():
 
 @app.route('/exit', methods=['POST'])
 def exit_vehicle():
-    # Currently simplest implementation - direct DB update. 
-    # Can be moved to Agent.act('RELEASE_SLOT') later.
     try:
         data = request.json
         reg_num = data.get('reg_num')
         if reg_num:
             reg_num = reg_num.replace(" ", "")
         if not reg_num: return jsonify({"error": "Registration number required"}), 400
-            
-        with sqlite3.connect(DB_NAME) as conn:
-            c = conn.cursor()
-            c.execute("SELECT slot_id, entry_time FROM slots WHERE reg_num = ?", (reg_num,))
-            row = c.fetchone()
-            if not row: return jsonify({"error": "Vehicle not found"}), 404
-            slot_id, entry_time = row
-            
-            duration_sec = 0
-            if entry_time:
-                try:
-                    entry_dt = datetime.datetime.fromisoformat(entry_time)
-                    duration_sec = (datetime.datetime.now() - entry_dt).total_seconds()
-                except:
-                    pass
-            
-            c.execute("UPDATE slots SET status = 'free', reg_num = NULL, entry_time = NULL, is_verified = 0 WHERE slot_id = ?", (slot_id,))
-            conn.commit()
-            
-        return jsonify({"message": "Exit successful", "freed_slot": slot_id, "duration_seconds": int(duration_sec)})
+        # Tolerate an OCR confusion against the vehicles actually parked here;
+        # anything further off is only suggested, never released
+        with sqlite3.connect(current_db()) as conn:
+            plate, candidate = plate_index.get_index(current_db()).resolve_exit(conn.cursor(), reg_num)
+        if plate is None:
+            return jsonify({"error": "Vehicle not found", "candidate": candidate}), 404
+
+        result = current_agent().act(records.Action('RELEASE_SLOT', plate))
+        if result['status'] == 'not_found':
+            return jsonify({"error": result['message']}), 404
+        return jsonify({"message": "Exit successful", "freed_slot": result['freed_slot'],
+                        "duration_seconds": result['duration_seconds']})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _run_batch(kind):
+    """
+    Body: {"events": [{"reg_num": ..., "idempotency_key": ..., "timestamp": ...}, ...]}
+    (or the bare list). Per-event results come back in the same order.
+    """
+    data = request.get_json(silent=True)
+    events = data.get('events') if isinstance(data, dict) else data
+    if not isinstance(events, list):
+        return jsonify({"error": "Expected a list of events"}), 400
+    if len(events) > batch.MAX_BATCH_EVENTS:
+        return jsonify({"error": f"At most {batch.MAX_BATCH_EVENTS} events per batch"}), 413
+    agent = current_agent()
+    if agent is None:
+        return jsonify({"error": "Agent not loaded"}), 503
+    try:
+        return jsonify(batch.run_batch(agent, kind, events))
+    except Exception as e:
+        print(f"BATCH {kind.upper()} ERROR: {e}")
+        return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
+
+@app.route('/entry/batch', methods=['POST'])
+def entry_batch():
+    return _run_batch('entry')
+
+@app.route('/exit/batch', methods=['POST'])
+def exit_batch():
+    return _run_batch('exit')
+
 @app.route('/reset', methods=['POST'])
 def reset_parking():
     try:
         # Directly create the action for the agent
-        action = {'type': 'RESET_ALL'}
+        action = records.Action('RESET_ALL')
         
         # Agent acts on the command
-        result = parking_agent.act(action)
+        result = current_agent().act(action)
         
         if result and result.get('status') == 'success':
              return jsonify(result)
@@ -335,28 +544,57 @@ def reset_parking():
 def anpr():
     print("ANPR Request Received (Agent Perception)")
     try:
-        global camera_system
-        if camera_system is None:
-             camera_system = SharedCamera()
-             
-        # Capture input (Use SHARED CAMERA resource)
-        frame = camera_system.get_frame()
-        
-        if frame is None:
-            return jsonify({"error": "Failed to capture image (Camera busy or off)"}), 500
-            
-        # 1. PERCEIVE: Send Image to Agent
-        perception_result = parking_agent.perceive('image', frame)
-        
-        if 'error' in perception_result:
-            return jsonify(perception_result), 400
-            
-        return jsonify(perception_result)
+        percept = LANE_PERCEPTION.get(_request_lane(), 'image')
+        # A stuck button fires /anpr repeatedly: callers arriving while a capture
+        # is in flight get that result instead of queueing another OCR run
+        (perception_result, status), shared = anpr_flight.do((current_lot(), percept), lambda: _perceive_gate(percept))
+        if shared:
+            print("[ANPR] Coalesced onto in-flight request")
+        return jsonify(perception_result), status
 
     except Exception as e:
         print(f"ANPR CRASH: {e}")
         return jsonify({"error": f"Internal Error: {str(e)}"}), 500
 
+def _perceive_gate(percept):
+    """
+    Returns:
+        (perception_result, http_status)
+    """
+    if IS_WEB_WORKER:
+        # Camera + OCR are owned by the perception service
+        perception_result = perception_client.anpr(percept)
+        return perception_result, 400 if 'error' in perception_result else 200
+
+    # Capture input (Use SHARED CAMERA resource)
+    frame = _frame_source().get_frame()
+
+    if frame is None:
+        return {"error": "Failed to capture image (Camera busy or off)"}, 500
+
+    # 1. PERCEIVE: Send Image to Agent
+    perception_result = current_agent().perceive(percept, frame)
+    return perception_result, 400 if 'error' in perception_result else 200
+
+@app.route('/mobile')
+def mobile_app():
+    """
+    Driver-facing app (the gateway's /qr/app target).
+    """
+    return render_template('mobile_app.html')
+
+@app.route('/api/perception', methods=['GET'])
+def perception_stats():
+    """
+    OCR preprocessing profile and per-stage timings, QR decoder counters.
+    """
+    if IS_WEB_WORKER:
+        return jsonify(perception_client.request("stats"))
+    if parking_agent is None:
+        return jsonify({"error": "Perception not loaded"}), 503
+    return jsonify({"preprocess": parking_agent.preprocess.stats(), "qr": parking_agent.qr_decoder.stats(),
+                    "lanes": LANE_PERCEPTION})
+
 @app.route('/scan/<slot_id>')
 def scan_slot(slot_id):
     """
@@ -369,8 +607,10 @@ def process_verification():
     try:
         slot_id = request.form.get('slot_id')
         user_reg = request.form.get('reg_num').replace(" ", "").upper()
+        # A confusable character (0/O, 8/B, ...) shouldn't turn a driver into a misuse case
+        user_reg = plate_index.get_index(current_db()).resolve(user_reg, plate_index.CONFUSION_MATCH_MAX_DISTANCE)
         
-        with sqlite3.connect(DB_NAME) as conn:
+        with sqlite3.connect(current_db()) as conn:
             c = conn.cursor()
             c.execute("SELECT status, reg_num FROM slots WHERE slot_id = ?", (slot_id,))
             row = c.fetchone()
@@ -387,12 +627,19 @@ def process_verification():
                 # SMART CORRECTION: 
                 # Check if this vehicle is currently blocking another slot (Misuse/Rejected)
                 # If so, clear that slot because we know the vehicle is HERE (Correct Slot)
+                c.execute("SELECT slot_id FROM slots WHERE temp_reg_num = ? AND status IN ('misuse', 'rejected')", (user_reg,))
+                corrected = [r[0] for r in c.fetchall()]
                 c.execute("UPDATE slots SET status='free', reg_num=NULL, temp_reg_num=NULL, is_verified=0 WHERE temp_reg_num = ? AND status IN ('misuse', 'rejected')", (user_reg,))
                 
                 # If reserved, mark as occupied (Check-in)
                 if db_status == 'reserved':
                      c.execute("UPDATE slots SET status='occupied', is_verified=1 WHERE slot_id=?", (slot_id,))
-                     conn.commit()
+                conn.commit()
+                # Logged once committed, like AUTO_CLEAR
+                for freed in corrected:
+                    log_event(user_reg, freed, "CORRECTION_CLEAR", db_name=current_db())
+                if db_status == 'reserved':
+                     log_event(user_reg, slot_id, "VERIFY", db_name=current_db())
                 # If already occupied, just confirm
                 return jsonify({"status": "verified"})
                 
@@ -406,7 +653,8 @@ def process_verification():
                 # CRITICAL: Update DB so Admin Dashboard sees it!
                 c.execute("UPDATE slots SET status='misuse', temp_reg_num=? WHERE slot_id=?", (user_reg, slot_id))
                 conn.commit()
-                
+                log_event(user_reg, slot_id, "MISUSE", db_name=current_db())
+
                 return jsonify({
                     "status": "misuse", 
                     "assigned_slot": assigned_slot,
@@ -426,7 +674,8 @@ def process_verification():
                      # Update DB to show potential issues
                      c.execute("UPDATE slots SET status='misuse', temp_reg_num=? WHERE slot_id=?", (user_reg, slot_id))
                      conn.commit()
-                     
+                     log_event(user_reg, slot_id, "MISUSE", db_name=current_db())
+
                      return jsonify({
                         "status": "misuse", 
                         "assigned_slot": assigned_slot,
@@ -450,7 +699,7 @@ def resolve_misuse():
         reg_num = data.get('reg_num')
         decision = data.get('decision') # 'accept' or 'reject'
         
-        with sqlite3.connect(DB_NAME) as conn:
+        with sqlite3.connect(current_db()) as conn:
             c = conn.cursor()
             
             # Find the ORIGINALLY assigned slot
@@ -467,11 +716,13 @@ def resolve_misuse():
                 c.execute("UPDATE slots SET status = 'occupied', reg_num = ?, entry_time = ?, is_verified = 1 WHERE slot_id = ?", 
                           (reg_num, datetime.datetime.now().isoformat(), slot_id))
                 msg = f"Re-assigned to {slot_id}"
+                action = "MISUSE_ACCEPT"
                 
             elif decision == 'resolved':
                 # Vehicle moved away. Slot is free.
                 c.execute("UPDATE slots SET status = 'free', reg_num = NULL, entry_time = NULL, is_verified = 0 WHERE slot_id = ?", (slot_id,))
                 msg = "Incident Resolved. Slot Freed."
+                action = "MISUSE_RESOLVED"
 
             else: # reject
                 # Mark current slot as REJECTED so mobile can detect and show message
@@ -479,8 +730,10 @@ def resolve_misuse():
                 c.execute("UPDATE slots SET status = 'rejected', reg_num = ?, entry_time = ?, is_verified = 0 WHERE slot_id = ?", 
                           (reg_num, datetime.datetime.now().isoformat(), slot_id))
                 msg = "Access Rejected - Vehicle must move to assigned slot"
-                
+                action = "MISUSE_REJECT"
+
             conn.commit()
+            log_event(reg_num, slot_id, action, db_name=current_db())
             return jsonify({"success": True, "message": msg})
             
     except Exception as e:
@@ -493,7 +746,7 @@ def get_sensors():
     # Polling the Agent's state or Database
     # Here we can return database-driven alerts
     alerts = []
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(current_db()) as conn:
         c = conn.cursor()
         c.execute("SELECT slot_id, reg_num FROM slots WHERE status = 'misuse'")
         for r in c.fetchall():
@@ -501,55 +754,100 @@ def get_sensors():
              
     return jsonify({"alerts": alerts})
 
+# A rejected vehicle that hasn't moved within this window is assumed gone
+REJECTED_TIMEOUT_SECONDS = 600
+
+@app.route('/api/lot_summary', methods=['GET'])
+def lot_summary():
+    """
+    Availability per size class, status counts and utilization from the columnar lot mirror.
+    """
+    return jsonify(lot_state.get_state(current_db()).summary())
+
 @app.route('/api/slots', methods=['GET'])
 def api_slots():
     """
     Returns full slot list for the frontend dashboard.
     Runs maintenance cleanup before returning.
+
+    ?format=columnar (or msgpack, or Accept: application/msgpack) returns the
+    compact columnar snapshot instead; add ?since=<version> for a delta.
     """
-    with sqlite3.connect(DB_NAME) as conn:
-        conn.row_factory = sqlite3.Row
+    fmt = request.args.get('format')
+    if fmt is None and request.accept_mimetypes.best == 'application/msgpack':
+        fmt = 'msgpack'
+    if fmt is not None and fmt not in slot_codec.FORMATS:
+        return jsonify({"error": f"Unsupported format {fmt!r}", "formats": list(slot_codec.FORMATS)}), 406
+    since = request.args.get('since', type=int)
+
+    with sqlite3.connect(current_db()) as conn:
         c = conn.cursor()
 
         # AUTO-CLEAR LOGIC:
         # If a slot has been 'rejected' for > 10 minutes, clear it.
         # This acts as the fail-safe for drivers who left the premises vs moving to correct slot.
         try:
-            # SQLite 'now' is in UTC usually, but our app uses local time isoformat.
-            # Safe way: Iterate and check in Python, or use SQLite datetime functions if format is consistent.
-            # Since we store as ISO strings, we'll fetch rejected slots and check in Python for safety.
-            c.execute("SELECT slot_id, entry_time FROM slots WHERE status = 'rejected'")
-            rejected_slots = c.fetchall()
-            
-            for r_slot in rejected_slots:
-                s_id = r_slot['slot_id']
-                e_time = r_slot['entry_time']
-                if e_time:
-                    try:
-                        dt_entry = datetime.datetime.fromisoformat(e_time)
-                        # Threshold: 10 Minutes
-                        if (datetime.datetime.now() - dt_entry).total_seconds() > 600:
-                            print(f"[Maintenance] Auto-clearing rejected slot {s_id} (Timeout > 10m)")
-                            c.execute("UPDATE slots SET status='free', reg_num=NULL, temp_reg_num=NULL, entry_time=NULL, is_verified=0 WHERE slot_id=?", (s_id,))
-                    except Exception as e:
-                        print(f"[Maintenance] Error checking time for {s_id}: {e}")
+            # Candidates come from the vectorized lot mirror (threshold: 10 minutes);
+            # each is re-read so a slot resolved or re-rejected meanwhile is left alone
+            now = datetime.datetime.now()
+            state = lot_state.get_state(current_db())
+            state.refresh()
+            cleared = []
+            for s_id in state.expired('rejected', REJECTED_TIMEOUT_SECONDS, now):
+                c.execute("SELECT reg_num, entry_time FROM slots WHERE slot_id = ? AND status = 'rejected'", (s_id,))
+                row = c.fetchone()
+                if not row or not row[1] or (now - datetime.datetime.fromisoformat(row[1])).total_seconds() <= REJECTED_TIMEOUT_SECONDS:
+                    continue
+                print(f"[Maintenance] Auto-clearing rejected slot {s_id} (Timeout > 10m)")
+                c.execute("UPDATE slots SET status='free', reg_num=NULL, temp_reg_num=NULL, entry_time=NULL, is_verified=0 WHERE slot_id=?", (s_id,))
+                cleared.append((row[0], s_id))
             conn.commit()
+            # Only clears that committed reach the audit log
+            for reg_num, s_id in cleared:
+                log_event(reg_num, s_id, "AUTO_CLEAR", db_name=current_db())
         except Exception as e:
             print(f"[Maintenance] Failed: {e}")
 
-        c.execute("SELECT * FROM slots ORDER BY slot_id")
-        rows = c.fetchall()
-        
-        # Convert to list of dicts
-        result = [dict(row) for row in rows]
-        return jsonify(result)
+        if fmt:
+            payload = slot_codec.snapshot(conn, since)
+        else:
+            rows = records.fetch_slot_rows(conn)
+
+    if fmt:
+        body, mimetype = slot_codec.encode(payload, fmt)
+        response = Response(body, mimetype=mimetype)
+        # The journal version identifies the content, no need to hash the body
+        response.set_etag(f"{current_lot()}-{fmt}-{payload['version']}-{since}")
+    else:
+        # Serialized straight from the row tuples (no per-slot dicts)
+        response = Response(records.slots_json(rows, current_lot()), mimetype='application/json')
+        response.add_etag()
+    # Pollers revalidate; an unchanged lot costs a 304 with no body
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/analytics/occupancy', methods=['GET'])
+def analytics_occupancy():
+    """
+    Live counts per size class and status (trigger-maintained).
+    """
+    return jsonify(analytics.get_occupancy(current_db()))
+
+@app.route('/api/analytics/history', methods=['GET'])
+def analytics_history():
+    """
+    Peak hours, dwell-time distribution and turnover over the last ?days=N (default 7).
+    """
+    days = request.args.get('days', 7, type=int)
+    days = max(1, min(days, log_retention.RAW_RETENTION_DAYS))
+    return jsonify(analytics.history_cache.get(days, current_db()))
 
 @app.route('/api/slot_status/<slot_id>', methods=['GET'])
 def get_slot_status(slot_id):
     """
     Lightweight endpoint for mobile polling during verification.
     """
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(current_db()) as conn:
         c = conn.cursor()
         c.execute("SELECT status, reg_num FROM slots WHERE slot_id = ?", (slot_id,))
         row = c.fetchone()
@@ -557,6 +855,77 @@ def get_slot_status(slot_id):
             return jsonify({"status": row[0], "reg_num": row[1]})
         return jsonify({"error": "Slot not found"}), 404
 
+@app.route('/api/find_vehicle/<plate>', methods=['GET'])
+def find_vehicle(plate):
+    """
+    Mobile app lookup: where is this vehicle and is it verified yet.
+    Served from the in-memory plate index; tolerant of OCR-confusable characters.
+    """
+    record, match = plate_index.get_index(current_db()).lookup(plate, plate_index.CONFUSION_MATCH_MAX_DISTANCE)
+    if record is None:
+        body = {"found": False, "plate": plate_index.normalize_plate(plate)}
+    else:
+        body = dict(record, found=True, match=match)
+    response = jsonify(body)
+    # The app polls this; unchanged answers come back as 304s
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route('/api/tunnel', methods=['GET'])
+def tunnel_metrics():
+    """
+    Tunnel supervisor metrics (public URL, uptime, restarts, probe latency).
+    """
+    return jsonify(NetworkManager.tunnel_metrics())
+
+# Rendered QR images, bounded by bytes rather than entry count
+qr_image_cache = make_qrs.QRImageCache(max_bytes=int(os.environ.get("QR_CACHE_BYTES", 8 * 1024 * 1024)))
+
+@app.route('/qr_image/<slot_id>')
+def qr_image(slot_id):
+    """
+    Renders a slot's QR code on demand (PNG by default, ?format=svg).
+    Same content as make_qrs.generate_qrs, served from an LRU cache with ETags.
+    """
+    fmt = request.args.get('format', 'png').lower()
+    if fmt not in make_qrs.QR_MIMETYPES:
+        return jsonify({"error": f"Unsupported format '{fmt}'"}), 400
+
+    with sqlite3.connect(current_db()) as conn:
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM slots WHERE slot_id = ?", (slot_id,))
+        if not c.fetchone():
+            return jsonify({"error": "Slot not found"}), 404
+
+    data_url = make_qrs.slot_qr_url(slot_id, lot_id=current_lot())
+    etag = make_qrs.qr_etag(slot_id, data_url, fmt)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        etag, body = qr_image_cache.get(slot_id, data_url, fmt)
+        response = Response(body, mimetype=make_qrs.QR_MIMETYPES[fmt])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+@app.route('/qr_sheet')
+def qr_sheet():
+    """
+    Streams every slot's QR code as a ZIP archive for bulk printing.
+    """
+    fmt = request.args.get('format', 'png').lower()
+    if fmt not in make_qrs.QR_MIMETYPES:
+        return jsonify({"error": f"Unsupported format '{fmt}'"}), 400
+
+    with sqlite3.connect(current_db()) as conn:
+        c = conn.cursor()
+        c.execute("SELECT slot_id FROM slots ORDER BY slot_id")
+        slot_ids = [r[0] for r in c.fetchall()]
+
+    return Response(make_qrs.iter_qr_archive(slot_ids, fmt=fmt, lot_id=current_lot()), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename=parking_qr_{current_lot()}_{fmt}.zip'})
+
 @app.route('/qr/<slot_id>')
 def qr_redirect(slot_id):
     """
@@ -617,41 +986,70 @@ def qr_redirect(slot_id):
     return redirect(full_url)
 
 
-# --- STARTUP ORCHESTRATION ---
-if __name__ == '__main__':
-    # 1. Initialize Database
-    init_db()
+# --- MULTI-LOT ROUTING ---
+@app.route('/lots', methods=['GET'])
+def list_lots():
+    return jsonify(lots.lot_registry.list_lots())
 
-    # --- SYNC WITH EXTERNAL SENSORS ---
-    print("Syncing with External Sensors...")
+@app.route('/lots', methods=['POST'])
+def create_lot():
+    """
+    Registers a new facility with its own database.
+    Body: {"lot_id": "north", "name": "North Garage", "layout": {"small": 50, "medium": 200, "large": 50}}
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    lot_id = data.get('lot_id')
     try:
-        initial_states = external_sensors.sync_all_slots()
-        with sqlite3.connect(DB_NAME) as conn:
-            c = conn.cursor()
-            for slot_id, status in initial_states.items():
-                # Map 'unavailable' -> 'occupied', 'available' -> 'free'
-                db_status = 'occupied' if status == 'unavailable' else 'free'
-                c.execute("UPDATE slots SET status = ? WHERE slot_id = ?", (db_status, slot_id))
-            conn.commit()
-        print("Sync Complete.")
+        # The database is set up before the lot is registered, so a failure leaves no half-made lot
+        info = lots.lot_registry.add_lot(lot_id, data.get('name'), data.get('layout'), prepare=init_db)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Sync Failed: {e}")
-    
-    # 2. Network Auto-Configuration
-    # This detects Local IP and Public Tunnel URL
+        print(f"[Lots] Creating lot '{lot_id}' failed: {e}")
+        return jsonify({"error": f"Could not create lot: {e}"}), 500
+
+    # Background work (if this process is the owner; otherwise the owner picks the lot up) and QR codes
+    maintenance.start_lot(lot_id, lots.lot_registry.db_path(lot_id))
+    threading.Thread(target=make_qrs.generate_qrs, kwargs={'lot_id': lot_id}, daemon=True).start()
+    return jsonify({"lot_id": lot_id, **info}), 201
+
+LOT_SCOPED_ENDPOINTS = {
+    'slots_dashboard', 'dashboard_view', 'allotment_status', 'entry', 'exit_vehicle', 'reset_parking',
+    'anpr', 'scan_slot', 'process_verification', 'resolve_misuse', 'get_sensors', 'api_slots',
+    'analytics_occupancy', 'analytics_history', 'get_slot_status', 'qr_image', 'qr_sheet',
+    'find_vehicle', 'mobile_app', 'lot_summary', 'entry_batch', 'exit_batch', 'journal_stats',
+    'create_booking', 'list_bookings', 'booking_availability', 'cancel_booking', 'assignment_stats',
+}
+for _rule in list(app.url_map.iter_rules()):
+    if _rule.endpoint in LOT_SCOPED_ENDPOINTS:
+        app.add_url_rule(f"/lots/<lot_id>{_rule.rule}", endpoint=f"lot_{_rule.endpoint}",
+                         view_func=app.view_functions[_rule.endpoint],
+                         methods=sorted(_rule.methods - {'HEAD', 'OPTIONS'}))
+
+
+# --- STARTUP ORCHESTRATION ---
+def sync_external_sensors():
+    print("Syncing with External Sensors...")
+    initial_states = external_sensors.sync_all_slots()
+    with sqlite3.connect(DB_NAME) as conn:
+        c = conn.cursor()
+        for slot_id, status in initial_states.items():
+            # Map 'unavailable' -> 'occupied', 'available' -> 'free'
+            db_status = 'occupied' if status == 'unavailable' else 'free'
+            # Runs while the server is already granting slots: never touch a
+            # slot that holds a vehicle or is in a misuse/reservation flow
+            c.execute("""UPDATE slots SET status = ? WHERE slot_id = ? AND reg_num IS NULL
+                         AND status IN ('free', 'occupied')""", (db_status, slot_id))
+        conn.commit()
+    print("Sync Complete.")
+
+def configure_network():
+    # Detects Local IP and Public Tunnel URL (may wait up to 30 s for cloudflared)
     print("Configuring Network...")
     local_ip, public_url = NetworkManager.initialize()
-    print(f"Network Configured. Local: {local_ip}, Public: {public_url}")
-    
-    # 3. Generate QR Codes (Force to ensure correct URL)
-    print("Checking QR Codes...")
-    # Passing public_url explicitly NO LONGER NEEDED because we want STATIC URL.
-    # make_qrs.get_tunnel_url() is now hardcoded to the static Render URL.
-    qr_generated = make_qrs.generate_qrs(force=True)
-    
-    if not qr_generated and make_qrs.qrs_exist():
-        print("[INFO] Existing QR codes found.")
-    
+
     # Display current access URLs prominently
     print("\n" + "="*60)
     print("  SMART PARKING SYSTEM - ACCESS URLs")
@@ -660,26 +1058,64 @@ if __name__ == '__main__':
     print(f"  External URL:   {public_url}")
     print(f"  QR Codes:       {public_url}/scan/<slot_id>")
     print("="*60 + "\n")
-    
-    # Pre-warm camera system (Runs in separate thread)
-    camera_system = SharedCamera()
-    
-    # 4. START KEEP-ALIVE (Prevent Render Cold Start)
-    def keep_alive():
-        target = "https://parking-demo-uepk.onrender.com"
-        print(f"[KeepAlive] Starting pinger for {target}")
-        import requests 
-        while True:
-            try:
-                requests.get(target)
-                # print("[KeepAlive] Ping sent.") # Optional verbose log
-            except:
-                pass
-            time.sleep(600) # Ping every 10 mins (Render sleeps after 15)
-            
+    return local_ip, public_url
+
+def generate_qr_codes():
+    # make_qrs.get_tunnel_url() is hardcoded to the static Render URL,
+    # so this does not need to wait for the tunnel.
+    print("Checking QR Codes...")
+    qr_generated = make_qrs.generate_qrs()
+    if not qr_generated and make_qrs.qrs_exist():
+        print("[INFO] Existing QR codes found.")
+    for lot in lots.lot_registry.list_lots():
+        if lot['lot_id'] != lots.DEFAULT_LOT:
+            qr_generated = make_qrs.generate_qrs(lot_id=lot['lot_id']) or qr_generated
+    return qr_generated
+
+def open_camera():
+    global camera_system
+    if camera_system is None:
+        camera_system = SharedCamera()
+    # Returning normally marks the phase ready on /ready
+    if not camera_system.cap.isOpened():
+        raise RuntimeError("Camera 0 could not be opened")
+    return True
+
+def keep_alive():
+    # Prevent Render Cold Start
+    target = "https://parking-demo-uepk.onrender.com"
+    print(f"[KeepAlive] Starting pinger for {target}")
+    import requests
+    while True:
+        try:
+            requests.get(target)
+        except:
+            pass
+        time.sleep(600) # Ping every 10 mins (Render sleeps after 15)
+
+if __name__ == '__main__':
+    # 1. Initialize Database - the only phase the server can't start without
+    t0 = time.time()
+    init_db()
+    for lot in lots.lot_registry.list_lots():
+        if lot['lot_id'] != lots.DEFAULT_LOT:
+            init_db(lot['db'], lot['layout'])
+    print(f"Database ready in {time.time() - t0:.2f}s")
+
+    # 2. Everything else runs concurrently while the server is already accepting requests.
+    # Progress is visible on /ready.
+    startup_orchestrator.add_phase('sensor_sync', sync_external_sensors, required=False)
+    startup_orchestrator.add_phase('network', configure_network)
+    startup_orchestrator.add_phase('qr_codes', generate_qr_codes, required=False)
+    startup_orchestrator.add_phase('camera', open_camera)
+    startup_orchestrator.start()
+
     threading.Thread(target=keep_alive, daemon=True).start()
 
-    # 5. Start Server
+    # Log compaction, journal snapshots and booking expiry for every lot
+    maintenance.start()
+
+    # 3. Start Server
     # Threaded=True allow for concurrent requests (video feed + api)
     # use_reloader=False prevents the app from starting twice in debug mode
-    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True, use_reloader=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True, use_reloader=False)
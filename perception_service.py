@@ -0,0 +1,316 @@
+"""
+Perception Service: the single owner of the camera and the OCR model.
+
+Web workers stay stateless and talk to this process over a local socket
+(requests such as ANPR) and read camera frames straight out of shared
+memory, so the web tier can run under gunicorn with many workers without
+each one opening the camera or loading easyocr.
+
+The socket speaks pickle, so a peer that knows the authkey can run code in
+this process. PERCEPTION_AUTHKEY must be set unless it listens on loopback;
+there the service generates a random key on first start into
+PERCEPTION_AUTHKEY_FILE (mode 0600) and workers read it from there.
+
+Run:
+    python perception_service.py
+    PERCEPTION_MODE=remote gunicorn -w 4 -b 0.0.0.0:5000 parking_proto_sensor:app
+"""
+import os
+import sys
+import time
+import socket
+import struct
+import secrets
+import ipaddress
+import threading
+from multiprocessing import shared_memory
+from multiprocessing.connection import Listener, Client
+import numpy as np
+from dotenv import load_dotenv
+
+import lots
+
+load_dotenv()
+
+# Localhost TCP rather than a Unix socket so the same code runs on the Windows edge box
+PERCEPTION_HOST = os.environ.get("PERCEPTION_HOST", "127.0.0.1")
+PERCEPTION_PORT = int(os.environ.get("PERCEPTION_PORT", "6001"))
+PERCEPTION_AUTHKEY = os.environ.get("PERCEPTION_AUTHKEY", "").encode() or None
+# Generated key used on loopback when PERCEPTION_AUTHKEY isn't set; readable by
+# the service's user only, so other local users can't connect
+PERCEPTION_AUTHKEY_FILE = os.environ.get("PERCEPTION_AUTHKEY_FILE", os.path.join(lots.LOTS_DIR, "perception.key"))
+
+FRAME_SHM_NAME = os.environ.get("PERCEPTION_FRAME_SHM", "parking_frame")
+MAX_FRAME_BYTES = 1920 * 1080 * 3
+FRAME_PUMP_INTERVAL = 0.03  # ~30 FPS into shared memory
+
+def _is_loopback(host):
+    try:
+        return all(ipaddress.ip_address(info[4][0]).is_loopback
+                   for info in socket.getaddrinfo(host, None))
+    except (OSError, ValueError):
+        return False
+
+
+def _read_key_file(path):
+    with open(path, "rb") as f:
+        if os.name == "posix" and os.fstat(f.fileno()).st_mode & 0o077:
+            raise RuntimeError(f"{path} must not be readable by other users (chmod 600)")
+        key = f.read().strip()
+    if not key:
+        raise RuntimeError(f"{path} is empty")
+    return key
+
+
+def _create_key_file(path):
+    """Writes a random key with mode 0600, or reads the one another process wrote first."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return _read_key_file(path)
+    key = secrets.token_hex(32).encode()
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    print(f"[Perception] Generated authkey in {path}")
+    return key
+
+
+def resolve_authkey(host, authkey=PERCEPTION_AUTHKEY, create=False, key_file=PERCEPTION_AUTHKEY_FILE):
+    """
+    The configured authkey, or on a loopback address the key in key_file
+    (generated there first if `create`, as the service does). Raises
+    RuntimeError otherwise.
+    """
+    if authkey:
+        return authkey
+    if not _is_loopback(host):
+        raise RuntimeError(f"PERCEPTION_AUTHKEY must be set for a perception socket on {host}")
+    if create:
+        return _create_key_file(key_file)
+    try:
+        return _read_key_file(key_file)
+    except FileNotFoundError:
+        raise RuntimeError(f"No perception authkey: start perception_service.py (it writes {key_file}) "
+                           f"or set PERCEPTION_AUTHKEY") from None
+
+
+# seq (odd while a write is in progress), height, width, channels
+_HEADER = struct.Struct("<QIII")
+
+
+def _attach_untracked(name):
+    """
+    Attaches to an existing block without registering it with this process's
+    resource tracker, which would otherwise unlink it when a worker exits.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == "posix":
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+    return shm
+
+
+class FrameBuffer:
+    """
+    Latest camera frame in shared memory.
+
+    Single writer, many readers, guarded by a sequence lock: the writer makes
+    the sequence odd while copying, and readers retry if it was odd or changed
+    under them.
+    """
+
+    def __init__(self, name=FRAME_SHM_NAME, create=False, max_bytes=MAX_FRAME_BYTES):
+        self.name = name
+        self.created = create
+        if create:
+            try:
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=_HEADER.size + max_bytes)
+            _HEADER.pack_into(self.shm.buf, 0, 0, 0, 0, 0)
+        else:
+            self.shm = _attach_untracked(name)
+        self.capacity = self.shm.size - _HEADER.size
+        self._seq = 0
+
+    def write(self, frame):
+        frame = np.ascontiguousarray(frame)
+        h, w = frame.shape[:2]
+        ch = frame.shape[2] if frame.ndim == 3 else 1
+        if frame.nbytes > self.capacity:
+            return False
+        self._seq += 1
+        _HEADER.pack_into(self.shm.buf, 0, self._seq, h, w, ch)
+        self.shm.buf[_HEADER.size:_HEADER.size + frame.nbytes] = frame.reshape(-1).view(np.uint8)
+        self._seq += 1
+        _HEADER.pack_into(self.shm.buf, 0, self._seq, h, w, ch)
+        return True
+
+    def read(self, retries=5):
+        """Returns a copy of the latest frame, or None if none has been written."""
+        for _ in range(retries):
+            seq, h, w, ch = _HEADER.unpack_from(self.shm.buf, 0)
+            if seq == 0:
+                return None
+            if seq % 2:
+                time.sleep(0.001)
+                continue
+            n = h * w * ch
+            data = np.frombuffer(self.shm.buf, dtype=np.uint8, count=n, offset=_HEADER.size).copy()
+            if _HEADER.unpack_from(self.shm.buf, 0)[0] == seq:
+                return data.reshape((h, w, ch) if ch > 1 else (h, w))
+        return None
+
+    def close(self):
+        self.shm.close()
+        if self.created:
+            self.shm.unlink()
+
+
+class PerceptionServer:
+    """
+    Serves perception requests for the web workers and publishes frames.
+
+    Protocol: each request is a dict {'cmd': ...}, each reply a dict.
+        ping -> {'status': 'ok'}
+        anpr -> agent.perceive(<percept, default 'image'>, <latest frame>) result
+        stats -> preprocessing stage timings and QR decoder counters
+    """
+
+    def __init__(self, agent, camera, address=(PERCEPTION_HOST, PERCEPTION_PORT), authkey=PERCEPTION_AUTHKEY):
+        self.agent = agent
+        self.camera = camera
+        self.address = address
+        self.authkey = resolve_authkey(address[0], authkey, create=True)
+        self.frames = FrameBuffer(create=True)
+        # easyocr isn't thread-safe; one inference at a time
+        self._perceive_lock = threading.Lock()
+        self.requests = 0
+
+    def _pump_frames(self):
+        while True:
+            frame = self.camera.get_frame()
+            if frame is not None:
+                self.frames.write(frame)
+            time.sleep(FRAME_PUMP_INTERVAL)
+
+    def _handle(self, msg):
+        cmd = msg.get("cmd")
+        if cmd == "ping":
+            return {"status": "ok"}
+        if cmd == "anpr":
+            frame = self.camera.get_frame()
+            if frame is None:
+                return {"error": "Failed to capture image (Camera busy or off)"}
+            percept = msg.get("percept", "image")
+            if percept == "qr":
+                # QR-only lanes never touch the OCR model, so they don't queue behind it
+                return self.agent.perceive("qr", frame)
+            with self._perceive_lock:
+                return self.agent.perceive("image", frame)
+        if cmd == "stats":
+            return {"preprocess": self.agent.preprocess.stats(), "qr": self.agent.qr_decoder.stats(),
+                    "requests": self.requests}
+        return {"error": f"Unknown command '{cmd}'"}
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    return
+                self.requests += 1
+                try:
+                    reply = self._handle(msg)
+                except Exception as e:
+                    reply = {"error": f"Internal Error: {e}"}
+                conn.send(reply)
+
+    def serve_forever(self):
+        threading.Thread(target=self._pump_frames, daemon=True).start()
+        with Listener(self.address, authkey=self.authkey) as listener:
+            print(f"[Perception] Listening on {self.address[0]}:{self.address[1]}, frames in shm '{self.frames.name}'")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"[Perception] Rejected connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+class PerceptionClient:
+    """
+    Web-worker side. One connection per thread (connections aren't
+    thread-safe); frames are read from shared memory without a round-trip.
+    """
+
+    def __init__(self, address=(PERCEPTION_HOST, PERCEPTION_PORT), authkey=PERCEPTION_AUTHKEY):
+        if not authkey and not _is_loopback(address[0]):
+            raise RuntimeError(f"PERCEPTION_AUTHKEY must be set for a perception socket on {address[0]}")
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+        self._frames = None
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Read per connection: the service may start (and write its key) after this worker
+            conn = Client(self.address, authkey=resolve_authkey(self.address[0], self.authkey))
+            self._local.conn = conn
+        return conn
+
+    def request(self, cmd, **kwargs):
+        msg = dict(kwargs, cmd=cmd)
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.send(msg)
+                return conn.recv()
+            except (EOFError, OSError):
+                # Service restarted - reconnect once
+                self._local.conn = None
+                if attempt:
+                    raise
+        return None
+
+    def anpr(self, percept="image"):
+        return self.request("anpr", percept=percept)
+
+    def get_frame(self):
+        if self._frames is None:
+            try:
+                self._frames = FrameBuffer()
+            except FileNotFoundError:
+                return None
+        return self._frames.read()
+
+
+if __name__ == "__main__":
+    from agent import ParkingAgent
+    from camera import SharedCamera
+    from network_manager import NetworkManager
+    import make_qrs
+
+    agent = ParkingAgent()
+    camera = SharedCamera()
+
+    # The owner process also holds the other singletons: tunnel and QR codes
+    if "--no-network" not in sys.argv:
+        threading.Thread(target=NetworkManager.initialize, daemon=True).start()
+    threading.Thread(target=make_qrs.generate_qrs, daemon=True).start()
+
+    server = PerceptionServer(agent, camera)
+    try:
+        server.serve_forever()
+    finally:
+        server.frames.close()
@@ -0,0 +1,395 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DB_NAME = "parking.db"
+
+# Characters OCR commonly confuses, shared with ParkingAgent._correct_ocr_errors
+LETTER_MAP = {'0': 'O', '1': 'I', '2': 'Z', '5': 'S', '8': 'B', '4': 'A', '6': 'G'}
+NUMBER_MAP = {'O': '0', 'Q': '0', 'I': '1', 'Z': '2', 'S': '5', 'B': '8', 'A': '4', 'G': '6', 'T': '1'}
+
+# Collapses every confusable character onto its digit, so 'MH12AB1234' and
+# 'MHI2A81234' share one skeleton key
+_SKELETON = str.maketrans(NUMBER_MAP)
+_NON_ALNUM = re.compile(r"[^A-Z0-9]")
+
+# Seconds between PRAGMA data_version checks; 0 checks on every lookup.
+# Exact lookups fall through to SQL anyway, so a short lag only delays
+# fuzzy matches for a vehicle that has just arrived.
+FRESHNESS_INTERVAL = float(os.environ.get("PLATE_INDEX_FRESHNESS_SECONDS", "0.25"))
+
+# Edit costs: swapping two confusable characters (same skeleton) is cheap,
+# any other substitution, insertion or deletion costs 1
+CONFUSION_COST = 0.25
+# Radius exits suggest a candidate within for an operator to confirm. Up to
+# 1.0 (one arbitrary misread plus any number of confusions) the candidate
+# index is exhaustive.
+MATCH_MAX_DISTANCE = float(os.environ.get("PLATE_MATCH_MAX_DISTANCE", "1.0"))
+# Largest distance merged as "the same vehicle" (entry, exit, verification and
+# the mobile lookup): confusion-level misreads only, two at most. A plate one
+# real character off is more likely a different car.
+CONFUSION_MATCH_MAX_DISTANCE = 2 * CONFUSION_COST
+
+
+def normalize_plate(text):
+    """Upper-cases and strips everything but letters and digits."""
+    return _NON_ALNUM.sub("", (text or "").upper())
+
+
+def plate_skeleton(plate):
+    return normalize_plate(plate).translate(_SKELETON)
+
+
+def plate_distance(a, b, max_distance=None):
+    """
+    Confusion-weighted edit distance between two normalized plates.
+    Returns inf as soon as the distance is known to exceed max_distance.
+    """
+    if a == b:
+        return 0.0
+    if max_distance is not None and abs(len(a) - len(b)) > max_distance:
+        return float("inf")
+    sa, sb = a.translate(_SKELETON), b.translate(_SKELETON)
+    prev = [float(j) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        ca, ka = a[i - 1], sa[i - 1]
+        cur = [float(i)]
+        for j in range(1, len(b) + 1):
+            if ca == b[j - 1]:
+                sub = prev[j - 1]
+            elif ka == sb[j - 1]:
+                sub = prev[j - 1] + CONFUSION_COST
+            else:
+                sub = prev[j - 1] + 1
+            cur.append(min(sub, prev[j] + 1, cur[j - 1] + 1))
+        if max_distance is not None and min(cur) > max_distance:
+            return float("inf")
+        prev = cur
+    return prev[-1]
+
+
+def _neighbourhood(skeleton):
+    """The skeleton plus every single-character deletion of it."""
+    keys = {skeleton}
+    keys.update(skeleton[:i] + skeleton[i + 1:] for i in range(len(skeleton)))
+    return keys
+
+
+class PlateMatcher:
+    """
+    Similarity index over a set of plates.
+
+    Each plate is filed under the deletion neighbourhood of its skeleton.
+    Two plates whose skeletons are within one edit share a key, so a query
+    only scores the handful of plates in its own ~11 buckets instead of the
+    whole set.
+    """
+
+    def __init__(self, plates=()):
+        self._buckets = {}
+        self.plates = set()
+        for plate in plates:
+            self.add(plate)
+
+    def __len__(self):
+        return len(self.plates)
+
+    def add(self, plate):
+        if plate in self.plates:
+            return
+        self.plates.add(plate)
+        for key in _neighbourhood(plate.translate(_SKELETON)):
+            self._buckets.setdefault(key, set()).add(plate)
+
+    def remove(self, plate):
+        if plate not in self.plates:
+            return
+        self.plates.discard(plate)
+        for key in _neighbourhood(plate.translate(_SKELETON)):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(plate)
+                if not bucket:
+                    del self._buckets[key]
+
+    def candidates(self, plate, max_distance=MATCH_MAX_DISTANCE):
+        skeleton = plate.translate(_SKELETON)
+        if max_distance < 1:
+            # Confusions only: the skeleton must match exactly
+            return {p for p in self._buckets.get(skeleton, ()) if len(p) == len(plate)}
+        found = set()
+        for key in _neighbourhood(skeleton):
+            bucket = self._buckets.get(key)
+            if bucket:
+                found.update(bucket)
+        return found
+
+    def best_match(self, plate, max_distance=MATCH_MAX_DISTANCE, candidates=None):
+        """
+        Returns (plate, distance) for the closest indexed plate within
+        max_distance, or (None, None) if there is none or the best is tied.
+        """
+        if candidates is None:
+            candidates = self.candidates(plate, max_distance)
+        best, best_distance, tied = None, None, False
+        for candidate in candidates:
+            d = plate_distance(plate, candidate, max_distance)
+            if d > max_distance:
+                continue
+            if best is None or d < best_distance:
+                best, best_distance, tied = candidate, d, False
+            elif d == best_distance:
+                tied = True
+        if best is None or tied:
+            return None, None
+        return best, best_distance
+
+
+class PendingPlates:
+    """
+    Plates written in a caller's open transaction (e.g. earlier events of a
+    batch), which the committed index can't see yet.
+    """
+
+    def __init__(self):
+        self.matcher = PlateMatcher()
+        self.stored = {}
+
+    def add(self, reg_num):
+        plate = normalize_plate(reg_num)
+        self.stored[plate] = reg_num
+        self.matcher.add(plate)
+
+    def candidates(self, plate, max_distance=CONFUSION_MATCH_MAX_DISTANCE):
+        """Normalized plate -> plate as written, for those near `plate`."""
+        found = self.matcher.candidates(plate, max_distance)
+        if plate in self.stored:
+            found.add(plate)
+        return {p: self.stored[p] for p in found}
+
+
+class PlateIndex:
+    """
+    In-memory plate -> slot index for one lot database.
+
+    Holds every vehicle currently known to the lot (reserved, occupied,
+    misuse, rejected) keyed by normalized plate, plus a PlateMatcher for
+    OCR-tolerant lookups. Refreshed only when SQLite's data_version says
+    another connection committed, so lookups are dict hits.
+    """
+
+    def __init__(self, db_name=DB_NAME, freshness_interval=FRESHNESS_INTERVAL):
+        self.db_name = db_name
+        self.freshness_interval = freshness_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._data_version = None
+        self._checked_at = 0.0
+        self.by_plate = {}
+        self.matcher = PlateMatcher()
+        self.version = 0
+        self.rebuilds = 0
+        self.lookups = 0
+        self.fuzzy_matches = 0
+
+    def _connection(self):
+        if self._conn is None:
+            # Private connection: data_version only moves for commits made elsewhere
+            self._conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        return self._conn
+
+    def _rebuild(self, conn):
+        by_plate = {}
+        c = conn.execute('''SELECT slot_id, size_type, status, reg_num, temp_reg_num, entry_time, is_verified
+                            FROM slots WHERE reg_num IS NOT NULL OR temp_reg_num IS NOT NULL''')
+        for slot_id, size_type, status, reg_num, temp_reg_num, entry_time, is_verified in c.fetchall():
+            if reg_num:
+                plate = normalize_plate(reg_num)
+                by_plate[plate] = {
+                    "plate": reg_num,
+                    "slot_id": slot_id,
+                    "size": size_type,
+                    "status": status,
+                    "entry_time": entry_time,
+                    "is_verified": bool(is_verified),
+                }
+            if temp_reg_num:
+                # Parked in someone else's slot; only record it if they hold no slot of their own
+                plate = normalize_plate(temp_reg_num)
+                by_plate.setdefault(plate, {
+                    "plate": temp_reg_num,
+                    "slot_id": slot_id,
+                    "size": size_type,
+                    "status": status,
+                    "entry_time": entry_time,
+                    "is_verified": False,
+                })
+
+        # Only vehicles that arrived or left touch the similarity index
+        old = self.by_plate
+        for plate in old.keys() - by_plate.keys():
+            self.matcher.remove(plate)
+        for plate in by_plate.keys() - old.keys():
+            self.matcher.add(plate)
+
+        self.by_plate = by_plate
+        self.version += 1
+        self.rebuilds += 1
+
+    def refresh(self, force=False, interval=None):
+        """Rebuilds the index if the database changed since the last check."""
+        now = time.monotonic()
+        interval = self.freshness_interval if interval is None else interval
+        if not force and self._data_version is not None and now - self._checked_at < interval:
+            return
+        with self._lock:
+            conn = self._connection()
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            self._checked_at = now
+            if force or data_version != self._data_version:
+                self._rebuild(conn)
+                self._data_version = data_version
+
+    def lookup(self, plate, max_distance=CONFUSION_MATCH_MAX_DISTANCE):
+        """
+        Finds a vehicle by plate.
+
+        Returns:
+            (record, match) where match is 'exact' or 'fuzzy', or (None, None).
+            Several equally close vehicles are ambiguous and not matched.
+        """
+        self.refresh()
+        self.lookups += 1
+        plate = normalize_plate(plate)
+        by_plate = self.by_plate
+        record = by_plate.get(plate)
+        if record is not None:
+            return record, "exact"
+        with self._lock:
+            candidates = self.matcher.candidates(plate, max_distance)
+        best, _ = self.matcher.best_match(plate, max_distance, candidates)
+        record = by_plate.get(best) if best else None
+        if record is None:
+            return None, None
+        self.fuzzy_matches += 1
+        return record, "fuzzy"
+
+    def resolve(self, plate, max_distance=CONFUSION_MATCH_MAX_DISTANCE):
+        """
+        The plate as stored for the active vehicle it matches, or the
+        normalized input if it matches none. Only confusion-level misreads
+        are merged unless a wider max_distance is asked for.
+        """
+        record, _ = self.lookup(plate, max_distance)
+        return record["plate"] if record else normalize_plate(plate)
+
+    def resolve_entry(self, cursor, plate, pending=None):
+        """
+        The plate of the vehicle holding a slot that `plate` is (at most) a
+        confusion-level misread of, or None.
+
+        Candidates come from the index plus `pending` (PendingPlates written
+        earlier in the caller's uncommitted transaction) and are confirmed
+        through `cursor`.
+        """
+        self.refresh()
+        self.lookups += 1
+        query = normalize_plate(plate)
+        by_plate = self.by_plate
+        with self._lock:
+            candidates = self.matcher.candidates(query, CONFUSION_MATCH_MAX_DISTANCE)
+        stored = {p: by_plate[p]["plate"] for p in candidates if p in by_plate}
+        if query in by_plate:
+            stored[query] = by_plate[query]["plate"]
+        if pending is not None:
+            stored.update(pending.candidates(query))
+        if not stored:
+            return None
+
+        # Only vehicles holding a slot as of this transaction
+        marks = ",".join("?" * len(stored))
+        cursor.execute(f"SELECT reg_num FROM slots WHERE reg_num IN ({marks})", list(stored.values()))
+        parked_plates = {row[0] for row in cursor.fetchall()}
+        parked = {p for p, s in stored.items() if s in parked_plates}
+        if query in parked:
+            return stored[query]
+        best, _ = self.matcher.best_match(query, CONFUSION_MATCH_MAX_DISTANCE, parked)
+        if best:
+            self.fuzzy_matches += 1
+            return stored[best]
+        return None
+
+    def resolve_exit(self, cursor, plate):
+        """
+        The parked plate an exit for `plate` releases.
+
+        The exact plate wins if it is parked. Otherwise only a confusion-level
+        misread is merged: a plate one real character off is more likely a
+        different car, and a duplicate or replayed exit must not free it.
+
+        Candidates are confirmed parked through `cursor`, so exits made earlier
+        in the caller's (uncommitted) transaction count.
+
+        Returns:
+            (plate, None) to release, or (None, candidate) with the closest
+            parked plate within MATCH_MAX_DISTANCE (or None) for an operator
+            to confirm.
+        """
+        cursor.execute("SELECT reg_num FROM slots WHERE reg_num = ?", (plate,))
+        if cursor.fetchone():
+            return plate, None
+
+        # An exit acts on what it finds, so no freshness lag here
+        self.refresh(interval=0)
+        self.lookups += 1
+        query = normalize_plate(plate)
+        by_plate = self.by_plate
+        with self._lock:
+            candidates = self.matcher.candidates(query, MATCH_MAX_DISTANCE)
+        stored = {p: by_plate[p]["plate"] for p in candidates if p in by_plate}
+        if query in by_plate:
+            stored[query] = by_plate[query]["plate"]
+        if not stored:
+            return None, None
+
+        # Only vehicles still parked as of this transaction
+        marks = ",".join("?" * len(stored))
+        cursor.execute(f"SELECT reg_num FROM slots WHERE reg_num IN ({marks})", list(stored.values()))
+        parked_plates = {row[0] for row in cursor.fetchall()}
+        parked = {p for p, s in stored.items() if s in parked_plates}
+        if query in parked:
+            return stored[query], None
+
+        best, _ = self.matcher.best_match(query, CONFUSION_MATCH_MAX_DISTANCE, parked)
+        if best:
+            self.fuzzy_matches += 1
+            return stored[best], None
+        candidate, _ = self.matcher.best_match(query, MATCH_MAX_DISTANCE, parked)
+        return None, stored[candidate] if candidate else None
+
+    def stats(self):
+        return {
+            "vehicles": len(self.by_plate),
+            "version": self.version,
+            "rebuilds": self.rebuilds,
+            "lookups": self.lookups,
+            "fuzzy_matches": self.fuzzy_matches,
+        }
+
+
+# One index per lot database
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(db_name=DB_NAME):
+    index = _indexes.get(db_name)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(db_name)
+            if index is None:
+                index = PlateIndex(db_name)
+                _indexes[db_name] = index
+    return index
@@ -0,0 +1,84 @@
+import os
+import time
+import threading
+import cv2
+
+# QR codes are decoded on a grayscale copy no wider than this; the finder
+# patterns survive heavy downscaling far better than plate text does
+QR_MAX_WIDTH = int(os.environ.get("QR_MAX_WIDTH", "960"))
+# When to retry at full resolution after the downscaled pass decodes nothing:
+#   'located' - only if a code was found but couldn't be read (small/far codes)
+#   'always'  - also on frames with no code in sight (doubles the cost of empty frames)
+#   'never'
+QR_FULL_RES_RETRY = os.environ.get("QR_FULL_RES_RETRY", "located").lower()
+
+
+class QRDecoder:
+    """
+    Persistent QR detector with a cheap input path.
+
+    cv2.QRCodeDetector isn't safe to share between threads, so each thread
+    keeps its own, created once. Frames are converted to grayscale and
+    downscaled before detection; detectAndDecodeMulti reads every code in
+    view in one pass.
+    """
+
+    def __init__(self, max_width=QR_MAX_WIDTH, full_res_retry=QR_FULL_RES_RETRY):
+        self.max_width = max_width
+        self.full_res_retry = full_res_retry
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.hits = 0
+        self.retries = 0
+        self.total_ms = 0.0
+
+    def _detector(self):
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            detector = self._local.detector = cv2.QRCodeDetector()
+        return detector
+
+    def _prepare(self, image):
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        h, w = gray.shape
+        if self.max_width and w > self.max_width:
+            scale = self.max_width / w
+            small = cv2.resize(gray, (self.max_width, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+            return gray, small
+        return gray, None
+
+    def _decode(self, img):
+        """Returns (located, payloads)."""
+        ok, decoded, _, _ = self._detector().detectAndDecodeMulti(img)
+        if not ok:
+            return False, []
+        # Codes that were located but not decoded come back as ''
+        return True, [d for d in decoded if d]
+
+    def decode(self, image):
+        """Returns every QR payload in the frame (possibly empty)."""
+        t0 = time.perf_counter()
+        gray, small = self._prepare(image)
+        located, codes = self._decode(small if small is not None else gray)
+        retried = False
+        if not codes and small is not None and (
+                self.full_res_retry == "always" or (self.full_res_retry == "located" and located)):
+            _, codes = self._decode(gray)
+            retried = True
+        with self._lock:
+            self.frames += 1
+            self.hits += bool(codes)
+            self.retries += retried
+            self.total_ms += (time.perf_counter() - t0) * 1000
+        return codes
+
+    def stats(self):
+        with self._lock:
+            return {
+                "frames": self.frames,
+                "hits": self.hits,
+                "full_res_retries": self.retries,
+                "avg_ms": round(self.total_ms / self.frames, 3) if self.frames else None,
+                "max_width": self.max_width,
+            }
@@ -0,0 +1,138 @@
+"""
+Compact record types for slot state and agent actions.
+
+Slots are read as plain tuples and wrapped in a NamedTuple (no per-row dict
+or sqlite3.Row), and serialized by slots_json() straight from the tuples.
+Agent actions are __slots__ classes instead of nested dicts.
+"""
+from json.encoder import encode_basestring_ascii
+from typing import NamedTuple, Optional
+
+# Explicit order: migrated databases have temp_reg_num last, so never SELECT *
+SLOT_COLUMNS = ("slot_id", "size_type", "status", "reg_num", "temp_reg_num", "entry_time", "is_verified")
+SLOT_SELECT = f"SELECT {', '.join(SLOT_COLUMNS)} FROM slots"
+
+
+class SlotRecord(NamedTuple):
+    slot_id: str
+    size_type: str
+    status: str
+    reg_num: Optional[str]
+    temp_reg_num: Optional[str]
+    entry_time: Optional[str]
+    is_verified: int
+
+    def to_dict(self):
+        return self._asdict()
+
+
+def fetch_slot_rows(conn, where="", params=()):
+    """All slots (optionally filtered) as plain tuples in SLOT_COLUMNS order, by slot_id."""
+    return conn.execute(f"{SLOT_SELECT} {where} ORDER BY slot_id", params).fetchall()
+
+
+def fetch_slots(conn, where="", params=()):
+    """Same rows wrapped as SlotRecords."""
+    return list(map(SlotRecord._make, fetch_slot_rows(conn, where, params)))
+
+
+def _json_str(value):
+    return "null" if value is None else encode_basestring_ascii(value)
+
+
+def _json_int(value):
+    return "null" if value is None else str(int(value))
+
+
+# Keys in sorted order, matching what jsonify() produced for dict(row)
+_SLOT_JSON = ('{"entry_time":%s,"is_verified":%s,"reg_num":%s,"size_type":%s,'
+              '"slot_id":%s,"status":%s,"temp_reg_num":%s}')
+
+
+# Encoded rows per scope (one lot's slots), keyed by slot_id and kept with the
+# row they encode: between polls almost every slot is unchanged, so most rows
+# cost one lookup and compare. Each call keeps only the rows it was given, so
+# past states of a slot don't pile up.
+_row_json_cache = {}
+# Larger slot lists are encoded without caching
+ROW_JSON_CACHE_MAX = 20000
+
+
+def slot_json(record):
+    slot_id, size_type, status, reg_num, temp_reg_num, entry_time, is_verified = record
+    return _SLOT_JSON % (_json_str(entry_time), _json_int(is_verified), _json_str(reg_num),
+                         _json_str(size_type), _json_str(slot_id), _json_str(status),
+                         _json_str(temp_reg_num))
+
+
+def slots_json(records, scope=""):
+    """
+    JSON array of slot objects (SlotRecords or raw rows), built without intermediate dicts.
+
+    Args:
+        scope: names the slot set (e.g. the lot id) whose encoded rows are
+            reused from the previous call with the same scope.
+    """
+    if len(records) > ROW_JSON_CACHE_MAX:
+        return "[" + ",".join(map(slot_json, records)) + "]"
+    previous = _row_json_cache.get(scope, {})
+    current = {}
+    parts = []
+    for record in records:
+        cached = previous.get(record[0])
+        if cached is not None and cached[0] == record:
+            encoded = cached[1]
+        else:
+            encoded = slot_json(record)
+        current[record[0]] = (tuple(record), encoded)
+        parts.append(encoded)
+    # Swapped whole, so concurrent callers never see a half-built dict
+    _row_json_cache[scope] = current
+    return "[" + ",".join(parts) + "]"
+
+
+class Grant:
+    """Payload of a GRANT_ACCESS action."""
+
+    __slots__ = ("reg_num", "slot_id", "is_reservation", "size", "booking_id")
+
+    def __init__(self, reg_num, slot_id, is_reservation=False, size="medium", booking_id=None):
+        self.reg_num = reg_num
+        self.slot_id = slot_id
+        self.is_reservation = is_reservation
+        self.size = size
+        # Pre-booking (reservations.py) this entry claims, if any
+        self.booking_id = booking_id
+
+    def __repr__(self):
+        return (f"Grant({self.reg_num!r}, {self.slot_id!r}, is_reservation={self.is_reservation}, "
+                f"size={self.size!r}, booking_id={self.booking_id!r})")
+
+
+class Action:
+    """
+    A decision made by ParkingAgent.decide() for ParkingAgent.act().
+
+    type is one of GRANT_ACCESS, DENY_ACCESS, RELEASE_SLOT, RESET_ALL; data
+    carries the action's payload (a Grant, or the plate for RELEASE_SLOT),
+    reason the message for a denial.
+    """
+
+    __slots__ = ("type", "data", "reason")
+
+    def __init__(self, type, data=None, reason=None):
+        self.type = type
+        self.data = data
+        self.reason = reason
+
+    @classmethod
+    def from_dict(cls, action):
+        """Accepts the older {'type': ..., 'data': {...}} form."""
+        data = action.get("data")
+        if action.get("type") == "GRANT_ACCESS" and isinstance(data, dict):
+            data = Grant(data["reg_num"], data["slot_id"], data.get("is_reservation", False),
+                         data.get("size", "medium"), data.get("booking_id"))
+        return cls(action.get("type"), data, action.get("reason"))
+
+    def __repr__(self):
+        return f"Action({self.type!r}, data={self.data!r}, reason={self.reason!r})"
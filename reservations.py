@@ -0,0 +1,385 @@
+"""
+Pre-booking engine: time-windowed holds per size class.
+
+A booking holds capacity in a size class for [start, end), not a particular
+slot; the slot is picked when the vehicle reaches the gate. Per size class,
+an IntervalMaxTree over BOOKING_GRANULARITY_MINUTES buckets counts the
+overlapping bookings, so "is there room for size X between t1 and t2" is one
+O(log n) range-max query.
+
+A held booking must be claimed at the gate by start + HOLD_GRACE_MINUTES or
+it expires; the expiry thread sleeps until the next deadline. While a hold is
+pending (from EARLY_ARRIVAL_MINUTES before start), walk-ins leave that many
+free slots of its size alone.
+
+Bookings live in the `bookings` table; the in-memory trees reload when
+another process changes them (booking_meta version).
+"""
+import os
+import time
+import heapq
+import sqlite3
+import datetime
+import threading
+
+import lot_state
+
+DB_NAME = "parking.db"
+
+BOOKING_GRANULARITY_MINUTES = 5
+# Bookings may start at most this far ahead and last at most MAX_BOOKING_HOURS
+HORIZON_DAYS = int(os.environ.get("BOOKING_HORIZON_DAYS", "14"))
+MAX_BOOKING_HOURS = 24
+# Share of each size class that can be pre-booked; the rest is for walk-ins
+BOOKABLE_FRACTION = float(os.environ.get("BOOKABLE_FRACTION", "0.5"))
+EARLY_ARRIVAL_MINUTES = int(os.environ.get("BOOKING_EARLY_MINUTES", "15"))
+HOLD_GRACE_MINUTES = int(os.environ.get("BOOKING_GRACE_MINUTES", "15"))
+# Seconds between booking-version checks, and the longest the expiry thread sleeps
+FRESHNESS_INTERVAL = 0.25
+SCHEDULER_MAX_SLEEP = 60
+
+
+def init_booking_tables(conn):
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS bookings (
+                    booking_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    reg_num TEXT,
+                    size_type TEXT,
+                    start_time TEXT,
+                    end_time TEXT,
+                    status TEXT DEFAULT 'held',
+                    slot_id TEXT,
+                    created_at TEXT
+                )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bookings_status_end ON bookings (status, end_time)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bookings_reg_num ON bookings (reg_num)")
+    # Bumped by every booking change so other processes know to reload
+    c.execute("CREATE TABLE IF NOT EXISTS booking_meta (key TEXT PRIMARY KEY, value INTEGER)")
+    c.execute("INSERT OR IGNORE INTO booking_meta (key, value) VALUES ('version', 0)")
+
+
+def _bump_version(cursor):
+    cursor.execute("UPDATE booking_meta SET value = value + 1 WHERE key = 'version'")
+
+
+class IntervalMaxTree:
+    """Range add / range max over n buckets (segment tree, lazy adds kept at the node)."""
+
+    def __init__(self, n):
+        self.size = 1
+        while self.size < n:
+            self.size *= 2
+        self.tree = [0] * (2 * self.size)
+        self.pending = [0] * (2 * self.size)
+
+    def add(self, lo, hi, value):
+        """Adds value to buckets [lo, hi)."""
+        self._add(1, 0, self.size, max(lo, 0), min(hi, self.size), value)
+
+    def _add(self, node, node_lo, node_hi, lo, hi, value):
+        if hi <= node_lo or node_hi <= lo:
+            return
+        if lo <= node_lo and node_hi <= hi:
+            self.tree[node] += value
+            self.pending[node] += value
+            return
+        mid = (node_lo + node_hi) // 2
+        self._add(2 * node, node_lo, mid, lo, hi, value)
+        self._add(2 * node + 1, mid, node_hi, lo, hi, value)
+        self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1]) + self.pending[node]
+
+    def max(self, lo, hi):
+        """Largest bucket value in [lo, hi)."""
+        lo, hi = max(lo, 0), min(hi, self.size)
+        return self._max(1, 0, self.size, lo, hi) if lo < hi else 0
+
+    def _max(self, node, node_lo, node_hi, lo, hi):
+        if lo <= node_lo and node_hi <= hi:
+            return self.tree[node]
+        mid = (node_lo + node_hi) // 2
+        best = None
+        if lo < mid:
+            best = self._max(2 * node, node_lo, mid, lo, hi)
+        if hi > mid:
+            right = self._max(2 * node + 1, mid, node_hi, lo, hi)
+            best = right if best is None else max(best, right)
+        return best + self.pending[node]
+
+
+def _parse(value):
+    return value if isinstance(value, datetime.datetime) else datetime.datetime.fromisoformat(value)
+
+
+class ReservationEngine:
+    def __init__(self, db_name=DB_NAME):
+        self.db_name = db_name
+        self._lock = threading.RLock()
+        self._conn = None
+        self._data_version = None
+        self._version = None
+        self._checked_at = 0.0
+        self._loaded_at = None
+        self._wakeup = threading.Event()
+        self.base = None
+        self.trees = {}
+        self.held = {}          # booking_id -> booking dict (status 'held')
+        self.by_plate = {}      # reg_num -> [booking_id]
+        self._deadlines = []    # heap of (expiry datetime, booking_id)
+        self.expired = 0
+        self.matched = 0
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        return self._conn
+
+    # --- Index ---
+
+    def _bucket(self, when):
+        return int((when - self.base).total_seconds() // (BOOKING_GRANULARITY_MINUTES * 60))
+
+    def _span(self, start, end):
+        # Partially covered buckets count as taken
+        return self._bucket(start), self._bucket(end - datetime.timedelta(microseconds=1)) + 1
+
+    def _index(self, booking, value):
+        tree = self.trees.get(booking["size_type"])
+        if tree is not None:
+            tree.add(*self._span(booking["start"], booking["end"]), value)
+
+    def _reload(self, conn, now):
+        # Buckets start far enough back to cover bookings already running
+        minutes = BOOKING_GRANULARITY_MINUTES
+        floored = now.replace(second=0, microsecond=0) - datetime.timedelta(minutes=now.minute % minutes)
+        self.base = floored - datetime.timedelta(hours=MAX_BOOKING_HOURS)
+        # Reloaded daily, so cover the horizon plus a day either side of the booking length
+        n = int((HORIZON_DAYS * 24 + 3 * MAX_BOOKING_HOURS + 24) * 60 // minutes)
+        self.trees = {size: IntervalMaxTree(n) for size in lot_state.SIZES}
+        self.held, self.by_plate, self._deadlines = {}, {}, []
+        # Claimed bookings keep their capacity until their window ends
+        rows = conn.execute('''SELECT booking_id, reg_num, size_type, start_time, end_time, status FROM bookings
+                               WHERE status IN ('held', 'checked_in') AND end_time > ?''', (now.isoformat(),)).fetchall()
+        for booking_id, reg_num, size_type, start, end, status in rows:
+            booking = {"booking_id": booking_id, "reg_num": reg_num, "size_type": size_type,
+                       "start": _parse(start), "end": _parse(end)}
+            if status == "held":
+                self._track(booking)
+            else:
+                self._index(booking, 1)
+
+    def _track(self, booking):
+        self.held[booking["booking_id"]] = booking
+        self.by_plate.setdefault(booking["reg_num"], []).append(booking["booking_id"])
+        self._index(booking, 1)
+        deadline = booking["start"] + datetime.timedelta(minutes=HOLD_GRACE_MINUTES)
+        if not self._deadlines or deadline < self._deadlines[0][0]:
+            self._wakeup.set()
+        heapq.heappush(self._deadlines, (deadline, booking["booking_id"]))
+
+    def refresh(self, force=False):
+        """Reloads when bookings changed in another process, or daily to move the bucket window."""
+        mono = time.monotonic()
+        if not force and self._version is not None and mono - self._checked_at < FRESHNESS_INTERVAL:
+            return
+        with self._lock:
+            conn = self._connection()
+            now = datetime.datetime.now()
+            self._checked_at = mono
+            window_stale = self._loaded_at is None or now - self._loaded_at >= datetime.timedelta(days=1)
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if not force and not window_stale and data_version == self._data_version:
+                return
+            self._data_version = data_version
+            # Slot writes move data_version too; only a booking change needs a reload
+            version = conn.execute("SELECT value FROM booking_meta WHERE key = 'version'").fetchone()[0]
+            if force or window_stale or version != self._version:
+                self._reload(conn, now)
+                self._version = version
+                self._loaded_at = now
+
+    # --- Queries ---
+
+    def bookable_capacity(self, size_type):
+        lot_state.get_state(self.db_name).refresh()
+        return int(lot_state.get_state(self.db_name).capacity_by_size().get(size_type, 0) * BOOKABLE_FRACTION)
+
+    def available(self, size_type, start, end):
+        """Bookings of this size that could still be added over all of [start, end)."""
+        self.refresh()
+        with self._lock:
+            tree = self.trees.get(size_type)
+            if tree is None:
+                return 0
+            return max(0, self.bookable_capacity(size_type) - tree.max(*self._span(_parse(start), _parse(end))))
+
+    def match(self, reg_num, now=None):
+        """The held booking this vehicle may claim now, or None."""
+        self.refresh()
+        now = now or datetime.datetime.now()
+        early = datetime.timedelta(minutes=EARLY_ARRIVAL_MINUTES)
+        grace = datetime.timedelta(minutes=HOLD_GRACE_MINUTES)
+        with self._lock:
+            for booking_id in self.by_plate.get(reg_num, ()):
+                booking = self.held[booking_id]
+                if booking["start"] - early <= now <= booking["start"] + grace:
+                    return booking
+        return None
+
+    def pending_holds(self, size_type, now=None):
+        """Held bookings of this size whose vehicle is due now: walk-ins must leave their slots free."""
+        self.refresh()
+        now = now or datetime.datetime.now()
+        early = datetime.timedelta(minutes=EARLY_ARRIVAL_MINUTES)
+        grace = datetime.timedelta(minutes=HOLD_GRACE_MINUTES)
+        with self._lock:
+            return sum(1 for b in self.held.values()
+                       if b["size_type"] == size_type and b["start"] - early <= now <= b["start"] + grace)
+
+    # --- Changes ---
+
+    def book(self, reg_num, size_type, start, end):
+        """
+        Returns:
+            The booking dict, or None if the size class is fully booked in that window.
+        Raises:
+            ValueError: invalid size or window.
+        """
+        start, end = _parse(start), _parse(end)
+        now = datetime.datetime.now()
+        if size_type not in lot_state.SIZES:
+            raise ValueError(f"Unknown size {size_type!r}")
+        if not start < end or end - start > datetime.timedelta(hours=MAX_BOOKING_HOURS):
+            raise ValueError(f"Window must be positive and at most {MAX_BOOKING_HOURS} h")
+        if end <= now or start > now + datetime.timedelta(days=HORIZON_DAYS):
+            raise ValueError(f"Window must end in the future and start within {HORIZON_DAYS} days")
+
+        conn = sqlite3.connect(self.db_name, timeout=10, isolation_level=None)
+        try:
+            c = conn.cursor()
+            # Write lock first, so two processes can't both take the last place
+            c.execute("BEGIN IMMEDIATE")
+            self.refresh(force=True)
+            if self.available(size_type, start, end) <= 0:
+                c.execute("ROLLBACK")
+                return None
+            c.execute('''INSERT INTO bookings (reg_num, size_type, start_time, end_time, status, created_at)
+                         VALUES (?, ?, ?, ?, 'held', ?)''',
+                      (reg_num, size_type, start.isoformat(), end.isoformat(), now.isoformat()))
+            booking = {"booking_id": c.lastrowid, "reg_num": reg_num, "size_type": size_type, "start": start, "end": end}
+            _bump_version(c)
+            c.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        # Every change bumps the version; reload rather than patch the trees
+        self.refresh(force=True)
+        print(f"[Reservations] Booked {size_type} for {reg_num}: {start:%Y-%m-%d %H:%M} - {end:%H:%M}")
+        return booking
+
+    def _close(self, cursor, booking_id, status, slot_id=None):
+        cursor.execute("UPDATE bookings SET status = ?, slot_id = ? WHERE booking_id = ? AND status = 'held'",
+                       (status, slot_id, booking_id))
+        if cursor.rowcount:
+            _bump_version(cursor)
+        return cursor.rowcount > 0
+
+    def cancel(self, booking_id):
+        with sqlite3.connect(self.db_name, timeout=10) as conn:
+            cancelled = self._close(conn.cursor(), booking_id, "cancelled")
+            conn.commit()
+        if cancelled:
+            self.refresh(force=True)
+        return cancelled
+
+    def check_in(self, cursor, booking_id, slot_id):
+        """
+        Marks the booking claimed, inside the gate's transaction. The in-memory
+        hold goes on the next refresh (the version moved), or straight away via
+        claimed() once the caller has committed.
+        """
+        return self._close(cursor, booking_id, "checked_in", slot_id)
+
+    def claimed(self):
+        self.matched += 1
+        self.refresh(force=True)
+
+    def expire_due(self, now=None):
+        """Expires held bookings not claimed by start + grace. Returns how many."""
+        now = now or datetime.datetime.now()
+        self.refresh()
+        due = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] < now:
+                _, booking_id = heapq.heappop(self._deadlines)
+                if booking_id in self.held:
+                    due.append(booking_id)
+        if not due:
+            return 0
+        with sqlite3.connect(self.db_name, timeout=10) as conn:
+            c = conn.cursor()
+            expired = [booking_id for booking_id in due if self._close(c, booking_id, "expired")]
+            conn.commit()
+        self.refresh(force=True)
+        self.expired += len(expired)
+        if expired:
+            print(f"[Reservations] Expired {len(expired)} unclaimed hold(s): {expired}")
+        return len(expired)
+
+    def next_deadline(self):
+        with self._lock:
+            return self._deadlines[0][0] if self._deadlines else None
+
+    def upcoming(self):
+        self.refresh()
+        with self._lock:
+            bookings = sorted(self.held.values(), key=lambda b: b["start"])
+        return [{**b, "start": b["start"].isoformat(), "end": b["end"].isoformat()} for b in bookings]
+
+    def stats(self):
+        self.refresh()
+        with self._lock:
+            return {
+                "held": len(self.held),
+                "matched": self.matched,
+                "expired": self.expired,
+                "bookable_capacity": {s: self.bookable_capacity(s) for s in lot_state.SIZES},
+            }
+
+    def start_expiry_thread(self):
+        """Expires holds as their deadlines pass (sleeps until the next one)."""
+        def loop():
+            while True:
+                try:
+                    self.expire_due()
+                except Exception as e:
+                    print(f"[Reservations] Expiry failed: {e}")
+                deadline = self.next_deadline()
+                wait = SCHEDULER_MAX_SLEEP
+                if deadline is not None:
+                    wait = min(wait, max(0.0, (deadline - datetime.datetime.now()).total_seconds()) + 0.01)
+                self._wakeup.wait(wait)
+                self._wakeup.clear()
+
+        t = threading.Thread(target=loop, name="booking-expiry", daemon=True)
+        t.start()
+        return t
+
+
+# One engine per lot database
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(db_name=DB_NAME):
+    engine = _engines.get(db_name)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(db_name)
+            if engine is None:
+                engine = ReservationEngine(db_name)
+                _engines[db_name] = engine
+    return engine
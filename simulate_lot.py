@@ -0,0 +1,455 @@
+"""
+Discrete-event simulation of a lot under morning-rush traffic.
+
+Generates arrivals (a Gaussian rush on top of a base rate), lognormal stays,
+wrong-slot parking with admin resolutions, slot verifications and dashboard
+polls, and replays them in simulated-time order against the real Flask app
+and ParkingAgent, in-process, on a throwaway database. Camera, QR decoder
+and OCR are fakes: the gate camera "shows" the arriving plate (misread at
+--ocr-error), so /anpr still runs preprocessing and plate correction.
+
+Events within the same --window of simulated time run concurrently on
+--threads workers, as they would from several gates and phones.
+
+Reports throughput, latency percentiles per route, write-lock waits,
+allocation quality and integrity (no slot granted to two vehicles, the slot
+journal matches the slots table). Exits non-zero on an integrity failure.
+
+Usage:
+    python simulate_lot.py [--slots 1000] [--hours 4] [--threads 8] [--json report.json]
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import shutil
+import sqlite3
+import argparse
+import itertools
+import tempfile
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+SIZES = ("small", "medium", "large")
+RESOLUTIONS = ("accept", "reject", "resolved")
+
+
+def _parse_mix(text):
+    """'small=0.3,medium=0.5,large=0.2' -> normalized probabilities in SIZES order."""
+    parts = dict(item.split("=") for item in text.split(","))
+    weights = np.array([float(parts.get(size, 0)) for size in SIZES])
+    return weights / weights.sum()
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class FakeCamera:
+    """Stands in for SharedCamera: always a blank frame."""
+
+    def __init__(self):
+        self.frame = np.zeros((120, 160, 3), np.uint8)
+
+    def get_frame(self):
+        return self.frame.copy()
+
+
+class FakeQRDecoder:
+    """No QR passes at the gate: every read goes through OCR."""
+
+    def decode(self, image):
+        return []
+
+
+class FakeOCR:
+    """Stands in for easyocr.Reader: reads the plate the calling thread is showing the camera."""
+
+    def __init__(self):
+        self.showing = threading.local()
+
+    def readtext(self, image, allowlist=None):
+        plate = getattr(self.showing, "plate", None)
+        return [([[0, 0], [1, 0], [1, 1], [0, 1]], plate, 0.92)] if plate else []
+
+
+class Simulation:
+    def __init__(self, server, args):
+        self.server = server
+        self.args = args
+        self.rng = np.random.default_rng(args.seed)
+        self.client = server.app.test_client()
+        self.ocr = server.parking_agent.ocr_reader
+        # One gate camera: captures are taken one at a time
+        self.camera_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.size_mix = _parse_mix(args.size_mix)
+        self.resolution_mix = np.array([args.accept, args.reject, 1 - args.accept - args.reject])
+
+        with sqlite3.connect("parking.db") as conn:
+            self.slot_size = dict(conn.execute("SELECT slot_id, size_type FROM slots").fetchall())
+        self.slot_ids = sorted(self.slot_size)
+
+        self.events = []
+        self.seq = itertools.count()
+        self.latency = defaultdict(list)
+        self.responses = Counter()
+        self.outcomes = Counter()
+        self.denied = Counter()
+        self.holder = {}           # slot_id -> plate, as the simulation saw the grants
+        self.double_allocations = []
+        self.occupancy = []        # (sim time, slots held)
+        self.gate_distance = []
+        self.distance = {}         # slot_id -> normalized distance from the gate
+        self.journal_version = None
+
+    # --- Event generation ---
+
+    def schedule(self, t, kind, vehicle=None):
+        heapq.heappush(self.events, (t, next(self.seq), kind, vehicle))
+
+    def _plate(self, i):
+        letters = "ABCDEFGHJKLMNPRSTUVWXY"
+        r = self.rng.integers(0, len(letters), 2)
+        return f"MH{12 + i % 40:02d}{letters[r[0]]}{letters[r[1]]}{i % 10000:04d}"
+
+    def generate(self):
+        """Arrivals by thinning a Poisson process at the peak rate."""
+        a = self.args
+        horizon = a.hours * 3600
+        peak_rate = (a.base_rate + a.peak_rate) / 60
+        t, n = 0.0, 0
+        while True:
+            t += self.rng.exponential(1 / peak_rate)
+            if t >= horizon:
+                break
+            rate = a.base_rate + a.peak_rate * np.exp(-((t / 3600 - a.peak_at) ** 2) / (2 * a.peak_width ** 2))
+            if self.rng.random() < rate / 60 / peak_rate:
+                size = SIZES[self.rng.choice(len(SIZES), p=self.size_mix)]
+                self.schedule(t, "arrive", {"plate": self._plate(n), "size": size})
+                n += 1
+        for t in np.arange(0, horizon, a.poll_seconds):
+            self.schedule(float(t), "poll")
+        return n
+
+    def _misread(self, plate):
+        """One confusable character swapped, like a glare or dirt on the plate."""
+        import plate_index
+        if self.rng.random() >= self.args.ocr_error:
+            return plate
+        i = int(self.rng.integers(2, len(plate)))
+        swap = plate_index.LETTER_MAP.get(plate[i]) or plate_index.NUMBER_MAP.get(plate[i])
+        return plate[:i] + swap + plate[i + 1:] if swap else plate
+
+    def _stay(self):
+        sigma = self.args.dwell_sigma
+        return float(self.rng.lognormal(np.log(self.args.dwell_minutes * 60) - sigma ** 2 / 2, sigma))
+
+    # --- HTTP ---
+
+    def call(self, route, method, path, **kwargs):
+        t0 = time.perf_counter()
+        res = getattr(self.client, method)(path, **kwargs)
+        elapsed = time.perf_counter() - t0
+        with self.lock:
+            self.latency[route].append(elapsed)
+            self.responses[(route, res.status_code)] += 1
+        return res
+
+    def count(self, outcome, n=1):
+        with self.lock:
+            self.outcomes[outcome] += n
+
+    # --- Handlers: each returns follow-ups as (delay seconds, kind, vehicle) ---
+
+    def arrive(self, v):
+        shown = self._misread(v["plate"])
+        if shown != v["plate"]:
+            self.count("plate_misread_at_camera")
+        with self.camera_lock:
+            self.ocr.showing.plate = shown
+            res = self.call("anpr", "post", "/anpr")
+            self.ocr.showing.plate = None
+        read = (res.get_json(silent=True) or {}).get("reg_num")
+        if res.status_code != 200 or not read:
+            self.count("anpr_failed")
+            read = v["plate"]  # the attendant types it in
+        elif read != v["plate"]:
+            self.count("plate_misread_after_correction")
+
+        res = self.call("entry", "post", "/entry", json={"reg_num": read, "vehicle_size": v["size"]})
+        body = res.get_json(silent=True) or {}
+        if res.status_code != 200:
+            with self.lock:
+                self.denied[body.get("error", res.status_code)] += 1
+            return []
+
+        slot_id = body["assigned_slot"]
+        with self.lock:
+            if slot_id in self.holder:
+                self.double_allocations.append((slot_id, self.holder[slot_id], v["plate"]))
+            self.holder[slot_id] = v["plate"]
+            self.outcomes["granted"] += 1
+            self.outcomes["size_upgrades"] += self.slot_size.get(slot_id) != v["size"]
+            self.gate_distance.append(self.distance.get(slot_id, 0.0))
+        v["slot"] = slot_id
+        return [(self.rng.exponential(self.args.drive_seconds), "park", v)]
+
+    def park(self, v):
+        follow = [(self._stay(), "depart", v)]
+        with self.lock:
+            empty = [s for s in self.slot_ids if s not in self.holder] if self.rng.random() < self.args.misuse else []
+        if empty:
+            # Parked in someone else's (still empty) slot instead of the assigned one
+            v["parked"] = empty[int(self.rng.integers(0, len(empty)))]
+            self.count("wrong_slot")
+            follow.append((0.0, "verify", v))
+        else:
+            v["parked"] = v["slot"]
+            if self.rng.random() < self.args.verify:
+                follow.append((0.0, "verify", v))
+        return follow
+
+    def verify(self, v):
+        res = self.call("verify", "post", "/process_verification", data={"slot_id": v["parked"], "reg_num": v["plate"]})
+        status = (res.get_json(silent=True) or {}).get("status", res.status_code)
+        self.count(f"verify_{status}")
+        if status == "misuse":
+            return [(self.rng.exponential(self.args.admin_seconds), "resolve", v)]
+        return []
+
+    def resolve(self, v):
+        decision = RESOLUTIONS[self.rng.choice(len(RESOLUTIONS), p=self.resolution_mix)]
+        self.call("resolve", "post", "/resolve_misuse",
+                  json={"slot_id": v["parked"], "reg_num": v["plate"], "decision": decision})
+        self.count(f"misuse_{decision}")
+        if decision == "accept":
+            with self.lock:
+                if self.holder.get(v["slot"]) == v["plate"]:
+                    del self.holder[v["slot"]]
+                self.holder[v["parked"]] = v["plate"]
+            v["slot"] = v["parked"]
+            return []
+        # Told to move: the driver re-parks in the assigned slot and scans it
+        v["parked"] = v["slot"]
+        return [(self.rng.exponential(self.args.drive_seconds), "verify", v)]
+
+    def depart(self, v):
+        res = self.call("exit", "post", "/exit", json={"reg_num": v["plate"]})
+        body = res.get_json(silent=True) or {}
+        if res.status_code != 200:
+            self.count(f"exit_{res.status_code}")
+            return []
+        with self.lock:
+            freed = body.get("freed_slot")
+            if self.holder.get(freed) == v["plate"]:
+                del self.holder[freed]
+            else:
+                self.outcomes["exit_freed_unexpected_slot"] += 1
+        return []
+
+    def poll(self, v):
+        params = {"format": "columnar"}
+        if self.journal_version is not None:
+            params["since"] = self.journal_version
+        res = self.call("slots", "get", "/api/slots", query_string=params)
+        if res.status_code == 200:
+            self.journal_version = res.get_json()["version"]
+        self.call("summary", "get", "/api/lot_summary")
+        return []
+
+    # --- Replay ---
+
+    def _run(self, event):
+        t, _, kind, vehicle = event
+        try:
+            return t, getattr(self, kind)(vehicle)
+        except Exception as e:
+            self.count(f"crash_{kind}")
+            print(f"[Sim] {kind} failed at t={t:.0f}s: {e}")
+            return t, []
+
+    def run(self):
+        import assignment
+        import lot_state
+        state = lot_state.get_state("parking.db")
+        state.refresh(force=True)
+        features = assignment.Features(state.slot_ids, {})
+        self.distance = dict(zip(state.slot_ids.tolist(), features.entrance.tolist()))
+
+        arrivals = self.generate()
+        print(f"[Sim] {len(self.slot_size)} slots, {arrivals} arrivals over {self.args.hours} h, "
+              f"{self.args.threads} threads, {self.args.window:.0f} s windows")
+        pool = ThreadPoolExecutor(self.args.threads) if self.args.threads > 1 else None
+        waves = 0
+        t_start = time.perf_counter()
+        while self.events:
+            window_end = self.events[0][0] + self.args.window
+            wave = []
+            while self.events and self.events[0][0] < window_end:
+                wave.append(heapq.heappop(self.events))
+            results = pool.map(self._run, wave) if pool else map(self._run, wave)
+            for t, follow in results:
+                for delay, kind, vehicle in follow:
+                    self.schedule(t + delay, kind, vehicle)
+            self.occupancy.append((window_end, len(self.holder)))
+            waves += 1
+        wall = time.perf_counter() - t_start
+        if pool:
+            pool.shutdown()
+        self.waves = waves
+        return arrivals, wall
+
+    def report(self, arrivals, wall):
+        import journal
+        import throttle
+        from event_log import event_log
+        event_log.flush()
+
+        requests = sum(len(v) for v in self.latency.values())
+        routes = {}
+        for route, values in sorted(self.latency.items()):
+            routes[route] = {
+                "count": len(values),
+                "p50_ms": round(_percentile(values, 50) * 1000, 2),
+                "p95_ms": round(_percentile(values, 95) * 1000, 2),
+                "p99_ms": round(_percentile(values, 99) * 1000, 2),
+                "max_ms": round(max(values) * 1000, 2),
+            }
+        server_errors = sum(n for (route, code), n in self.responses.items() if code >= 500)
+
+        with sqlite3.connect("parking.db") as conn:
+            leftover = dict(conn.execute("SELECT status, COUNT(*) FROM slots WHERE status != 'free' GROUP BY status").fetchall())
+        mismatched = journal.verify("parking.db")
+        granted = self.outcomes["granted"]
+        peak_t, peak = max(self.occupancy, key=lambda o: o[1]) if self.occupancy else (0, 0)
+        report = {
+            "slots": len(self.slot_size),
+            "arrivals": arrivals,
+            "wall_seconds": round(wall, 2),
+            "requests": requests,
+            "requests_per_second": round(requests / wall, 1) if wall else 0,
+            "waves": self.waves,
+            "routes": routes,
+            "server_errors": server_errors,
+            "write_lock": throttle.write_lock_waits.stats(),
+            "allocation": {
+                "granted": granted,
+                "denied": sum(self.denied.values()),
+                "denied_by_reason": dict(self.denied),
+                "peak_held": peak,
+                "peak_at_minutes": round(peak_t / 60, 1),
+                "size_upgrade_pct": round(self.outcomes["size_upgrades"] / granted * 100, 1) if granted else 0,
+                "mean_gate_distance": round(float(np.mean(self.gate_distance)), 3) if self.gate_distance else 0,
+            },
+            "outcomes": {k: v for k, v in sorted(self.outcomes.items()) if k not in ("granted", "size_upgrades")},
+            "integrity": {
+                "double_allocations": len(self.double_allocations),
+                "journal_mismatches": len(mismatched),
+                "slots_not_free_at_end": leftover,
+            },
+        }
+        return report
+
+
+def print_report(report):
+    print(f"[Sim] {report['requests']} requests in {report['wall_seconds']} s "
+          f"({report['requests_per_second']} req/s), {report['server_errors']} server errors")
+    for route, r in report["routes"].items():
+        print(f"[Sim]   {route:<8} n={r['count']:<6} p50 {r['p50_ms']:7.2f} ms  p95 {r['p95_ms']:7.2f} ms  "
+              f"p99 {r['p99_ms']:7.2f} ms  max {r['max_ms']:8.2f} ms")
+    w = report["write_lock"]
+    print(f"[Sim] Write lock: {w['acquired']} acquired, {w['failed']} failed, wait p50 {w['p50_wait_ms']} ms, "
+          f"p99 {w['p99_wait_ms']} ms, max {w['max_wait_ms']} ms")
+    a = report["allocation"]
+    print(f"[Sim] Allocation: {a['granted']} granted, {a['denied']} denied, peak {a['peak_held']}/{report['slots']} "
+          f"held at {a['peak_at_minutes']} min, {a['size_upgrade_pct']}% in a larger class, "
+          f"mean gate distance {a['mean_gate_distance']}")
+    if a["denied_by_reason"]:
+        print(f"[Sim]   denied: {a['denied_by_reason']}")
+    print(f"[Sim] Outcomes: {report['outcomes']}")
+    i = report["integrity"]
+    print(f"[Sim] Integrity: {i['double_allocations']} double allocations, {i['journal_mismatches']} journal mismatches, "
+          f"not free at end: {i['slots_not_free_at_end'] or 'none'}")
+
+
+def run(args):
+    # Everything uses the relative "parking.db", so run inside a scratch directory
+    work_dir = tempfile.mkdtemp(prefix="parking_sim_")
+    os.chdir(work_dir)
+    sys.path.insert(0, BASE_DIR)
+    os.environ["RENDER"] = "true"  # skip camera/OCR agent init at import
+    os.environ.setdefault("PERCEPTION_MODE", "local")
+
+    import parking_proto_sensor as server
+    from agent import ParkingAgent
+
+    layout = dict(zip(SIZES, (np.round(_parse_mix(args.layout) * args.slots)).astype(int).tolist()))
+    layout["medium"] += args.slots - sum(layout.values())
+    server.init_db(layout=layout)
+    agent = ParkingAgent(load_ocr=False)
+    agent.ocr_reader = FakeOCR()
+    agent.qr_decoder = FakeQRDecoder()
+    server.parking_agent = agent
+    server.camera_system = FakeCamera()
+    # Gates and phones are many clients; measure the handlers, not the limiter
+    server.rate_limiter.configure({})
+
+    try:
+        sim = Simulation(server, args)
+        report = sim.report(*sim.run())
+    finally:
+        os.chdir(BASE_DIR)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[Sim] Report written to {args.json}")
+
+    i = report["integrity"]
+    ok = not i["double_allocations"] and not i["journal_mismatches"] and not report["server_errors"]
+    print("[Sim] PASS" if ok else "[Sim] FAILED")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slots", type=int, default=1000)
+    parser.add_argument("--layout", default="small=0.3,medium=0.45,large=0.25", help="share of slots per size")
+    parser.add_argument("--size-mix", default="small=0.3,medium=0.5,large=0.2", help="share of arrivals per size")
+    parser.add_argument("--hours", type=float, default=4, help="arrival window (stays run on past it)")
+    parser.add_argument("--base-rate", type=float, default=None, help="arrivals/min outside the rush (default slots/400)")
+    parser.add_argument("--peak-rate", type=float, default=None, help="extra arrivals/min at the rush peak (default slots/90)")
+    parser.add_argument("--peak-at", type=float, default=1.5, help="hours after the start")
+    parser.add_argument("--peak-width", type=float, default=0.75, help="hours (standard deviation)")
+    parser.add_argument("--dwell-minutes", type=float, default=240, help="mean stay")
+    parser.add_argument("--dwell-sigma", type=float, default=0.5, help="lognormal shape of stays")
+    parser.add_argument("--drive-seconds", type=float, default=90, help="mean gate-to-slot time")
+    parser.add_argument("--misuse", type=float, default=0.02, help="share of drivers parking in the wrong slot")
+    parser.add_argument("--verify", type=float, default=0.8, help="share of drivers scanning their slot's QR")
+    parser.add_argument("--admin-seconds", type=float, default=300, help="mean time to resolve a misuse alert")
+    parser.add_argument("--accept", type=float, default=0.6, help="share of misuse alerts accepted")
+    parser.add_argument("--reject", type=float, default=0.25, help="share rejected (the rest: resolved)")
+    parser.add_argument("--ocr-error", type=float, default=0.05, help="share of plates misread by one character")
+    parser.add_argument("--poll-seconds", type=float, default=30, help="dashboard refresh interval")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--window", type=float, default=30, help="simulated seconds replayed concurrently")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the report here")
+    args = parser.parse_args()
+    if args.base_rate is None:
+        args.base_rate = args.slots / 400
+    if args.peak_rate is None:
+        args.peak_rate = args.slots / 90
+    sys.exit(0 if run(args) else 1)
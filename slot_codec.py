@@ -0,0 +1,99 @@
+"""
+Compact slot snapshots and deltas for /api/slots.
+
+The default /api/slots body is a JSON array of one object per slot. The
+compact form is columnar: one array per column, status and size as small
+ints (lot_state codes), and entry_time as epoch seconds. It is sent as JSON
+or, with the `msgpack` package installed, as MessagePack.
+
+Every compact payload carries `version`, the slot journal seq it reflects.
+Passing it back as ?since= returns only the slots changed after it (plus
+`removed` slot_ids), or a full snapshot when the delta would not be smaller
+or the journal behind `since` has been pruned.
+"""
+import json
+import datetime
+import functools
+
+import journal
+import lot_state
+from records import fetch_slot_rows
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMATS = ("columnar", "msgpack") if msgpack else ("columnar",)
+MIMETYPES = {"columnar": "application/json", "msgpack": "application/msgpack"}
+# A delta touching more than this share of the lot is sent as a full snapshot
+MAX_DELTA_FRACTION = 0.5
+
+_STATUS_CODES = lot_state.STATUS_CODES
+_SIZE_CODES = lot_state.SIZE_CODES
+
+
+# Entry times don't change while a vehicle is parked, so each is parsed once
+@functools.lru_cache(maxsize=65536)
+def _epoch(entry_time):
+    if not entry_time:
+        return None
+    try:
+        return int(datetime.datetime.fromisoformat(entry_time).timestamp())
+    except ValueError:
+        return None
+
+
+def columnar(rows):
+    """SLOT_COLUMNS-ordered rows -> dict of parallel column arrays."""
+    slot_ids, sizes, statuses, reg_nums, temp_reg_nums, entry_times, verified = zip(*rows) if rows else ((),) * 7
+    return {
+        "slot_id": list(slot_ids),
+        "size": [_SIZE_CODES.get(s, lot_state.UNKNOWN_SIZE) for s in sizes],
+        "status": [_STATUS_CODES.get(s, lot_state.UNKNOWN_STATUS) for s in statuses],
+        "reg_num": list(reg_nums),
+        "temp_reg_num": list(temp_reg_nums),
+        "entry_time": list(map(_epoch, entry_times)),
+        "is_verified": [int(v or 0) for v in verified],
+    }
+
+
+def journal_version(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM slot_journal").fetchone()[0]
+
+
+def snapshot(conn, since=None):
+    """
+    Full snapshot, or the delta after journal seq `since`.
+
+    The version is read before the rows, so a change racing the read is at
+    worst sent again in the next delta, never skipped.
+    """
+    version = journal_version(conn)
+    payload = {"version": version, "statuses": lot_state.STATUSES, "sizes": lot_state.SIZES}
+
+    # Older than the pruned journal: the delta can't be rebuilt, send everything
+    if since is not None and journal.pruned_through(conn) <= since <= version:
+        changed = [row[0] for row in conn.execute(
+            "SELECT DISTINCT slot_id FROM slot_journal WHERE seq > ? AND slot_id IS NOT NULL", (since,))]
+        total = conn.execute("SELECT COUNT(*) FROM slots").fetchone()[0]
+        if len(changed) <= total * MAX_DELTA_FRACTION:
+            rows = fetch_slot_rows(conn, "WHERE slot_id IN (SELECT slot_id FROM slot_journal WHERE seq > ?)", (since,))
+            # Unless a snapshot pruned the journal while it was being read
+            if journal.pruned_through(conn) <= since:
+                present = {row[0] for row in rows}
+                payload.update(full=False, since=since, removed=sorted(set(changed) - present), slots=columnar(rows))
+                return payload
+
+    payload.update(full=True, removed=[], slots=columnar(fetch_slot_rows(conn)))
+    return payload
+
+
+def encode(payload, fmt):
+    """
+    Returns:
+        (body bytes, mimetype)
+    """
+    if fmt == "msgpack":
+        return msgpack.packb(payload, use_bin_type=True), MIMETYPES[fmt]
+    return json.dumps(payload, separators=(",", ":")).encode(), MIMETYPES[fmt]
@@ -0,0 +1,131 @@
+import threading
+import time
+
+
+class StartupOrchestrator:
+    """
+    Runs startup phases concurrently, respecting declared dependencies.
+
+    Each phase runs in its own daemon thread as soon as all of its
+    dependencies have succeeded. Per-phase status and timings are kept so
+    the server can report readiness (/ready) and time-to-first-request.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.first_request_at = None
+        self._phases = {}
+        self._order = []
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+
+    def add_phase(self, name, fn, depends_on=(), required=True):
+        """
+        Registers a phase.
+
+        Args:
+            name: Unique phase name.
+            fn: Callable with no arguments. Its return value is stored as the phase result.
+            depends_on: Names of phases that must succeed first.
+            required: If False, the phase does not gate overall readiness.
+        """
+        self._phases[name] = {
+            "fn": fn,
+            "depends_on": tuple(depends_on),
+            "required": required,
+            "status": "pending",
+            "result": None,
+            "error": None,
+            "started": None,
+            "finished": None,
+        }
+        self._order.append(name)
+
+    def start(self):
+        """Starts every phase in the background. Returns immediately."""
+        for name in self._order:
+            threading.Thread(target=self._run_phase, args=(name,), name=f"startup-{name}", daemon=True).start()
+
+    def _run_phase(self, name):
+        phase = self._phases[name]
+        with self._cond:
+            while True:
+                dep_states = [self._phases[d]["status"] for d in phase["depends_on"]]
+                if any(s in ("failed", "skipped") for s in dep_states):
+                    phase["status"] = "skipped"
+                    phase["error"] = "dependency failed"
+                    self._cond.notify_all()
+                    print(f"[Startup] Phase '{name}' skipped (dependency failed).")
+                    return
+                if all(s == "ready" for s in dep_states):
+                    break
+                self._cond.wait()
+            phase["status"] = "running"
+            phase["started"] = time.time()
+
+        try:
+            result = phase["fn"]()
+            status, error = "ready", None
+        except Exception as e:
+            result, status, error = None, "failed", str(e)
+            print(f"[Startup] Phase '{name}' failed: {e}")
+
+        with self._cond:
+            phase["result"] = result
+            phase["status"] = status
+            phase["error"] = error
+            phase["finished"] = time.time()
+            self._cond.notify_all()
+        if status == "ready":
+            print(f"[Startup] Phase '{name}' ready in {phase['finished'] - phase['started']:.2f}s")
+
+    def result(self, name):
+        return self._phases[name]["result"]
+
+    def wait_for(self, name, timeout=None):
+        """Blocks until the phase has finished (in any state). Returns its status."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._phases[name]["status"] in ("pending", "running"):
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self._phases[name]["status"]
+
+    def mark_first_request(self):
+        if self.first_request_at is None:
+            self.first_request_at = time.time()
+
+    def is_ready(self):
+        with self._lock:
+            return all(p["status"] == "ready" for p in self._phases.values() if p["required"])
+
+    def report(self):
+        with self._lock:
+            phases = {}
+            for name in self._order:
+                p = self._phases[name]
+                duration = None
+                if p["started"] is not None:
+                    end = p["finished"] if p["finished"] is not None else time.time()
+                    duration = round(end - p["started"], 3)
+                phases[name] = {
+                    "status": p["status"],
+                    "required": p["required"],
+                    "depends_on": list(p["depends_on"]),
+                    "offset_seconds": round(p["started"] - self.started_at, 3) if p["started"] else None,
+                    "duration_seconds": duration,
+                    "error": p["error"],
+                }
+            ready = all(p["status"] == "ready" for p in self._phases.values() if p["required"])
+
+        ttfr = None
+        if self.first_request_at is not None:
+            ttfr = round(self.first_request_at - self.started_at, 3)
+        return {
+            "ready": ready,
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "time_to_first_request_seconds": ttfr,
+            "phases": phases,
+        }
@@ -0,0 +1,117 @@
+let allSlots = [];
+
+async function loadData() {
+    try {
+        const res = await fetch(LOT_PREFIX + '/api/slots');
+        allSlots = await res.json();
+        renderStats();
+        filterData();
+    } catch (e) { console.error("Fetch error", e); }
+}
+
+function renderStats() {
+    const total = allSlots.length;
+    const free = allSlots.filter(s => s.status === 'free').length;
+    const occ = allSlots.filter(s => s.status === 'occupied' || s.status === 'reserved').length;
+
+    document.getElementById('statTotal').innerText = total;
+    document.getElementById('statFree').innerText = free;
+    document.getElementById('statOccupied').innerText = occ;
+}
+
+async function loadInsights() {
+    try {
+        const res = await fetch(LOT_PREFIX + '/api/analytics/history?days=7');
+        const h = await res.json();
+        const peak = h.peak_hours.peak_hour;
+        document.getElementById('statPeakHour').innerText = peak === null ? '--' : `${String(peak).padStart(2, '0')}:00`;
+        const median = h.dwell_minutes.median;
+        document.getElementById('statDwell').innerText = median === null ? '--' : `${Math.round(median)}m`;
+        document.getElementById('statTurnover').innerText = h.turnover.average;
+    } catch (e) { console.error("Insights fetch error", e); }
+}
+
+function filterData() {
+    const search = document.getElementById('searchReg').value.toUpperCase();
+    const status = document.getElementById('filterStatus').value;
+    const size = document.getElementById('filterSize').value;
+
+    const filtered = allSlots.filter(s => {
+        if (status !== 'all' && s.status !== status) return false;
+        if (size !== 'all' && s.size_type !== size) return false;
+        if (search && (!s.reg_num || !s.reg_num.includes(search))) return false;
+        return true;
+    });
+
+    renderTiles(filtered);
+    document.getElementById('visibleCount').innerText = filtered.length;
+
+    const empty = document.getElementById('emptyState');
+    if (filtered.length === 0) empty.classList.remove('d-none');
+    else empty.classList.add('d-none');
+}
+
+function renderTiles(data) {
+    const slotGrid = document.getElementById('slotGrid');
+    slotGrid.innerHTML = '';
+    const now = new Date();
+
+    data.forEach(slot => {
+        // Duration
+        let duration = '';
+        if (slot.entry_time) {
+            const entry = new Date(slot.entry_time);
+            const diffMins = Math.floor((now - entry) / 60000);
+            const hrs = Math.floor(diffMins / 60);
+            const mins = diffMins % 60;
+            duration = `${hrs}h ${mins}m`;
+        }
+
+        // Vehicle
+        let vehicle = '<div class="text-secondary opacity-50 small" style="min-height: 1.5em;">Empty</div>';
+        if (slot.reg_num) {
+            vehicle = `<div class="slot-tile-reg text-warning font-monospace fs-5">${slot.reg_num}</div>`;
+        }
+
+        // Badge Logic
+        let badgeClass = 'bg-secondary';
+        let statusText = slot.status;
+        if (slot.status === 'free') { badgeClass = 'bg-success bg-opacity-10 text-success'; statusText = 'Available'; }
+        if (slot.status === 'occupied') { badgeClass = 'bg-danger bg-opacity-10 text-danger'; statusText = 'Occupied'; }
+        if (slot.status === 'reserved') { badgeClass = 'bg-warning bg-opacity-10 text-warning'; statusText = 'Reserved'; }
+        if (slot.status === 'misuse') { badgeClass = 'bg-warning bg-opacity-10 text-warning'; statusText = 'Misuse'; }
+
+        const tileHtml = `
+            <div class="col-xl-2 col-lg-3 col-md-4 col-sm-6 mb-3">
+                <div class="slot-tile ${slot.status}">
+                    <div class="d-flex justify-content-between align-items-start mb-2">
+                        <h3 class="fw-bold m-0 text-white">${slot.slot_id}</h3>
+                        <div class="status-indicator"></div>
+                    </div>
+
+                    <div class="mb-3">
+                        <div class="text-secondary small text-uppercase fw-bold" style="font-size: 0.7rem; letter-spacing: 1px;">${slot.size_type}</div>
+                    </div>
+
+                    ${vehicle}
+
+                    <div class="mt-3 pt-3 border-top border-secondary border-opacity-10 d-flex justify-content-between align-items-center">
+                        <span class="badge ${badgeClass} rounded-pill border border-opacity-10">${statusText}</span>
+                        <small class="text-secondary" style="font-size: 0.75rem;">${duration}</small>
+                    </div>
+                </div>
+            </div>
+        `;
+        slotGrid.insertAdjacentHTML('beforeend', tileHtml);
+    });
+}
+
+// Update calls to renderTiles
+// filterData() will now call renderTiles
+// loadData() will call filterData() which in turn calls renderTiles
+
+// Auto Load
+loadData();
+setInterval(loadData, 5000);
+loadInsights();
+setInterval(loadInsights, 60000);
@@ -0,0 +1,281 @@
+// --- LOGIC ---
+
+// Track if user is hovering over misuse alert to pause polling updates
+let isHoveringMisuseAlert = false;
+
+// Setup hover detection for misuse alert container
+document.addEventListener('DOMContentLoaded', () => {
+    const container = document.getElementById('misuseAlertContainer');
+    container.addEventListener('mouseenter', () => {
+        isHoveringMisuseAlert = true;
+        console.log('[Polling] Paused - User hovering over misuse alert');
+    });
+    container.addEventListener('mouseleave', () => {
+        isHoveringMisuseAlert = false;
+        console.log('[Polling] Resumed - User left misuse alert area');
+    });
+});
+
+function toggleFeed(gate) {
+    const wrap = document.getElementById(gate + 'FeedWrap');
+    const overlay = wrap.querySelector('.feed-off-overlay');
+    const img = wrap.querySelector('img');
+    const toggleButton = wrap.querySelector('.toggle-feed-btn');
+    const icon = toggleButton.querySelector('i');
+    const textSpan = toggleButton.querySelector('span');
+    const liveBadge = wrap.querySelector('.live-badge');
+
+    if (toggleButton.dataset.state === 'active') { // Currently active, so pause it
+        toggleButton.dataset.state = 'paused';
+        icon.classList.remove('fa-pause');
+        icon.classList.add('fa-play');
+        textSpan.textContent = ' Resume Feed';
+        overlay.style.display = 'flex';
+        img.style.display = 'none';
+        if (liveBadge) liveBadge.style.display = 'none';
+    } else { // Currently paused, so activate it
+        toggleButton.dataset.state = 'active';
+        icon.classList.remove('fa-play');
+        icon.classList.add('fa-pause');
+        textSpan.textContent = ' Pause Feed';
+        overlay.style.display = 'none';
+        img.src = VIDEO_FEED_URL + "?" + new Date().getTime();
+        img.style.display = 'block';
+        if (liveBadge) liveBadge.style.display = 'block';
+    }
+}
+
+let toastTimer;
+function showToast(title, msg, type = 'success') {
+    const t = document.getElementById('toast');
+    const icon = document.getElementById('toastIcon');
+    const tTitle = document.getElementById('toastTitle');
+    const tMsg = document.getElementById('toastMsg');
+
+    if (toastTimer) clearTimeout(toastTimer);
+
+    tTitle.innerText = title;
+    tMsg.innerText = msg;
+
+    if (type === 'success') {
+        t.style.borderLeftColor = 'var(--accent-entry)';
+        icon.innerText = '✅';
+    } else if (type === 'error') {
+        t.style.borderLeftColor = 'var(--accent-exit)';
+        icon.innerText = '❌';
+    } else {
+        t.style.borderLeftColor = '#f59e0b';
+        icon.innerText = '⚠️';
+    }
+
+    // Remove any previous animation classes before adding new ones
+    t.classList.remove('animate__fadeInRight', 'animate__fadeOutRight');
+
+    t.style.display = 'flex';
+    t.classList.add('animate__animated', 'animate__fadeInRight');
+
+    toastTimer = setTimeout(hideToast, 2000);
+}
+
+function hideToast() {
+    const t = document.getElementById('toast');
+    t.classList.remove('animate__fadeInRight'); // Ensure fade-in is removed
+    t.classList.add('animate__fadeOutRight');
+
+    t.addEventListener('animationend', () => {
+        t.style.display = 'none';
+        t.classList.remove('animate__animated', 'animate__fadeOutRight');
+    }, { once: true }); // Ensure the event listener is removed after first execution
+}
+
+async function processEntry() {
+    const reg = document.getElementById('entryReg').value.toUpperCase();
+    const size = document.getElementById('entrySize').value;
+
+    if (!reg) return showToast('Input Required', 'Please enter Registration Number', 'warn');
+
+    try {
+        const res = await fetch(LOT_PREFIX + '/entry', {
+            method: 'POST', headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ reg_num: reg, vehicle_size: size })
+        });
+        const data = await res.json();
+        if (res.ok) {
+            showToast('Entry Approved', `Slot ${data.assigned_slot} Assigned`, 'success');
+            document.getElementById('entryReg').value = '';
+        } else {
+            showToast('Entry Denied', data.error, 'error');
+        }
+    } catch (e) { showToast('Error', e.message, 'error'); }
+}
+
+async function processExit() {
+    const reg = document.getElementById('exitReg').value.toUpperCase();
+    if (!reg) return showToast('Input Required', 'Please enter Registration Number', 'warn');
+
+    try {
+        const res = await fetch(LOT_PREFIX + '/exit', {
+            method: 'POST', headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ reg_num: reg })
+        });
+        const data = await res.json();
+        if (res.ok) {
+            showToast('Checkout Complete', `Duration: ${data.duration_seconds}s`, 'success');
+            document.getElementById('exitReg').value = '';
+        } else {
+            showToast('Error', data.error, 'error');
+        }
+    } catch (e) { showToast('Error', e.message, 'error'); }
+}
+
+async function scanPlate(gate) {
+    showToast('Scanning', 'Detecting License Plate...', 'warn');
+    try {
+        // Determine target input
+        const targetId = gate === 'entry' ? 'entryReg' : 'exitReg';
+        const res = await fetch(LOT_PREFIX + '/anpr', { method: 'POST' });
+        const data = await res.json();
+
+        if (res.ok && data.reg_num) {
+            document.getElementById(targetId).value = data.reg_num;
+            showToast('ANPR Success', `Detected: ${data.reg_num}`, 'success');
+        } else {
+            showToast('Reading Failed', 'Please try again or enter manually.', 'error');
+        }
+    } catch (e) { showToast('System Error', 'Camera/Server unreachable', 'error'); }
+}
+
+async function resetAll() {
+    if (!confirm("Are you sure you want to release ALL slots?\nThis cannot be undone.")) return;
+    try {
+        const res = await fetch(LOT_PREFIX + '/reset', { method: 'POST' });
+        if (res.ok) showToast('System Reset', 'All slots have been completely released.', 'success');
+        else showToast('Error', 'Reset failed', 'error');
+    } catch (e) { showToast('Error', e.message, 'error'); }
+}
+
+async function updateUtilization() {
+    try {
+        const res = await fetch(LOT_PREFIX + '/api/slots');
+        const slots = await res.json();
+        const total = slots.length;
+        // Count Occupied AND Reserved as usage
+        const active = slots.filter(s => s.status === 'occupied' || s.status === 'reserved').length;
+        const percent = total > 0 ? ((active / total) * 100).toFixed(1) : 0;
+
+        document.getElementById('utilizationText').innerText = percent + '%';
+        const bar = document.getElementById('utilizationBar');
+        bar.style.width = percent + '%';
+
+        // Color Logic
+        if (percent > 85) bar.style.background = 'var(--accent-exit)';
+        else if (percent > 50) bar.style.background = '#f59e0b'; // Warn
+        else bar.style.background = 'var(--accent-entry)';
+
+
+        // --- MISUSE CHECK ---
+        // Skip updating alerts if user is hovering over them (to prevent flickering while deciding)
+        if (isHoveringMisuseAlert) {
+            return; // Don't update the misuse alerts while user is interacting
+        }
+
+        const misuseSlots = slots.filter(s => s.status === 'misuse' || s.status === 'rejected');
+        const container = document.getElementById('misuseAlertContainer');
+
+        if (misuseSlots.length > 0) {
+            container.innerHTML = ''; // Clear previous
+            misuseSlots.forEach(slot => {
+                let alertType = 'misuse'; // Default
+                let title = `MISUSE DETECTED AT ${slot.slot_id}`;
+                let desc = `Vehicle <strong>${slot.temp_reg_num || slot.reg_num || 'Unknown'}</strong> is in the wrong slot.`;
+                let buttons = '';
+                let style = '';
+
+                if (slot.status === 'rejected') {
+                    alertType = 'rejected';
+                    title = `⛔ ACCESS DENIED AT ${slot.slot_id}`;
+                    desc = `Vehicle <strong>${slot.temp_reg_num || slot.reg_num || 'Unknown'}</strong> has been rejected. Waiting for departure.`;
+                    style = 'background: rgba(60, 20, 20, 0.95); border: 1px solid rgba(255, 0, 0, 0.3); color: #feb2b2;';
+                    // Static - Waiting for manual clear
+                    buttons = `
+                        <button class="btn btn-success btn-sm fw-bold" onclick="resolveMisuseAction('${slot.slot_id}', '${slot.temp_reg_num || slot.reg_num}', 'resolved')">
+                            <i class="fas fa-flag me-1"></i> Mark as Cleared
+                        </button>
+                    `;
+                } else {
+                    // Standard Misuse
+                    style = 'background: rgba(40, 10, 10, 0.95); border: 1px solid rgba(220, 38, 38, 0.5); color: #fca5a5;';
+                    buttons = `
+                        <button class="btn btn-primary btn-sm fw-bold" onclick="resolveMisuseAction('${slot.slot_id}', '${slot.temp_reg_num || slot.reg_num}', 'accept')">
+                            <i class="fas fa-check me-1"></i> Authorize Here
+                        </button>
+                        <button class="btn btn-warning btn-sm fw-bold text-dark" onclick="resolveMisuseAction('${slot.slot_id}', '${slot.temp_reg_num || slot.reg_num}', 'reject')">
+                            <i class="fas fa-times me-1"></i> Reject
+                        </button>
+                        <button class="btn btn-success btn-sm fw-bold" onclick="resolveMisuseAction('${slot.slot_id}', '${slot.temp_reg_num || slot.reg_num}', 'resolved')">
+                            <i class="fas fa-flag me-1"></i> Resolved (Free)
+                        </button>
+                    `;
+                }
+
+                const alertHtml = `
+                <div class="alert alert-danger misuse-alert-item animate__animated animate__fadeInDown mb-3 shadow-lg" 
+                     style="${style}"
+                     data-slot-id="${slot.slot_id}">
+                    <div class="d-flex flex-wrap align-items-center justify-content-between gap-3">
+                        <div class="d-flex align-items-center gap-3">
+                            <div class="bg-danger bg-opacity-25 p-2 rounded-circle">
+                                <i class="fas fa-radiation fs-4 text-danger"></i>
+                            </div>
+                            <div>
+                                <h5 class="m-0 fw-bold text-white">${title}</h5>
+                                <div class="text-white-50 small">
+                                    ${desc}
+                                </div>
+                            </div>
+                        </div>
+                        <div class="d-flex gap-2">
+                            ${buttons}
+                        </div>
+                    </div>
+                </div>`;
+                container.insertAdjacentHTML('beforeend', alertHtml);
+            });
+        } else {
+            container.innerHTML = '';
+        }
+
+    } catch (e) { console.error(e); }
+}
+
+async function resolveMisuseAction(slotId, regNum, decision) {
+    if (!confirm(`Confirm action: ${decision.toUpperCase()} for ${slotId}?`)) return;
+
+    try {
+        const res = await fetch(LOT_PREFIX + '/resolve_misuse', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                slot_id: slotId,
+                reg_num: regNum,
+                decision: decision
+            })
+        });
+        const data = await res.json();
+        if (data.success) {
+            // Immediately clear the alert container for instant feedback
+            document.getElementById('misuseAlertContainer').innerHTML = '';
+            showToast('Action Success', data.message, 'success');
+            // Force immediate refresh to sync state (mobile will pick this up via polling)
+            updateUtilization();
+        } else {
+            showToast('Error', data.error, 'error');
+        }
+    } catch (e) { showToast('Error', 'Network Error', 'error'); }
+}
+
+// Async function checkSensorAndResolve removed as per user request (No External API)
+
+
+// Update stats every 1 second
+setInterval(updateUtilization, 1000);
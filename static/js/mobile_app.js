@@ -0,0 +1,262 @@
+// Global State
+let CURRENT_PLATE = null;
+
+// --- Session Management ---
+async function loginUser() {
+    const input = document.getElementById('master-plate');
+    const plate = input.value.trim().toUpperCase().replace(/\s/g, '');
+
+    if (plate.length < 4) return alert("Please enter a valid Registration Number");
+
+    CURRENT_PLATE = plate;
+
+    // UI Updates
+    document.getElementById('display-plate').innerText = formatPlate(plate);
+    // document.getElementById('locate-plate-disp').innerText = formatPlate(plate); // Triggered in locateVehicle now
+
+    // Transition
+    document.getElementById('view-welcome').classList.add('hidden');
+    document.getElementById('view-home').classList.remove('hidden');
+    document.getElementById('bottom-nav').classList.remove('translate-y-32');
+
+    // Check Status to decide UI
+    checkStatusAndRoute();
+}
+
+async function checkStatusAndRoute() {
+    try {
+        const res = await fetch(`${LOT_PREFIX}/api/find_vehicle/${CURRENT_PLATE}`);
+        const data = await res.json();
+
+        if (data.found) {
+            if (data.is_verified) {
+                // User is already parked. Unlock Locate.
+                document.getElementById('nav-locate').classList.remove('hidden');
+                // Auto-switch to Locate tab maybe? Or just let them navigate.
+                // Let's stay on Home but show the tab.
+            } else {
+                // User is In-Transit. Hide Locate.
+                document.getElementById('nav-locate').classList.add('hidden');
+                startNavigation(data); // Pass data to save a call
+            }
+        } else {
+            // Not entered yet
+            document.getElementById('nav-locate').classList.add('hidden');
+            startNavigation(data);
+        }
+    } catch (e) { console.error(e); }
+}
+
+function logout() {
+    location.reload();
+}
+
+function formatPlate(p) {
+    // Simple formatter: MH12AB1234 -> MH 12 AB 1234
+    return p;
+}
+
+// --- UI Logic ---
+function tab(name) {
+    document.querySelectorAll('.view').forEach(el => el.classList.add('hidden'));
+    document.getElementById('view-' + name).classList.remove('hidden');
+
+    document.querySelectorAll('.nav-btn').forEach(el => el.classList.replace('opacity-100', 'opacity-40'));
+    document.querySelector(`[data-target="${name}"]`).classList.replace('opacity-40', 'opacity-100');
+
+    if (name !== 'pin' && scanner) stopScanner();
+    if (name === 'locate') locateVehicle();
+}
+
+// --- Navigation Logic ---
+async function startNavigation(cachedData = null) {
+    if (!CURRENT_PLATE) return;
+
+    // Use cached data if provided, otherwise fetch
+    let data = cachedData;
+    if (!data) {
+        try {
+            const res = await fetch(`${LOT_PREFIX}/api/find_vehicle/${CURRENT_PLATE}`);
+            data = await res.json();
+        } catch (e) { return; }
+    }
+
+    const cont = document.getElementById('nav-container');
+    cont.classList.remove('opacity-0');
+
+    if (data.found && !data.is_verified) {
+        document.getElementById('nav-slot-id').innerText = data.slot_id;
+        document.getElementById('nav-status-msg').innerText = "Follow the path to your zone.";
+        initProfessionalMap(data.slot_id);
+    } else if (data.found && data.is_verified) {
+        document.getElementById('nav-slot-id').innerText = "PARKED";
+        document.getElementById('nav-status-msg').innerText = "Vehicle is verified and parked.";
+        // Show a static map or clear it
+    } else {
+        document.getElementById('nav-slot-id').innerText = "--";
+        document.getElementById('nav-status-msg').innerText = "Vehicle has not entered the gate yet.";
+    }
+}
+
+// --- Professional Map (Unchanged Visuals) ---
+function initProfessionalMap(targetId) {
+    const canvas = document.getElementById('mapCanvas');
+    // ... (Keep existing map code if possible, or simple redraw)
+    // usage: I will use the previous map code.
+    drawMap(canvas);
+}
+
+function drawMap(canvas) {
+    const ctx = canvas.getContext('2d');
+    canvas.width = canvas.parentElement.clientWidth;
+    canvas.height = canvas.parentElement.clientHeight;
+
+    const path = [];
+    const startX = 20, startY = canvas.height - 20;
+    const endX = canvas.width - 40, endY = 40;
+
+    path.push({ x: startX, y: startY });
+    path.push({ x: startX, y: canvas.height / 2 });
+    path.push({ x: endX, y: canvas.height / 2 });
+    path.push({ x: endX, y: endY });
+
+    let progress = 0;
+    function animate() {
+        if (!document.getElementById('view-home').classList.contains('hidden')) {
+            ctx.clearRect(0, 0, canvas.width, canvas.height);
+            ctx.beginPath(); ctx.strokeStyle = '#333'; ctx.lineWidth = 14; ctx.lineCap = 'round'; ctx.lineJoin = 'round';
+            ctx.moveTo(path[0].x, path[0].y); for (let i = 1; i < path.length; i++) ctx.lineTo(path[i].x, path[i].y); ctx.stroke();
+
+            ctx.beginPath(); ctx.strokeStyle = '#fff'; ctx.lineWidth = 4; ctx.setLineDash([10, 10]);
+            ctx.moveTo(path[0].x, path[0].y); for (let i = 1; i < path.length; i++) ctx.lineTo(path[i].x, path[i].y); ctx.stroke(); ctx.setLineDash([]);
+
+            const pos = getPosOnPath(progress, path);
+            const pulseSize = 10 + Math.sin(Date.now() / 200) * 4;
+            ctx.fillStyle = 'rgba(59, 130, 246, 0.3)'; ctx.beginPath(); ctx.arc(pos.x, pos.y, pulseSize, 0, Math.PI * 2); ctx.fill();
+            ctx.fillStyle = '#3b82f6'; ctx.beginPath(); ctx.arc(pos.x, pos.y, 6, 0, Math.PI * 2); ctx.fill();
+
+            progress += 0.005; if (progress > 1) progress = 0;
+        }
+        requestAnimationFrame(animate);
+    }
+    animate();
+}
+
+function getPosOnPath(t, path) {
+    const totalSegments = path.length - 1;
+    const segmentT = t * totalSegments;
+    const index = Math.floor(segmentT);
+    const subT = segmentT - index;
+    if (index >= totalSegments) return path[totalSegments];
+    const p1 = path[index]; const p2 = path[index + 1];
+    return { x: p1.x + (p2.x - p1.x) * subT, y: p1.y + (p2.y - p1.y) * subT };
+}
+
+// --- Scanner ---
+let scanner;
+function startScanner() {
+    document.getElementById('btn-scan').classList.add('hidden');
+    scanner = new Html5Qrcode("reader");
+    scanner.start({ facingMode: "environment" }, { fps: 10, qrbox: 250 },
+        (decodedText) => { stopScanner(); processPin(decodedText); },
+        (err) => { }
+    );
+}
+function stopScanner() {
+    if (scanner) scanner.stop().then(() => {
+        document.getElementById('reader').innerHTML = '';
+        document.getElementById('btn-scan').classList.remove('hidden');
+    });
+}
+
+async function processPin(text) {
+    let slotId = text;
+    if (text.includes('/scan/')) slotId = text.split('/scan/')[1];
+    else if (text.includes('/qr/')) slotId = text.split('/qr/')[1];
+    slotId = slotId.split('?')[0].split('/')[0].trim();
+
+    if (!CURRENT_PLATE) return alert("Session Error. Please Relogin.");
+
+    try {
+        const res = await fetch(LOT_PREFIX + '/process_verification', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ slot_id: slotId, actual_reg_num: CURRENT_PLATE, action: 'verify' })
+        });
+
+        if (res.ok) {
+            document.getElementById('pin-success').classList.remove('hidden');
+            document.getElementById('pin-slot').innerText = slotId;
+
+            // UNLOCK LOCATE TAB ON SUCCESS
+            document.getElementById('nav-locate').classList.remove('hidden');
+            alert("Location Verified! 'Find My Car' is now available.");
+
+        } else {
+            alert("Verification Failed");
+        }
+    } catch (e) { alert("Error"); }
+}
+
+// --- Locate ---
+async function locateVehicle() {
+    if (!CURRENT_PLATE) return;
+
+    const res = await fetch(`${LOT_PREFIX}/api/find_vehicle/${CURRENT_PLATE}`);
+    const data = await res.json();
+
+    document.getElementById('locate-result').classList.remove('hidden');
+    document.getElementById('loc-success').classList.add('hidden');
+    document.getElementById('loc-pending').classList.add('hidden');
+    document.getElementById('locate-plate-disp').innerText = CURRENT_PLATE;
+
+    if (data.found) {
+        if (data.is_verified) {
+            document.getElementById('loc-success').classList.remove('hidden');
+            document.getElementById('loc-slot').innerText = data.slot_id;
+            document.getElementById('loc-time').innerText = data.entry_time.split("T")[1].substring(0, 5);
+        } else {
+            document.getElementById('loc-pending').classList.remove('hidden');
+        }
+    }
+}
+
+function showWalkingSimulation() {
+    console.log("Starting Simulation...");
+    // alert("Starting Simulation..."); // Toggle this if console is hard to see 
+
+    // Simple overlay simulation
+    const overlay = document.createElement('div');
+    overlay.className = "fixed inset-0 bg-black/90 z-[60] flex flex-col items-center justify-center p-6 text-center";
+    overlay.innerHTML = `
+        <div class="mb-6 animate-pulse">
+            <i class="fa-solid fa-person-walking text-6xl text-green-500"></i>
+        </div>
+        <h2 class="text-2xl font-bold mb-4">Navigating to Vehicle...</h2>
+        <div class="w-full h-1 bg-neutral-800 rounded-full mb-2 overflow-hidden">
+            <div class="h-full bg-green-500 animate-[width_3s_ease-out_forwards]" style="width: 0%"></div>
+        </div>
+        <p class="text-sm opacity-50 font-mono">Calculating Path...</p>
+        <button onclick="this.parentElement.remove()" class="mt-8 px-6 py-2 border border-white/20 rounded-full text-xs">Cancel</button>
+    `;
+    document.body.appendChild(overlay);
+
+    // Auto close/success
+    setTimeout(() => {
+        overlay.innerHTML = `
+            <div class="mb-6">
+                <i class="fa-solid fa-flag-checkered text-6xl text-white"></i>
+            </div>
+            <h2 class="text-2xl font-bold mb-2">You have arrived!</h2>
+            <p class="text-sm opacity-50">Vehicle is directly ahead.</p>
+            <button onclick="this.parentElement.remove()" class="mt-8 px-8 py-3 bg-white text-black rounded-full font-bold">Done</button>
+        `;
+    }, 3000);
+}
+
+// Add Animation Keyframes safely
+const style = document.createElement('style');
+style.innerHTML = `
+    @keyframes width { to { width: 100%; } }
+`;
+document.head.appendChild(style);
@@ -0,0 +1,118 @@
+let currentStatus = localStorage.getItem('filterStatus') || 'all';
+let currentSize = localStorage.getItem('filterSize') || 'all';
+
+function applyFilters() {
+    document.querySelectorAll('[id^="pill-status-"]').forEach(btn => btn.classList.remove('active'));
+    document.getElementById(`pill-status-${currentStatus}`)?.classList.add('active');
+
+    document.querySelectorAll('[id^="pill-size-"]').forEach(btn => btn.classList.remove('active'));
+    document.getElementById(`pill-size-${currentSize}`)?.classList.add('active');
+
+    const items = document.querySelectorAll('.slot-item');
+    items.forEach(item => {
+        const statusMatch = (currentStatus === 'all') || (currentStatus === item.dataset.status);
+        const sizeMatch = (currentSize === 'all') || (currentSize === item.dataset.size);
+        item.style.display = (statusMatch && sizeMatch) ? 'block' : 'none';
+    });
+}
+
+function filterSlots(type, value) {
+    if (type === 'status') {
+        currentStatus = value;
+        localStorage.setItem('filterStatus', value);
+    } else {
+        currentSize = value;
+        localStorage.setItem('filterSize', value);
+    }
+    applyFilters();
+}
+
+async function forceCheckout(event, regNum) {
+    event.stopPropagation(); // Prevent card click
+    if (!confirm(`Force checkout for vehicle ${regNum}?`)) return;
+
+    try {
+        const res = await fetch(LOT_PREFIX + '/exit', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ reg_num: regNum })
+        });
+        const data = await res.json();
+        if (res.ok) {
+            alert(`Success: ${data.message} (Duration: ${data.duration_seconds}s)`);
+            refreshSlots();
+        } else {
+            alert("Error: " + data.error);
+        }
+    } catch (e) { alert("Network Error"); }
+}
+
+// --- DATA-ONLY REFRESH ---
+// The page is rendered once; afterwards only /api/slots is polled (ETag, so an
+// unchanged lot costs a 304) and the grid is rebuilt when the data changed.
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+function capitalize(text) {
+    return text ? text.charAt(0).toUpperCase() + text.slice(1).toLowerCase() : '';
+}
+
+// Mirrors the card markup in status.html
+function slotCard(slot) {
+    let statusClass = 'slot-free', icon = '✨', displayStatus = 'free', footerText = 'Available';
+    if (slot.status === 'occupied') {
+        displayStatus = 'occupied';
+        if (slot.is_verified === 1) {
+            statusClass = 'slot-verified'; icon = '✅'; footerText = 'Verified';
+        } else {
+            statusClass = 'slot-pending'; icon = '⚠️'; footerText = 'Check Pending';
+        }
+    }
+
+    const plate = slot.reg_num || slot.temp_reg_num;
+    let body;
+    if (plate) {
+        body = `<div class="reg-num${slot.reg_num ? '' : ' text-warning'}">${escapeHtml(plate)}</div>
+                <button class="btn btn-sm btn-danger mt-2 py-0 px-2 border-0"
+                    style="font-size: 0.7rem; background: rgba(239, 68, 68, 0.2); color: #fca5a5;"
+                    data-reg="${escapeHtml(plate)}" onclick="forceCheckout(event, this.dataset.reg)">
+                    Force Exit
+                </button>`;
+    } else {
+        body = `<div class="small text-muted opacity-50">${escapeHtml(capitalize(slot.size_type))}</div>`;
+    }
+
+    const size = escapeHtml(slot.size_type || '');
+    return `<div class="col-6 col-md-4 col-lg-2 slot-item" data-status="${displayStatus}" data-size="${size}">
+            <div class="slot-card ${statusClass} slot-${size}">
+                <div class="slot-content">
+                    <div class="icon">${icon}</div>
+                    <div class="slot-id">${escapeHtml(slot.slot_id)}</div>
+                    ${body}
+                </div>
+                <div class="status-footer">${footerText}</div>
+            </div>
+        </div>`;
+}
+
+let lastSlotsBody = null;
+
+async function refreshSlots() {
+    try {
+        const res = await fetch(LOT_PREFIX + '/api/slots');
+        if (!res.ok) return;
+        const body = await res.text();
+        if (body === lastSlotsBody) return;
+        lastSlotsBody = body;
+        document.getElementById('slots-container').innerHTML = JSON.parse(body).map(slotCard).join('');
+        applyFilters();
+    } catch (e) { /* keep the last grid until the next poll */ }
+}
+
+document.addEventListener('DOMContentLoaded', applyFilters);
+// Refresh every 3 seconds to show updates faster
+setInterval(refreshSlots, 3000);
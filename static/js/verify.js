@@ -0,0 +1,129 @@
+function attemptClose() {
+    // Attempt to close the window using multiple methods
+    setTimeout(() => {
+        // Method 1: Standard Close
+        window.close();
+
+        // Method 2: Hack for some browsers
+        window.open('', '_self', '');
+        window.close();
+
+        // Method 3: Fallback - Redirect to a blank page so they are "out" of the system
+        // This guarantees they don't stay on our site if close fails.
+        setTimeout(() => {
+            window.location.href = "about:blank";
+        }, 500);
+    }, 2000);
+}
+
+const slotId = document.getElementById('slotId').value;
+const form = document.getElementById('verifyForm');
+let currentReg = '';
+let pollingInterval = null;
+
+form.addEventListener('submit', async (e) => {
+    e.preventDefault();
+    const btn = form.querySelector('button');
+    const originalText = btn.innerHTML;
+    btn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Checking...';
+    btn.disabled = true;
+
+    currentReg = document.getElementById('reg_num').value.toUpperCase();
+
+    const formData = new FormData();
+    formData.append('reg_num', currentReg);
+    formData.append('slot_id', slotId);
+
+    try {
+        const res = await fetch(LOT_PREFIX + '/process_verification', { method: 'POST', body: formData });
+        const data = await res.json();
+
+        if (data.status === 'verified') {
+            showCard('successCard');
+            attemptClose(); // Auto-Close on Success
+        } else if (data.status === 'misuse') {
+            document.getElementById('misuseReg').innerText = currentReg;
+            document.getElementById('assignedSlot').innerText = data.assigned_slot;
+            showCard('misuseCard');
+            startPollingForAdminDecision(); // START POLLING
+        } else {
+            alert(data.message || 'Verification Failed');
+            btn.innerHTML = originalText;
+            btn.disabled = false;
+        }
+    } catch (err) {
+        alert("Server Error");
+        btn.innerHTML = originalText;
+        btn.disabled = false;
+    }
+});
+
+function startPollingForAdminDecision() {
+    // Clear any existing polling
+    if (pollingInterval) {
+        clearInterval(pollingInterval);
+    }
+
+    console.log('[Mobile] Started polling for admin decision...');
+
+    pollingInterval = setInterval(async () => {
+        // Stop polling if misuse card is hidden (already resolved)
+        if (document.getElementById('misuseCard').style.display === 'none') {
+            clearInterval(pollingInterval);
+            pollingInterval = null;
+            return;
+        }
+
+        try {
+            const res = await fetch(`${LOT_PREFIX}/api/slot_status/${slotId}`);
+            const data = await res.json();
+
+            console.log('[Mobile] Poll response:', data);
+
+            // Case 1: Admin Authorized (Status -> occupied, Reg -> Matches current user)
+            if (data.status === 'occupied' && data.reg_num === currentReg) {
+                clearInterval(pollingInterval);
+                pollingInterval = null;
+                showCard('successCard');
+                document.querySelector('#successCard h3').innerText = "Authorized!";
+                document.querySelector('#successCard p').innerText = "Admin approved this location.";
+                attemptClose();
+            }
+
+            // Case 2: Slot is now free (Admin clicked "Resolved/Free")
+            else if (data.status === 'free') {
+                clearInterval(pollingInterval);
+                pollingInterval = null;
+                showCard('resolvedCard');
+                attemptClose();
+            }
+
+            // Case 3: Admin Rejected (Status -> rejected)
+            else if (data.status === 'rejected') {
+                clearInterval(pollingInterval);
+                pollingInterval = null;
+                showCard('rejectedCard');
+                attemptClose();
+            }
+
+            // Case 4: Status changed to something other than misuse/occupied/free/rejected
+            else if (data.status !== 'misuse') {
+                clearInterval(pollingInterval);
+                pollingInterval = null;
+                // Generic update message
+                showCard('resolvedCard');
+                document.querySelector('#resolvedCard h3').innerText = "Status Updated";
+                document.querySelector('#resolvedCard p').innerText = "Admin has updated the parking status.";
+                attemptClose();
+            }
+
+        } catch (e) {
+            console.error("[Mobile] Poll error", e);
+        }
+    }, 1500); // Poll every 1.5 seconds
+}
+
+function showCard(id) {
+    document.querySelectorAll('.verify-card').forEach(c => c.style.display = 'none');
+    document.getElementById(id).style.display = 'block';
+}
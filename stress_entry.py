@@ -0,0 +1,131 @@
+"""
+Concurrency stress test for /entry.
+
+Hammers the gate endpoint from many threads against a throwaway copy of the
+database and checks that no slot is ever handed to two vehicles.
+
+Usage:
+    python stress_entry.py [--threads 16] [--vehicles 2000] [--slots 500]
+"""
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
+import argparse
+from collections import Counter
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def _stress(threads, vehicles, extra_slots):
+    import parking_proto_sensor as server
+    from agent import ParkingAgent
+    from event_log import event_log
+
+    server.init_db()
+    with sqlite3.connect("parking.db") as conn:
+        conn.executemany("INSERT INTO slots (slot_id, size_type) VALUES (?, 'medium')",
+                         [(f"Stress{i}",) for i in range(extra_slots)])
+    server.parking_agent = ParkingAgent(load_ocr=False)
+    # One test client stands in for every gate; measure the handler, not the limiter
+    server.rate_limiter.configure({})
+    client = server.app.test_client()
+
+    with sqlite3.connect("parking.db") as conn:
+        capacity = conn.execute("SELECT COUNT(*) FROM slots WHERE size_type IN ('medium', 'large')").fetchone()[0]
+
+    plates = [f"ST{i:08d}" for i in range(vehicles)]
+    granted = []
+    denied = Counter()
+    latencies = []
+    lock = threading.Lock()
+    next_plate = iter(plates)
+
+    def worker():
+        while True:
+            with lock:
+                plate = next(next_plate, None)
+            if plate is None:
+                return
+            t0 = time.perf_counter()
+            res = client.post('/entry', json={'reg_num': plate})
+            elapsed = time.perf_counter() - t0
+            with lock:
+                latencies.append(elapsed)
+                if res.status_code == 200:
+                    granted.append((plate, res.get_json()['assigned_slot']))
+                else:
+                    denied[res.get_json().get('error', res.status_code)] += 1
+
+    print(f"[Stress] {vehicles} vehicles, {threads} threads, {capacity} eligible slots")
+    t_start = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    wall = time.perf_counter() - t_start
+    event_log.flush()
+
+    # --- Verification ---
+    slot_counts = Counter(slot for _, slot in granted)
+    double_booked = {s: n for s, n in slot_counts.items() if n > 1}
+    with sqlite3.connect("parking.db") as conn:
+        db_reserved = dict(conn.execute("SELECT reg_num, slot_id FROM slots WHERE status = 'reserved'").fetchall())
+        plates_in_many = conn.execute(
+            "SELECT reg_num FROM slots WHERE reg_num IS NOT NULL GROUP BY reg_num HAVING COUNT(*) > 1").fetchall()
+    mismatched = [(p, s) for p, s in granted if db_reserved.get(p) != s]
+
+    print(f"[Stress] Granted {len(granted)}, denied {sum(denied.values())} {dict(denied)}")
+    print(f"[Stress] Throughput {vehicles / wall:.0f} req/s over {wall:.2f}s")
+    print(f"[Stress] Latency p50 {_percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p99 {_percentile(latencies, 99) * 1000:.1f} ms")
+
+    ok = True
+    if double_booked:
+        print(f"[Stress] FAIL: slots granted more than once: {double_booked}")
+        ok = False
+    if plates_in_many:
+        print(f"[Stress] FAIL: vehicles holding several slots: {plates_in_many}")
+        ok = False
+    if mismatched:
+        print(f"[Stress] FAIL: {len(mismatched)} grants not reflected in DB, e.g. {mismatched[:3]}")
+        ok = False
+    if len(granted) != min(vehicles, capacity):
+        print(f"[Stress] FAIL: expected {min(vehicles, capacity)} grants, got {len(granted)}")
+        ok = False
+    print("[Stress] PASS: no double allocation" if ok else "[Stress] FAILED")
+    return ok
+
+
+def run(threads, vehicles, extra_slots):
+    # Everything uses the relative "parking.db", so run inside a scratch directory
+    work_dir = tempfile.mkdtemp(prefix="parking_stress_")
+    os.chdir(work_dir)
+    sys.path.insert(0, BASE_DIR)
+    os.environ["RENDER"] = "true"  # skip camera/OCR agent init at import
+
+    try:
+        return _stress(threads, vehicles, extra_slots)
+    finally:
+        os.chdir(BASE_DIR)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--vehicles", type=int, default=2000)
+    parser.add_argument("--slots", type=int, default=500, help="extra medium slots added on top of the default 30")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.threads, args.vehicles, args.slots) else 1)
@@ -0,0 +1,235 @@
+import time
+import threading
+from collections import OrderedDict, deque
+
+# Per-route token buckets: `rate` tokens/second refill up to `burst`.
+# Keys are Flask endpoint names (lot-scoped aliases share their route's limit).
+DEFAULT_LIMITS = {
+    "anpr": {"rate": 2, "burst": 5},
+    "entry": {"rate": 10, "burst": 20},
+    # One batch holds the write lock for up to BATCH_MAX_EVENTS events
+    "entry_batch": {"rate": 0.2, "burst": 3},
+    "exit_batch": {"rate": 0.2, "burst": 3},
+    "reset_parking": {"rate": 0.1, "burst": 1},
+}
+# Beyond this many clients, idle buckets are dropped, then the least recently used
+MAX_TRACKED_CLIENTS = 10000
+
+
+def normalize_limits(limits):
+    """
+    Checks a limits table, filling a missing rate or burst from the route's
+    default (burst otherwise defaults to max(1, rate)). A null entry leaves
+    the route unlimited. Raises ValueError.
+    """
+    if not isinstance(limits, dict):
+        raise ValueError("rate limits must be an object of route -> {rate, burst}")
+    normalized = {}
+    for route, limit in limits.items():
+        if limit is None:
+            continue
+        if not isinstance(limit, dict):
+            raise ValueError(f"rate limit for '{route}' must be an object")
+        merged = {**DEFAULT_LIMITS.get(route, {}), **limit}
+        rate = merged.get("rate")
+        burst = merged.get("burst", max(1, rate) if isinstance(rate, (int, float)) else None)
+        for name, value in (("rate", rate), ("burst", burst)):
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise ValueError(f"rate limit '{route}' needs a non-negative number for {name}")
+        if burst < 1:
+            raise ValueError(f"rate limit '{route}' needs a burst of at least 1")
+        normalized[route] = {"rate": rate, "burst": burst}
+    return normalized
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now):
+        """Returns 0 if a token was taken, else seconds until one is available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class RateLimiter:
+    """Token bucket per (route, client)."""
+
+    def __init__(self, limits=None, max_clients=MAX_TRACKED_CLIENTS):
+        self.limits = normalize_limits(DEFAULT_LIMITS if limits is None else limits)
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # least recently used first
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.allowed = {}
+        self.rejected = {}
+
+    def configure(self, limits):
+        """Replaces the limits table; routes missing from it are unlimited. Raises ValueError."""
+        limits = normalize_limits(limits)
+        with self._lock:
+            self.limits = limits
+            self._buckets.clear()
+
+    def _evict(self, now):
+        # Buckets that would have refilled completely carry no state worth keeping
+        idle = [key for key, b in self._buckets.items()
+                if b.tokens + (now - b.updated) * b.rate >= b.capacity]
+        for key in idle:
+            del self._buckets[key]
+        # None idle (many clients, or keys churned on purpose): the table still stays bounded
+        while len(self._buckets) >= self.max_clients:
+            self._buckets.popitem(last=False)
+            self.evicted += 1
+
+    def check(self, route, client):
+        """
+        Returns:
+            0 if the request may proceed, else seconds the client should wait.
+        """
+        limit = self.limits.get(route)
+        if not limit:
+            return 0.0
+        now = time.monotonic()
+        key = (route, client)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_clients:
+                    self._evict(now)
+                bucket = self._buckets[key] = TokenBucket(limit["rate"], limit["burst"], now)
+            else:
+                self._buckets.move_to_end(key)
+            wait = bucket.take(now)
+            counter = self.rejected if wait else self.allowed
+            counter[route] = counter.get(route, 0) + 1
+        return wait
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                route: {
+                    "rate": limit["rate"],
+                    "burst": limit["burst"],
+                    "allowed": self.allowed.get(route, 0),
+                    "rejected": self.rejected.get(route, 0),
+                }
+                for route, limit in self.limits.items()
+            }
+            stats["tracked_clients"] = len(self._buckets)
+            stats["evicted_clients"] = self.evicted
+        return stats
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key onto one execution; callers
+    that arrive while it runs wait for and share its result.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Returns (result, shared) where shared is True for coalesced callers."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+class LockWaits:
+    """
+    Time writers spend waiting for a lock (SQLite's write lock, taken by
+    BEGIN IMMEDIATE): counts, max, and percentiles over the recent waits.
+    """
+
+    def __init__(self, recent=4096):
+        self._recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def begin(self, cursor, statement="BEGIN IMMEDIATE"):
+        """Runs `statement` on cursor, recording how long it blocked."""
+        t0 = time.perf_counter()
+        try:
+            cursor.execute(statement)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        wait = time.perf_counter() - t0
+        with self._lock:
+            self.acquired += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._recent.append(wait)
+
+    def stats(self):
+        with self._lock:
+            recent = sorted(self._recent)
+            acquired, failed, total, longest = self.acquired, self.failed, self.total_wait, self.max_wait
+
+        def pct(p):
+            return round(recent[min(len(recent) - 1, int(len(recent) * p / 100))] * 1000, 3) if recent else 0.0
+        return {
+            "acquired": acquired,
+            "failed": failed,
+            "mean_wait_ms": round(total / acquired * 1000, 3) if acquired else 0.0,
+            "p50_wait_ms": pct(50),
+            "p99_wait_ms": pct(99),
+            "max_wait_ms": round(longest * 1000, 3),
+        }
+
+
+# Waits for the lot databases' write lock at the gate (agent, batch)
+write_lock_waits = LockWaits()